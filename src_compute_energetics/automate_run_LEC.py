@@ -12,199 +12,714 @@
 
 import sys
 import os
-import glob
 import subprocess
 import time
+import ast
+import gc
+import importlib
+import runpy
+import signal
+import socket
+import traceback
+import multiprocessing
 import logging
-import random
+import argparse
+import hashlib
+import threading
 import pandas as pd
 import numpy as np
-from concurrent.futures import ProcessPoolExecutor
-from datetime import datetime
+import psutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from job_database import (JOB_DATABASE, RETRY_DELAY, LEASE_DURATION, connect_job_database, register_jobs, mark_completed,
+                          reclaim_expired_leases, lease_owners, claim_jobs, renew_leases, next_retry_time,
+                          count_remaining_jobs, finish_job, job_report, set_job_features, job_estimates, skipped_jobs,
+                          recent_completions)
+from run_metrics import METRICS_FILE, ETA_WINDOW, MetricsWriter, RollingRate, read_metrics, outcome_summary, phase_summary
+from job_costs import DEFAULT_JOB_MEMORY, track_features, update_job_estimates
+from era5_download import MAX_REQUESTS_PER_KEY, MIN_REQUEST_INTERVAL, CredentialPool, read_cdsapi_credentials
+from era5_cache import ERA5_CACHE_DIR, ERA5_CACHE_SIZE, ERA5Cache, DownloadStage
+from run_planner import plan_region, plan_report
 
-# Update logging configuration to use the custom handler
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
-                    handlers=[logging.FileHandler('log.automate_run_LEC.txt', mode='w')])
-
-overall_start_time = time.time()
-
-REGION = sys.argv[1] # Region to process
 FILTERED_TRACKS = '../tracks_SAt_filtered/tracks_SAt_filtered.csv' # Path to filtered tracks
 LEC_PATH = os.path.abspath('../../lorenz-cycle/lorenz_cycle.py')  # Get absolute path
 LEC_RESULTS_DIR = os.path.abspath('../../LEC_Results')  # Get absolute PATH
-CDSAPIRC_PATH = os.path.expanduser('~/.cdsapirc')
+MAX_ATTEMPTS = 3
+ERROR_TAIL_CHARS = 2000  # Characters of the LEC standard error kept in the job table
+REESTIMATE_EVERY = 10  # Completed jobs between two refits of the run time and memory estimates
+MEMORY_SAMPLE_INTERVAL = 0.5  # Seconds between two samples of the memory of a LEC run
+MEMORY_FRACTION = 0.9  # Fraction of the memory available at start given to the LEC runs by default
+LEC_MODES = ('warm', 'subprocess')  # See run_lorenz_cycle
 
-def count_evaluated_systems():
+warm_lec_ready = False  # Set in each LEC worker by init_lec_worker
+
+def file_hash(filepath):
+    """
+    Returns the SHA-256 hex digest of a file's content.
     """
-    Counts the number of systems that have been evaluated based on the presence of results files.
+    with open(filepath, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+    
+def prepare_track_inputs(tracks_region, inputs_dir):
+    """
+    Writes the LEC input file of every system of the region in a single pass: the tracks are sorted
+    and formatted once, and each system's file is a slice of the formatted lines.
+    Files whose content is already current are left untouched.
+
+    Args:
+    tracks_region (DataFrame): Tracks of the region.
+    inputs_dir (str): Directory of the LEC input files.
 
     Returns:
-    int: The number of evaluated systems.
+    dict: Path of the input file of each system ID.
     """
-    evaluated_count = 0
-    for dirname in os.listdir(LEC_RESULTS_DIR):
-        if dirname.endswith('_ERA5_track') and os.path.exists(os.path.join(LEC_RESULTS_DIR, dirname, f"{dirname}_results.csv")):
-            evaluated_count += 1
-    return evaluated_count
+    os.makedirs(inputs_dir, exist_ok=True)
+    tracks_region = tracks_region.sort_values('track_id', kind='stable')
+    formatted_data = tracks_region[['date', 'lat vor', 'lon vor', 'vor42']].copy()
+    formatted_data.columns = ['time', 'Lat', 'Lon', 'min_max_zeta_850']
+    formatted_data['min_max_zeta_850'] = - np.abs(formatted_data['min_max_zeta_850'])
+    header, *lines = formatted_data.to_csv(index=False, sep=';').splitlines(keepends=True)
+
+    system_ids, first_rows = np.unique(tracks_region['track_id'].to_numpy(), return_index=True)
+    last_rows = np.r_[first_rows[1:], len(lines)]
+    input_paths = {}
+    written_count = 0
+    for system_id, first_row, last_row in zip(system_ids, first_rows, last_rows):
+        input_file_path = os.path.join(inputs_dir, f'track_{system_id}.csv')
+        content = (header + ''.join(lines[first_row:last_row])).encode()
+        if not os.path.exists(input_file_path) or file_hash(input_file_path) != hashlib.sha256(content).hexdigest():
+            # Other launchers may read or write the same file: it is replaced atomically
+            with open(f'{input_file_path}.{os.getpid()}.part', 'wb') as f:
+                f.write(content)
+            os.replace(f'{input_file_path}.{os.getpid()}.part', input_file_path)
+            written_count += 1
+        input_paths[int(system_id)] = input_file_path
+    logging.info(f"Wrote {written_count} track input files to {inputs_dir}, {len(input_paths) - written_count} already current")
+    return input_paths
 
-def get_cdsapi_keys():
+def check_results_exist(system_id):
     """
-    Lists all files in the home directory that match the pattern 'cdsapirc-*'.
+    Check if results for the given system ID already exist.
+
+    Args:
+    system_id (int): The system ID to check.
 
     Returns:
-    list: A list of filenames matching the pattern.
+    bool: True if results exist, False otherwise.
     """
-    home_dir = os.path.expanduser('~')
-    pattern = os.path.join(home_dir, '.cdsapirc-*')
-    files = glob.glob(pattern)
-    logging.info(f"CDSAPIRC files available at '{home_dir}': {files}")
-    # Extract file suffixes from the full paths
-    suffixes = [os.path.basename(file) for file in files]
-    return suffixes
+    results_file_path = os.path.join(LEC_RESULTS_DIR, f"{system_id}_ERA5_track", f"{system_id}_ERA5_track_results.csv")
+    return os.path.exists(results_file_path)
 
-def copy_cdsapirc(suffix):
+def launcher_id():
     """
-    Copies a specific .cdsapirc file to the default .cdsapirc location.
-    Args:
-    suffix (str): The suffix of the .cdsapi file to be copied.
+    Returns the identifier of this launcher in the job leases: host name, process ID and process start time.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{psutil.Process().create_time():.0f}"
+
+def dead_local_owners(owners):
+    """
+    Returns the launchers, among owners, that ran on this host and are no longer running.
     """
+    dead = []
+    for owner in owners:
+        host, pid, create_time = owner.rsplit(':', 2)
+        if host != socket.gethostname():
+            continue
+        try:
+            if f"{psutil.Process(int(pid)).create_time():.0f}" == create_time:
+                continue
+        except psutil.Error:
+            pass
+        dead.append(owner)
+    return dead
+
+class LeaseKeeper:
+    """
+    Renews the leases of the jobs of a launcher in a background thread, with its own database connection,
+    so that other launchers do not reclaim them while this one is alive. The leases of the tiles it pinned
+    or is downloading in the shared ERA5 cache are renewed too.
+    """
+
+    def __init__(self, database_path, owner, lease_duration=LEASE_DURATION, journal_mode='WAL', cache=None):
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.renew, args=(database_path, owner, lease_duration, journal_mode, cache),
+                                       daemon=True)
+        self.thread.start()
+
+    def renew(self, database_path, owner, lease_duration, journal_mode, cache):
+        conn = connect_job_database(database_path, journal_mode)
+        while not self.stopped.wait(lease_duration / 3):
+            try:
+                renew_leases(conn, owner, lease_duration)
+            except Exception as e:
+                logging.error(f"Could not renew the job leases: {e}")
+            try:
+                if cache is not None:
+                    cache.renew_leases()
+            except Exception as e:
+                logging.error(f"Could not renew the ERA5 cache leases: {e}")
+        conn.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+class PeakMemoryMonitor:
+    """
+    Samples the resident memory of a process and of its children in a background thread, and keeps the peak.
+    """
+
+    def __init__(self, pid, interval=MEMORY_SAMPLE_INTERVAL):
+        self.peak_rss = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, args=(pid, interval), daemon=True)
+        self.thread.start()
+
+    def sample(self, pid, interval):
+        try:
+            process = psutil.Process(pid)
+            while not self.stopped.is_set():
+                rss = process.memory_info().rss
+                for child in process.children(recursive=True):
+                    try:
+                        rss += child.memory_info().rss
+                    except psutil.Error:
+                        pass
+                self.peak_rss = max(self.peak_rss, rss)
+                self.stopped.wait(interval)
+        except psutil.Error:
+            pass
+
+    def stop(self):
+        """
+        Stops sampling and returns the peak resident memory, in bytes, or None if it could not be sampled.
+        """
+        self.stopped.set()
+        self.thread.join()
+        return self.peak_rss or None
+
+class LECTimeout(Exception):
+    """
+    Raised in a warm LEC worker when a run exceeds its time limit.
+    """
+
+def lec_imports(lec_path):
+    """
+    Returns the names of the modules imported at the top level of the LEC script.
+    """
+    with open(lec_path) as f:
+        tree = ast.parse(f.read(), filename=lec_path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.append(node.module)
+    return modules
+
+def init_lec_worker(lec_mode, lec_path=None, lec_results_dir=None, log_file=None):
+    """
+    Initializer of the LEC worker processes. In warm mode, imports the modules of the LEC script
+    (xarray, dask, metpy and LEC's own modules) once, so that each run only executes the script itself.
+    If they cannot be imported, the worker falls back to running LEC in a subprocess.
+
+    The workers are spawned from the LEC directory, where the relative paths of this module no longer
+    resolve, and without the launcher's logging configuration, so the launcher passes its LEC path,
+    results directory and log file.
+    """
+    global warm_lec_ready, LEC_PATH, LEC_RESULTS_DIR
+    LEC_PATH = lec_path or LEC_PATH
+    LEC_RESULTS_DIR = lec_results_dir or LEC_RESULTS_DIR
+    if log_file is not None:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                            handlers=[logging.FileHandler(log_file)])
+    warm_lec_ready = False
+    if lec_mode != 'warm':
+        return
+    lec_dir = os.path.dirname(LEC_PATH)
+    if lec_dir not in sys.path:
+        sys.path.insert(0, lec_dir)
     try:
-        source_path = os.path.expanduser(f'~/{suffix}')
-        subprocess.run(['cp', source_path, CDSAPIRC_PATH], check=True)
-        logging.info(f"Copied {source_path} to {CDSAPIRC_PATH}")
+        for module in lec_imports(LEC_PATH):
+            importlib.import_module(module)
+        warm_lec_ready = True
     except Exception as e:
-        logging.error(f"Error copying {source_path} to {CDSAPIRC_PATH}: {e}")
+        logging.warning(f"Could not import the LEC modules in worker {os.getpid()}, running LEC in subprocesses: {e}")
 
+def run_lec_in_process(arguments, timeout=None):
+    """
+    Runs the LEC script in the current process, as if it was started with the given arguments.
+
+    Args:
+    arguments (list): Command line arguments of the LEC script.
+    timeout (float): Maximum run time, in seconds, or None for no limit.
 
-def prepare_track_data(system_id):
+    Returns:
+    tuple: (exit code, error message or None). The exit code is None if the run timed out.
+    """
+    def on_timeout(signum, frame):
+        raise LECTimeout(f"Timed out after {timeout:.0f} seconds")
+
+    previous_handler = signal.signal(signal.SIGALRM, on_timeout)
+    previous_argv = sys.argv
+    sys.argv = [LEC_PATH] + arguments
+    if timeout:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        runpy.run_path(LEC_PATH, run_name='__main__')
+        return 0, None
+    except SystemExit as e:
+        if e.code is None or e.code == 0:
+            return 0, None
+        return (e.code if isinstance(e.code, int) else 1), f"Exited with code {e.code}"
+    except LECTimeout as e:
+        return None, str(e)
+    except Exception:
+        return 1, traceback.format_exc()[-ERROR_TAIL_CHARS:]
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+        sys.argv = previous_argv
+        # Release what the run left behind before the next system
+        pyplot = sys.modules.get('matplotlib.pyplot')
+        if pyplot is not None:
+            pyplot.close('all')
+        gc.collect()
+
+def run_lec_subprocess(arguments, timeout=None):
     """
-    Prepare and save track data for a given system ID in the required format.
-    Each system ID will have its own input file.
+    Runs the LEC script in a new Python process.
 
     Args:
-    system_id (int): The ID of the system for which to prepare the track data.
+    arguments (list): Command line arguments of the LEC script.
+    timeout (float): Maximum run time, in seconds, or None for no limit.
+
+    Returns:
+    tuple: (exit code, error message or None, peak RSS in bytes). The exit code is None if the run timed out.
     """
+    process = subprocess.Popen(['python', LEC_PATH] + arguments, stderr=subprocess.PIPE, text=True)
+    memory_monitor = PeakMemoryMonitor(process.pid)
     try:
-        track_data = tracks_region[tracks_region['track_id'] == system_id]
-        # Explicitly create a copy of the DataFrame to avoid SettingWithCopyWarning
-        formatted_data = track_data[['date', 'lat vor', 'lon vor', 'vor42']].copy()
-        formatted_data.columns = ['time', 'Lat', 'Lon', 'min_max_zeta_850']
-        formatted_data['min_max_zeta_850'] = - np.abs(formatted_data['min_max_zeta_850'])
-        # Create a unique input file for each system ID
-        input_file_path = f'inputs/track_{system_id}.csv'
-        formatted_data.to_csv(input_file_path, index=False, sep=';')
-        return input_file_path
-    except Exception as e:
-        logging.error(f"Error preparing track data for ID {system_id}: {e}")
-        return None
-    
-def check_results_exist(system_id):
+        _, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        return None, f"Timed out after {timeout:.0f} seconds", memory_monitor.stop()
+    peak_rss = memory_monitor.stop()
+    if process.returncode != 0:
+        return process.returncode, stderr[-ERROR_TAIL_CHARS:] or f"Exited with code {process.returncode}", peak_rss
+    return 0, None, peak_rss
+
+def run_lorenz_cycle(id, input_track_path, lec_mode='subprocess', timeout=None):
     """
-    Check if results for the given system ID already exist.
+    Runs the Lorenz Energy Cycle program for one system, on the ERA5 data downloaded by the download stage.
+
+    In 'warm' mode, LEC runs inside the worker process, whose LEC modules were imported once by
+    init_lec_worker, which saves the interpreter startup and imports of every system. In 'subprocess'
+    mode, or if the worker could not import LEC, each run starts a new Python process.
 
     Args:
-    system_id (int): The system ID to check.
+    id (int): The system ID.
+    input_track_path (str): Path to the system's track input file, see prepare_track_inputs.
+    lec_mode (str): 'warm' or 'subprocess'.
+    timeout (float): Maximum run time, in seconds, or None for no limit.
 
     Returns:
-    bool: True if results exist, False otherwise.
+    tuple: (system ID, exit code, error message or None, start time, end time, peak RSS in bytes). The exit
+           code is None if LEC could not be started or timed out, and the peak RSS if it could not be sampled.
+           In warm mode, the peak RSS is the one of the worker process during the run.
     """
-    results_file_path = os.path.join(LEC_RESULTS_DIR, f"{system_id}_ERA5_track", f"{system_id}_ERA5_track_results.csv")
-    return os.path.exists(results_file_path)
+    started_at = time.time()
 
-def run_lorenz_cycle(id):
-    global subprocess_counter
-    subprocess_counter += 1
+    if not input_track_path or not os.path.exists(input_track_path):
+        logging.error(f"Error running Lorenz Cycle script for ID {id}: Track input file not found")
+        return id, None, "Track input file not found", started_at, time.time(), None
 
-    if check_results_exist(id):
-        logging.info(f"Results already exist for system ID {id}, skipping.")
-        return id
+    arguments = [f'{id}_ERA5.nc', '-t', '-r', '-g', '-v', '-p', '-z', '--trackfile', input_track_path]
+    try:
+        if lec_mode == 'warm' and warm_lec_ready:
+            memory_monitor = PeakMemoryMonitor(os.getpid())
+            exit_code, error = run_lec_in_process(arguments, timeout)
+            peak_rss = memory_monitor.stop()
+        else:
+            exit_code, error, peak_rss = run_lec_subprocess(arguments, timeout)
+    except Exception as e:
+        logging.error(f"Error running Lorenz Cycle script for ID {id}: {e}")
+        return id, None, str(e), started_at, time.time(), None
 
-    # Pick a random .cdsapirc file for each process
-    if CDSAPIRC_SUFFIXES:
-        chosen_suffix = random.choice(CDSAPIRC_SUFFIXES)
-        copy_cdsapirc(chosen_suffix)
-        logging.info(f"Switched .cdsapirc file to {chosen_suffix}")
+    if error is not None:
+        logging.error(f"Lorenz Cycle script failed for ID {id}: {error.strip().splitlines()[-1]}")
+    elif not check_results_exist(id):
+        error = "Exited with code 0 but no results file was written"
+        logging.error(f"Lorenz Cycle script for ID {id} wrote no results")
     else:
-        logging.error("No .cdsapirc files found. Please check the configuration.")
+        logging.info(f"Successfully ran Lorenz Cycle script for ID {id}")
+    return id, exit_code, error, started_at, time.time(), peak_rss
 
-    input_track_path = prepare_track_data(id)
-    if input_track_path:
-        try:
-            arguments = [f'{id}_ERA5.nc', '-t', '-r', '-g', '-v', '-p', '-z', '--cdsapi', '--trackfile', input_track_path]
-            command = f"python {LEC_PATH} " + " ".join(arguments)
-            subprocess.run(command, shell=True, executable='/bin/bash')
-            logging.info(f"Successfully ran Lorenz Cycle script for ID {id}")
-        except Exception as e:
-            logging.error(f"Error running Lorenz Cycle script for ID {id}: {e}")
-    else:
-        logging.error(f"Error running Lorenz Cycle script for ID {id}: Could not prepare track data")
+def schedule_jobs(conn, region, input_paths, num_workers, download_stage, download_batch, queue_size, features,
+                  memory_budget, default_memory=DEFAULT_JOB_MEMORY, max_attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY,
+                  lec_mode='warm', lec_timeout=None, metrics_writer=None, prep_time=None, owner=None,
+                  lease_duration=LEASE_DURATION):
+    """
+    Runs the pending jobs of a region, and retries failed ones with exponential backoff, until every job
+    is completed, out of attempts, or running in another launcher. The outcome of each attempt is recorded
+    in the job database.
 
-    return id
+    Jobs are claimed from the job database with a lease held by owner (see job_database.claim_jobs), so
+    several launchers can run the same region. Jobs of launchers whose lease expired are reclaimed and retried.
 
-CDSAPIRC_SUFFIXES = get_cdsapi_keys()
+    Each job goes through two stages: the ERA5 download, in the download stage (see era5_cache.DownloadStage),
+    and the LEC computation, in a pool of num_workers processes. Downloaded systems wait for a free LEC worker
+    in a queue of at most queue_size systems; new systems only enter the download stage while the queue has room.
 
-# Initialize subprocess_counter with the number of already evaluated systems
-subprocess_counter = count_evaluated_systems()
+    Jobs are dispatched longest estimated run time first, to shorten the total run time (see job_costs.py).
+    A LEC run is only started while the estimated peak memory of all running jobs fits in memory_budget,
+    so up to num_workers runs are started for small systems, and fewer for large ones. The estimates are
+    refitted on the observed run times and peak memory as jobs complete.
 
-logging.info(f"Starting automate_run_LEC.py for region: {REGION}")
+    In 'warm' mode, the LEC workers are long-lived processes that import LEC once and run it in-process
+    (see run_lorenz_cycle). Retries of a failed job always run LEC in a subprocess, so a run that left
+    a worker in a bad state does not fail the job again.
 
-tracks = pd.read_csv(FILTERED_TRACKS)
-tracks_region = tracks[tracks['region'] == REGION]
-system_ids = tracks_region['track_id'].unique()
+    The time spent by each attempt in every stage, the bytes it downloaded, its peak memory and outcome
+    are written to metrics_writer (see run_metrics.py). The completion time is estimated from the rate
+    at which the last LEC runs finished.
 
-# Change directory to the Lorenz Cycle program directory
-try:
-    lec_dir = os.path.dirname(LEC_PATH)
-    os.chdir(lec_dir)
-    logging.info(f"Changed directory to {lec_dir}")
-except Exception as e:
-    logging.error(f"Error changing directory: {e}")
-    exit(1)
-
-# Pull the latest changes from Git
-try:
-    subprocess.run(["git", "pull"])
-    logging.info("Successfully pulled latest changes from Git")
-except Exception as e:
-    logging.error(f"Error pulling latest changes from Git: {e}")
-    exit(1)
-
-# Determine the number of CPU cores to use
-max_cores = os.cpu_count()
-num_workers = max(1, max_cores - 4) if max_cores else 1
-logging.info(f"Using {num_workers} CPU cores")
-
-# Process each system ID in parallel and log progress
-start_time = time.time()
-formatted_start_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start_time))
-total_systems_count = len(system_ids)
-remaining_systems_count = total_systems_count - subprocess_counter
-logging.info(f"Starting {total_systems_count} cases at {formatted_start_time}")
-logging.info(f"{subprocess_counter} cases already evaluated")
-logging.info(f"{remaining_systems_count} cases remaining to be evaluated")
-
-# Inside the loop, after processing each system, calculate and log the estimated completion time
-with ProcessPoolExecutor(max_workers=num_workers) as executor:
-    for idx, completed_id in enumerate(executor.map(run_lorenz_cycle, system_ids), 1):
-        current_time = time.time()
-        elapsed_time = current_time - overall_start_time
-        average_time_per_system = elapsed_time / idx
-        estimated_total_time = average_time_per_system * (remaining_systems_count - idx)
-        estimated_completion_time = overall_start_time + estimated_total_time
-        formatted_estimated_completion_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(estimated_completion_time))
-        
-        logging.info(f"Completed {idx}/{total_systems_count} cases (ID {completed_id}). Estimated completion time: {formatted_estimated_completion_time}")
-        
-end_time = time.time()
-formatted_end_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(end_time))
-logging.info(f"Finished {len(system_ids)} cases at {formatted_end_time}")
-
-# Calculate and log execution times
-total_time_seconds = end_time - start_time
-total_time_minutes = total_time_seconds / 60
-total_time_hours = total_time_seconds / 3600
-mean_time_minutes = total_time_minutes / len(system_ids)
-mean_time_hours = total_time_hours / len(system_ids)
-
-logging.info(f'Total time for {len(system_ids)} cases: {total_time_hours:.2f} hours ({total_time_minutes:.2f} minutes)')
-logging.info(f'Mean time per case: {mean_time_hours:.2f} hours ({mean_time_minutes:.2f} minutes)')
\ No newline at end of file
+    Args:
+    conn (sqlite3.Connection): Job database connection.
+    region (str): Region to process.
+    input_paths (dict): Path of the track input file of each system ID, see prepare_track_inputs.
+    num_workers (int): Number of LEC runs in parallel.
+    download_stage (DownloadStage): The download stage.
+    download_batch (int): Maximum number of systems in the download stage. Their downloads are merged.
+    queue_size (int): Maximum number of downloaded systems waiting for a LEC worker.
+    features (DataFrame): Features of the jobs, see job_costs.track_features.
+    memory_budget (float): Memory available to the LEC runs, in bytes.
+    default_memory (float): Peak memory assumed for a LEC run before any has been observed, in bytes.
+    max_attempts (int): Maximum number of attempts per system.
+    retry_delay (float): Delay before the first retry of a failed job, in seconds.
+    lec_mode (str): 'warm' or 'subprocess', see run_lorenz_cycle.
+    lec_timeout (float): Maximum run time of LEC for one system, in seconds, or None for no limit.
+    metrics_writer (MetricsWriter): Where the metrics of each attempt are written, or None.
+    prep_time (float): Time taken to write the track input file of each system, in seconds.
+    owner (str): Identifier of this launcher in the job leases, see launcher_id.
+    lease_duration (float): Duration of the job leases, in seconds. They are renewed by a LeaseKeeper.
+    """
+    start_time = time.time()
+    finished_count = 0
+    system_metrics = {}  # System ID -> metrics of its current attempt
+    computations = {}
+    downloaded = deque()
+    started_at = {}
+    attempts = {}
+    estimates = job_estimates(conn, region)
+
+    def estimated_rss(system_id):
+        return estimates.get(system_id, (None, None))[1] or default_memory
+
+    def finish(system_id, exit_code, error, finished_at=None, compute_time=None, peak_rss=None):
+        nonlocal finished_count, estimates
+        attempts.pop(system_id, None)
+        admitted_at = started_at.pop(system_id, None)
+        if not finish_job(conn, system_id, exit_code, error, admitted_at, finished_at, retry_delay,
+                          compute_time=compute_time, peak_rss=peak_rss, owner=owner):
+            logging.warning(f"The lease of ID {system_id} expired and another launcher reclaimed it: outcome not recorded")
+        finished_count += 1
+        if finished_count % REESTIMATE_EVERY == 0:
+            update_job_estimates(conn, features, default_memory)
+            estimates = job_estimates(conn, region)
+        status = "completed" if exit_code == 0 and error is None else "failed"
+        metrics = system_metrics.pop(system_id, {})
+        metrics.pop('ready_at', None)
+        if metrics_writer is not None:
+            finished_at = finished_at or time.time()
+            metrics_writer.write({'system_id': system_id, 'region': region, 'launcher': owner, 'status': status,
+                                  'exit_code': exit_code,
+                                  'error': error.strip().splitlines()[-1] if error and error.strip() else error,
+                                  'prep_time': prep_time, **metrics, 'peak_rss': peak_rss,
+                                  'total_time': finished_at - admitted_at if admitted_at else None,
+                                  'started_at': admitted_at, 'finished_at': finished_at})
+
+        # Skipped systems and systems that never reached LEC finish instantly: only LEC runs set the rate. The
+        # remaining jobs are shared with the other launchers of the region, so the rate is the one of all their
+        # LEC runs completed since this launcher started
+        remaining_count = count_remaining_jobs(conn, region, max_attempts)
+        completion_rate = RollingRate(start_time)
+        for completed_at in recent_completions(conn, region, start_time, ETA_WINDOW):
+            completion_rate.add(completed_at)
+        estimated_completion_time = completion_rate.eta(remaining_count)
+        if estimated_completion_time is None:
+            formatted_estimated_completion_time = "unknown until a LEC run finishes"
+        else:
+            formatted_estimated_completion_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(estimated_completion_time))
+        logging.info(f"Job for ID {system_id} {status}. {remaining_count} cases remaining. "
+                     f"Estimated completion time (all launchers): {formatted_estimated_completion_time}")
+
+    def downloads_done(events):
+        for system_id, error in events:
+            system_metrics[system_id].update(download_stage.pop_metrics(system_id))
+            if error is None:
+                system_metrics[system_id]['ready_at'] = time.time()
+                logging.info(f"ERA5 data ready for ID {system_id}")
+                downloaded.append(system_id)
+            else:
+                logging.error(f"Error downloading ERA5 data for ID {system_id}: {error}")
+                finish(system_id, None, error)
+
+    # The workers are spawned rather than forked: a worker forked while a download thread writes a tile
+    # would keep the tile's HDF5 file lock for its whole life, and other launchers could not read it
+    log_file = next((handler.baseFilename for handler in logging.getLogger().handlers
+                     if isinstance(handler, logging.FileHandler)), None)
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_lec_worker, initargs=(lec_mode, LEC_PATH, LEC_RESULTS_DIR, log_file)) as executor:
+        while True:
+            # Admit new systems while the download stage and the queue have room
+            reclaimed_count = reclaim_expired_leases(conn, region)
+            if reclaimed_count:
+                logging.warning(f"Reclaimed {reclaimed_count} jobs whose launcher stopped renewing their lease")
+            free_slots = min(download_batch - len(download_stage), queue_size - len(downloaded))
+            batch = {}
+            claimed = claim_jobs(conn, region, max(free_slots, 0), max_attempts, owner, lease_duration) if free_slots > 0 else []
+            for system_id, attempt in claimed:
+                attempts[system_id] = attempt
+                started_at[system_id] = time.time()
+                system_metrics[system_id] = {'attempt': attempts[system_id]}
+                batch[system_id] = (input_paths.get(system_id), f'{system_id}_ERA5.nc')
+            if batch:
+                downloads_done(download_stage.admit(batch))
+
+            # Hand downloaded systems to free LEC workers, longest first, while their estimated memory fits
+            while downloaded and len(computations) < num_workers:
+                reserved = sum(estimated_rss(running_id) for running_id in computations.values())
+                candidates = sorted(downloaded, key=lambda candidate: -(estimates.get(candidate, (None,))[0] or 0))
+                system_id = next((candidate for candidate in candidates
+                                  if not computations or reserved + estimated_rss(candidate) <= memory_budget), None)
+                if system_id is None:
+                    break
+                downloaded.remove(system_id)
+                system_lec_mode = lec_mode if attempts.get(system_id, 1) == 1 else 'subprocess'
+                metrics = system_metrics[system_id]
+                metrics.update(queue_time=time.time() - metrics.pop('ready_at'), lec_mode=system_lec_mode)
+                computations[executor.submit(run_lorenz_cycle, system_id, input_paths.get(system_id), system_lec_mode,
+                                             lec_timeout)] = system_id
+
+            retry_at = next_retry_time(conn, region, max_attempts)
+            stage_futures = download_stage.futures()
+            if not stage_futures and not computations:
+                if downloaded or batch:
+                    continue
+                if retry_at is None:
+                    break
+                logging.info(f"Waiting until {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(retry_at))} to retry failed jobs")
+                time.sleep(max(0, retry_at - time.time()))
+                continue
+
+            # Wake up when a stage finishes, or when a failed job is due for a retry and there is room for it
+            timeout = max(0, retry_at - time.time()) if retry_at is not None and free_slots > 0 else None
+            done, _ = wait(stage_futures + list(computations), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future not in computations:
+                    downloads_done(download_stage.complete(future))
+                    continue
+                system_id = computations.pop(future)
+                try:
+                    _, exit_code, error, compute_started_at, finished_at, peak_rss = future.result()
+                    compute_time = finished_at - compute_started_at
+                    system_metrics[system_id]['compute_time'] = compute_time
+                except Exception as e:
+                    exit_code, error, finished_at, compute_time, peak_rss = None, f"Worker error: {e}", None, None, None
+                finish(system_id, exit_code, error, finished_at, compute_time if exit_code == 0 and error is None else None,
+                       peak_rss)
+
+def plan_run(args, database_path, cache_dir, metrics_path):
+    """
+    Prints the predicted download volume and run time of a region (see run_planner.py). Only reads the tracks,
+    the job database, the tile cache index, the metrics and the results directory.
+    """
+    tracks = pd.read_csv(FILTERED_TRACKS)
+    max_cores = os.cpu_count()
+    num_workers = args.workers or (max(1, max_cores - 4) if max_cores else 1)
+    download_batch = args.download_batch or 4 * num_workers
+    conn = connect_job_database(database_path, read_only=True) if os.path.exists(database_path) else None
+    cache = ERA5Cache(cache_dir, read_only=True) if os.path.exists(os.path.join(cache_dir, 'index.sqlite')) else None
+    metrics = pd.read_json(metrics_path, lines=True) if os.path.exists(metrics_path) and os.path.getsize(metrics_path) else None
+    region_ids = tracks.loc[tracks['region'] == args.region, 'track_id'].unique()
+    done_ids = [system_id for system_id in region_ids if check_results_exist(system_id)]
+
+    plan, totals = plan_region(tracks, args.region, num_workers, download_batch, conn, cache, metrics, done_ids,
+                               args.max_attempts, args.job_memory * 2**30)
+    print(plan_report(args.region, totals, args.download_rate))
+    if args.plan_output:
+        plan.to_csv(args.plan_output)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Lorenz Energy Cycle for all systems of a region.")
+    parser.add_argument('region', help="Region to process.")
+    parser.add_argument('--database', default=JOB_DATABASE, help="Path to the job database.")
+    parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS, help="Maximum number of attempts per system.")
+    parser.add_argument('--retry-delay', type=float, default=RETRY_DELAY,
+                        help="Delay before the first retry of a failed system, in seconds. Doubled at every attempt.")
+    parser.add_argument('--workers', type=int, help="Number of LEC runs in parallel. Defaults to the number of cores minus 4.")
+    parser.add_argument('--download-workers', type=int,
+                        help="Number of ERA5 downloads in parallel. Defaults to the number of CDS keys times --requests-per-key.")
+    parser.add_argument('--download-queue', type=int,
+                        help="Maximum number of downloaded systems waiting for a LEC worker. Defaults to the number of LEC workers.")
+    parser.add_argument('--download-batch', type=int,
+                        help="Maximum number of systems whose downloads are merged together. Defaults to 4 times the number of LEC workers.")
+    parser.add_argument('--cache-dir', default=ERA5_CACHE_DIR, help="Directory of the shared ERA5 tile cache.")
+    parser.add_argument('--cache-size', type=float, default=ERA5_CACHE_SIZE / 2**30,
+                        help="Maximum size of the ERA5 tile cache, in GB.")
+    parser.add_argument('--requests-per-key', type=int, default=MAX_REQUESTS_PER_KEY,
+                        help="Maximum number of concurrent CDS requests per key.")
+    parser.add_argument('--request-interval', type=float, default=MIN_REQUEST_INTERVAL,
+                        help="Minimum number of seconds between two CDS requests with the same key.")
+    parser.add_argument('--memory-budget', type=float,
+                        help="Memory available to the LEC runs, in GB. Defaults to 90%% of the memory available at start.")
+    parser.add_argument('--job-memory', type=float, default=DEFAULT_JOB_MEMORY / 2**30,
+                        help="Peak memory assumed for a LEC run until enough runs have been observed, in GB.")
+    parser.add_argument('--lec-mode', choices=LEC_MODES, default='warm',
+                        help="Run LEC inside long-lived workers that import it once ('warm'), or in a new process per system.")
+    parser.add_argument('--lec-timeout', type=float, help="Maximum run time of LEC for one system, in seconds.")
+    parser.add_argument('--metrics', default=METRICS_FILE, help="Path to the JSON lines file of per-system metrics.")
+    parser.add_argument('--lease-duration', type=float, default=LEASE_DURATION,
+                        help="Seconds a claimed job, and the ERA5 cache tiles pinned or downloaded by this launcher, stay leased to it without renewal, before other launchers reclaim them.")
+    parser.add_argument('--multi-host', action='store_true',
+                        help="The job database is shared with launchers on other hosts, over a network filesystem.")
+    parser.add_argument('--log-file', default='log.automate_run_LEC.txt',
+                        help="Path to the log file. Launchers started from the same directory need different ones.")
+    parser.add_argument('--report', action='store_true', help="Print the job report of the region and exit.")
+    parser.add_argument('--plan', action='store_true',
+                        help="Print the predicted download volume and run time of the region and exit, without downloading or running LEC.")
+    parser.add_argument('--plan-output', help="With --plan, also save the prediction of each system to this CSV file.")
+    parser.add_argument('--download-rate', type=float, help="With --plan, download throughput used to estimate the download time, in MB/s.")
+    args = parser.parse_args()
+
+    region = args.region
+    # The job database path must not depend on the LEC directory we change to below
+    database_path = os.path.abspath(args.database)
+    journal_mode = 'DELETE' if args.multi_host else 'WAL'
+    cache_dir = os.path.abspath(args.cache_dir)
+    metrics_path = os.path.abspath(args.metrics)
+    if args.plan:
+        plan_run(args, database_path, cache_dir, metrics_path)
+        return
+    conn = connect_job_database(database_path, journal_mode)
+    if args.report:
+        print(job_report(conn, region).to_string(index=False))
+        return
+
+    # Update logging configuration to use the custom handler. The LEC workers append to the same file,
+    # so it is emptied once and opened in append mode
+    open(args.log_file, 'w').close()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.FileHandler(args.log_file, mode='a')])
+    logging.getLogger('cdsapi').setLevel(logging.WARNING)
+
+    owner = launcher_id()
+    logging.info(f"Starting automate_run_LEC.py for region: {region}, launcher {owner}")
+
+    tracks = pd.read_csv(FILTERED_TRACKS)
+    tracks_region = tracks[tracks['region'] == region]
+    system_ids = tracks_region['track_id'].unique()
+
+    # New jobs are checked once against the results directory, so campaigns started before the job
+    # database existed are not recomputed. Afterwards, progress is only read from the database.
+    new_ids = register_jobs(conn, system_ids, region)
+    if new_ids and os.path.isdir(LEC_RESULTS_DIR):
+        existing_ids = [system_id for system_id in new_ids if check_results_exist(system_id)]
+        mark_completed(conn, existing_ids)
+        logging.info(f"Registered {len(new_ids)} new jobs, {len(existing_ids)} of them with existing results")
+    # Run time and memory estimates, from the track of each system and the jobs completed so far
+    features = track_features(tracks_region)
+    set_job_features(conn, features)
+    update_job_estimates(conn, features, args.job_memory * 2**30)
+    # Jobs of launchers of this host that stopped are retried at once, others when their lease expires
+    interrupted_count = reclaim_expired_leases(conn, region, dead_local_owners(lease_owners(conn, region)))
+    if interrupted_count:
+        logging.warning(f"{interrupted_count} jobs were interrupted in a previous run and will be retried")
+
+    # Change directory to the Lorenz Cycle program directory
+    try:
+        lec_dir = os.path.dirname(LEC_PATH)
+        os.chdir(lec_dir)
+        logging.info(f"Changed directory to {lec_dir}")
+    except Exception as e:
+        logging.error(f"Error changing directory: {e}")
+        sys.exit(1)
+
+    # Pull the latest changes from Git
+    try:
+        subprocess.run(["git", "pull"])
+        logging.info("Successfully pulled latest changes from Git")
+    except Exception as e:
+        logging.error(f"Error pulling latest changes from Git: {e}")
+        sys.exit(1)
+
+    # Determine the number of CPU cores to use
+    max_cores = os.cpu_count()
+    num_workers = args.workers or (max(1, max_cores - 4) if max_cores else 1)
+    logging.info(f"Using {num_workers} CPU cores")
+    memory_budget = args.memory_budget * 2**30 if args.memory_budget else MEMORY_FRACTION * psutil.virtual_memory().available
+    logging.info(f"Memory budget for LEC runs: {memory_budget / 2**30:.1f} GB")
+
+    # Each download uses its own CDS key, read from the ~/.cdsapirc-* files without touching ~/.cdsapirc
+    credentials = read_cdsapi_credentials()
+    if not credentials:
+        logging.error("No .cdsapirc files found. Please check the configuration.")
+        sys.exit(1)
+    logging.info(f"CDS keys available: {[credential.name for credential in credentials]}")
+    # The key slots are shared with the other launchers of the job database
+    credential_pool = CredentialPool(credentials, args.requests_per_key, args.request_interval, f'{database_path}.keys')
+    download_workers = args.download_workers or len(credentials) * args.requests_per_key
+    download_queue = args.download_queue if args.download_queue is not None else num_workers
+    download_batch = args.download_batch or 4 * num_workers
+    # Pins and in-flight tiles are leased in the shared cache like the jobs, and renewed by the LeaseKeeper
+    cache = ERA5Cache(cache_dir, int(args.cache_size * 2**30), owner, args.lease_duration)
+    download_stage = DownloadStage(cache, credential_pool, download_workers)
+
+    # Process each system ID in parallel and log progress
+    start_time = time.time()
+    formatted_start_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start_time))
+    logging.info(f"Starting {len(system_ids)} cases at {formatted_start_time}")
+    logging.info(f"Job status:\n{job_report(conn, region).to_string(index=False)}")
+
+    metrics_writer = MetricsWriter(metrics_path)
+    for system_id, reason in skipped_jobs(conn, region, args.max_attempts):
+        metrics_writer.write({'system_id': system_id, 'region': region, 'launcher': owner, 'status': 'skipped',
+                              'skip_reason': reason})
+
+    # Workers only receive the path of their input file, never the track data
+    prep_start = time.time()
+    input_paths = prepare_track_inputs(tracks_region, os.path.join(lec_dir, 'inputs'))
+    prep_time = (time.time() - prep_start) / max(len(input_paths), 1)
+    lease_keeper = LeaseKeeper(database_path, owner, args.lease_duration, journal_mode, cache)
+    try:
+        schedule_jobs(conn, region, input_paths, num_workers, download_stage, download_batch, download_queue, features,
+                      memory_budget, args.job_memory * 2**30, args.max_attempts, args.retry_delay, args.lec_mode,
+                      args.lec_timeout, metrics_writer, prep_time, owner, args.lease_duration)
+    finally:
+        lease_keeper.stop()
+        download_stage.shutdown()
+
+    end_time = time.time()
+    formatted_end_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(end_time))
+    logging.info(f"Finished {len(system_ids)} cases at {formatted_end_time}")
+
+    # Calculate and log execution times
+    total_time_seconds = end_time - start_time
+    total_time_minutes = total_time_seconds / 60
+    total_time_hours = total_time_seconds / 3600
+    logging.info(f'Total time for {len(system_ids)} cases: {total_time_hours:.2f} hours ({total_time_minutes:.2f} minutes)')
+    cache_stats = cache.stats()
+    logging.info(f"ERA5 cache: {cache_stats.get('tile_hits', 0):.0f} tile hits, {cache_stats.get('tile_misses', 0):.0f} misses, "
+                 f"{cache_stats.get('requests', 0):.0f} requests, {cache_stats.get('bytes_downloaded', 0) / 2**30:.2f} GB downloaded "
+                 f"for {cache_stats.get('bytes_served', 0) / 2**30:.2f} GB of system inputs")
+    logging.info(f"Job status:\n{job_report(conn, region).to_string(index=False)}")
+    metrics = read_metrics(metrics_path, metrics_writer.run_id)
+    if not metrics.empty:
+        logging.info(f"Outcomes of run {metrics_writer.run_id}:\n{outcome_summary(metrics).to_string(index=False)}")
+        logging.info(f"Time per stage (seconds), bytes and peak memory:\n"
+                     f"{phase_summary(metrics).to_string(index=False, float_format='%.2f')}")
+
+if __name__ == "__main__":
+    main()
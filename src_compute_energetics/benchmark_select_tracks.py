@@ -0,0 +1,259 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    benchmark_select_tracks.py                         :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2026/10/17 16:58:37 by daniloceano       #+#    #+#              #
+#    Updated: 2026/10/17 16:58:37 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Benchmark harness for the select_tracks stages.
+
+Generates synthetic track archives (see synthetic_tracks.py) at the requested scales, then times each
+stage of the track selection and records its peak memory. Each stage runs in a fresh process, so the
+peak resident set size of one stage is not inflated by the previous ones. Results are saved as JSON,
+tagged with the current git commit, so runs made on different commits can be compared.
+
+Runs offline: the only external input is the bundled ne_50m_land shapefile.
+
+Usage:
+- python benchmark_select_tracks.py --scales 1 2 --years 1979 1980
+- python benchmark_select_tracks.py --compare ../benchmarks/results/<old>.json ../benchmarks/results/<new>.json
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import subprocess
+import tracemalloc
+import multiprocessing
+import queue as queue_module
+import logging
+import pyarrow as pa
+import geopandas as gpd
+from synthetic_tracks import generate_tracks
+from track_store import convert_tracks_to_store, store_exists
+from land_mask import CONTINENT_SHAPEFILE, LAND_MASK_RESOLUTION, build_land_index, compute_land_fractions, load_land_mask
+from select_tracks import (CONTINENT_THRESHOLD_PERCENTAGE, get_tracks, filter_tracks_by_region,
+                           check_tracks_on_continent, filter_tracks_by_continent)
+
+BENCHMARK_DIR = '../benchmarks'
+STAGES = ['get_tracks_csv', 'convert_tracks_to_store', 'get_tracks_store', 'filter_tracks_by_region',
+          'check_tracks_on_continent', 'filter_tracks_by_continent', 'filter_tracks_by_continent_workers',
+          'filter_tracks_by_continent_land_mask']
+
+def data_dirs(scale, first_year, last_year, benchmark_dir=BENCHMARK_DIR):
+    """
+    Returns the raw, store and land mask paths of the synthetic archive of a given scale and period.
+    """
+    base_dir = os.path.join(benchmark_dir, 'data', f"scale_{scale:g}_{first_year}-{last_year}")
+    mask_path = os.path.join(base_dir, f"land_mask_{LAND_MASK_RESOLUTION:g}.npy")
+    return os.path.join(base_dir, 'tracks_SAt'), os.path.join(base_dir, 'tracks_SAt_store'), mask_path
+
+def prepare_data(scale, first_year, last_year, seed, benchmark_dir=BENCHMARK_DIR):
+    """
+    Generates the synthetic archive of a given scale and period, unless it already exists.
+    """
+    raw_dir, _, _ = data_dirs(scale, first_year, last_year, benchmark_dir)
+    if not os.path.isdir(raw_dir) or not os.listdir(raw_dir):
+        print(f"Generating synthetic tracks at scale {scale:g} in {raw_dir}...")
+        generate_tracks(raw_dir, scale, first_year, last_year, seed)
+    return raw_dir
+
+def setup_stage(stage, raw_dir, store_dir, mask_path, logger):
+    """
+    Loads the inputs of a stage, outside of the timed section. Returns a callable that runs the stage.
+    """
+    if stage == 'get_tracks_csv':
+        # Point the store at a directory that does not exist, to force reading the raw CSV files
+        return lambda: get_tracks(logger, raw_dir=raw_dir, store_dir=store_dir + '_missing')
+    if stage == 'convert_tracks_to_store':
+        return lambda: convert_tracks_to_store(raw_dir, store_dir, logger)
+    if stage == 'get_tracks_store':
+        return lambda: get_tracks(logger, raw_dir=raw_dir, store_dir=store_dir)
+
+    tracks = get_tracks(logger, raw_dir=raw_dir, store_dir=store_dir)
+    if stage == 'filter_tracks_by_region':
+        return lambda: filter_tracks_by_region(tracks, logger)
+
+    continent_gdf = gpd.read_file(CONTINENT_SHAPEFILE)
+    if stage == 'check_tracks_on_continent':
+        land_index = build_land_index(continent_gdf)
+        return lambda: check_tracks_on_continent(compute_land_fractions(tracks, land_index),
+                                                 CONTINENT_THRESHOLD_PERCENTAGE)
+    if stage == 'filter_tracks_by_continent':
+        return lambda: filter_tracks_by_continent(tracks, continent_gdf, CONTINENT_THRESHOLD_PERCENTAGE)
+    if stage == 'filter_tracks_by_continent_workers':
+        return lambda: filter_tracks_by_continent(tracks, continent_gdf, CONTINENT_THRESHOLD_PERCENTAGE,
+                                                  num_workers=os.cpu_count())
+    if stage == 'filter_tracks_by_continent_land_mask':
+        land_mask = load_land_mask(continent_gdf, mask_path=mask_path)
+        return lambda: filter_tracks_by_continent(tracks, continent_gdf, CONTINENT_THRESHOLD_PERCENTAGE,
+                                                  land_mask=land_mask)
+    raise ValueError(f"Unknown stage: {stage}")
+
+def run_stage(stage, raw_dir, store_dir, mask_path, queue):
+    """
+    Runs one stage in the current (fresh) process and puts its measurements on the queue.
+    """
+    logger = logging.getLogger(__name__)
+    run = setup_stage(stage, raw_dir, store_dir, mask_path, logger)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - start
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # ru_maxrss is reported in kilobytes on Linux
+    queue.put({
+        'stage': stage,
+        'seconds': elapsed,
+        'peak_traced_mb': peak_traced / 2**20,
+        # Arrow buffers are not seen by tracemalloc
+        'peak_arrow_mb': pa.default_memory_pool().max_memory() / 2**20,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10,
+        'setup_rss_mb': rss_before / 2**10,
+        'children_peak_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 2**10,
+        'output_rows': len(result) if hasattr(result, '__len__') else None,
+    })
+
+def wait_for_measurement(process, queue, poll_seconds=5):
+    """
+    Waits for the measurement of a stage process, without hanging if the process dies before sending it
+    (out of memory, import error, exception in the stage).
+
+    Returns:
+    dict or None: The measurement, or None if the process exited without one.
+    """
+    while True:
+        try:
+            return queue.get(timeout=poll_seconds)
+        except queue_module.Empty:
+            if not process.is_alive():
+                break
+    # The process may have sent its measurement just before exiting
+    try:
+        return queue.get(timeout=1)
+    except queue_module.Empty:
+        return None
+
+def benchmark_scale(scale, first_year, last_year, seed, stages, repeat=1, benchmark_dir=BENCHMARK_DIR):
+    """
+    Benchmarks the stages on the synthetic archive of a given scale. A stage whose process fails is
+    reported and left out of the measurements.
+
+    Returns:
+    list: One measurement dictionary per successful stage and repetition.
+    """
+    raw_dir = prepare_data(scale, first_year, last_year, seed, benchmark_dir)
+    _, store_dir, mask_path = data_dirs(scale, first_year, last_year, benchmark_dir)
+    context = multiprocessing.get_context('spawn')
+    measurements = []
+    for stage in stages:
+        if stage not in ('get_tracks_csv', 'convert_tracks_to_store') and not store_exists(store_dir):
+            convert_tracks_to_store(raw_dir, store_dir)
+        for iteration in range(repeat):
+            queue = context.Queue()
+            process = context.Process(target=run_stage, args=(stage, raw_dir, store_dir, mask_path, queue))
+            process.start()
+            measurement = wait_for_measurement(process, queue)
+            process.join()
+            if measurement is None:
+                print(f"scale {scale:g} - {stage}: failed (exit code {process.exitcode})", file=sys.stderr)
+                break
+            measurement.update({'scale': scale, 'repeat': iteration})
+            print(f"scale {scale:g} - {stage}: {measurement['seconds']:.2f} s, "
+                  f"peak traced {measurement['peak_traced_mb']:.0f} MB, peak RSS {measurement['peak_rss_mb']:.0f} MB")
+            measurements.append(measurement)
+    return measurements
+
+def git_commit():
+    """
+    Returns the current git commit hash, or None outside a git repository.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_results(measurements, args, benchmark_dir=BENCHMARK_DIR):
+    """
+    Saves the measurements, with the commit and machine they were taken on, to the results directory.
+
+    Returns:
+    str: Path to the results file.
+    """
+    commit = git_commit()
+    results = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'years': [args.years[0], args.years[1]],
+        'seed': args.seed,
+        'measurements': measurements,
+    }
+    results_dir = os.path.join(benchmark_dir, 'results')
+    os.makedirs(results_dir, exist_ok=True)
+    results_file = os.path.join(results_dir, f"{time.strftime('%Y%m%d_%H%M%S')}_{commit or 'nogit'}.json")
+    with open(results_file, 'w') as f:
+        json.dump(results, f, indent=2)
+    return results_file
+
+def compare_results(old_file, new_file):
+    """
+    Prints the change in time and peak memory of each stage between two results files.
+    """
+    results = []
+    for results_file in (old_file, new_file):
+        with open(results_file) as f:
+            results.append(json.load(f))
+
+    def best(measurements):
+        best_runs = {}
+        for m in measurements:
+            key = (m['scale'], m['stage'])
+            if key not in best_runs or m['seconds'] < best_runs[key]['seconds']:
+                best_runs[key] = m
+        return best_runs
+
+    old, new = best(results[0]['measurements']), best(results[1]['measurements'])
+    print(f"{results[0]['commit']} -> {results[1]['commit']}")
+    for key in sorted(old.keys() & new.keys()):
+        o, n = old[key], new[key]
+        print(f"scale {key[0]:g} - {key[1]}: {o['seconds']:.2f} s -> {n['seconds']:.2f} s "
+              f"({n['seconds'] / o['seconds']:.2f}x), peak RSS {o['peak_rss_mb']:.0f} MB -> {n['peak_rss_mb']:.0f} MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the select_tracks stages on synthetic tracks.")
+    parser.add_argument('--scales', type=float, nargs='+', default=[1.0],
+                        help="Multiples of the size of the real archive to benchmark.")
+    parser.add_argument('--years', type=int, nargs=2, default=[1979, 2020], metavar=('FIRST', 'LAST'),
+                        help="Period of the synthetic archive.")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help="Stages to benchmark.")
+    parser.add_argument('--repeat', type=int, default=1, help="Number of runs of each stage.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic generator.")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help="Compare two results files instead of running the benchmark.")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_results(*args.compare)
+        sys.exit(0)
+
+    logging.basicConfig(level=logging.WARNING)
+    measurements = []
+    for scale in args.scales:
+        measurements.extend(benchmark_scale(scale, args.years[0], args.years[1], args.seed, args.stages, args.repeat))
+    print(f"Results saved to {save_results(measurements, args)}")
@@ -0,0 +1,193 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    cds_standin_server.py                              :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2026/10/17 18:03:47 by daniloceano       #+#    #+#              #
+#    Updated: 2026/10/17 18:03:47 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Local stand-in for the CDS API, to run the ERA5 download stage offline.
+
+Implements the part of the CDS API used by cdsapi.Client.retrieve: a request is posted to
+/resources/<dataset>, answered as completed after a configurable delay, and its result is downloaded
+from /download/<request_id>. The result is a small netCDF file with the requested variables, levels,
+dates, time steps and area, filled with synthetic values, on a coarse grid so that files stay small.
+
+Requests are counted per key, together with the largest number of concurrent requests seen for each key,
+and reported at /stats, so the rate limits of the credential pool can be checked.
+
+Usage:
+- python cds_standin_server.py --port 8765 --delay 2
+- Credential file: 'url: http://localhost:8765/api' and 'key: <uid>:<anything>'.
+"""
+
+import json
+import time
+import uuid
+import base64
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+VARIABLE_NAMES = {'u_component_of_wind': 'u', 'v_component_of_wind': 'v', 'temperature': 't',
+                  'vertical_velocity': 'w', 'geopotential': 'z'}
+NETCDF_LOCK = threading.Lock()  # netCDF/HDF5 is not thread-safe, and requests are served in threads
+
+def parse_request_times(request):
+    """
+    Returns the times of a request with 'date' as 'YYYYMMDD/YYYYMMDD' and 'time' as '00/to/23/by/N'.
+    """
+    start, end = request['date'].split('/')
+    step = int(request['time'].split('/')[-1])
+    return pd.date_range(pd.Timestamp(start), pd.Timestamp(end) + pd.Timedelta(hours=23), freq=f'{step}h')
+
+def make_era5_dataset(request, resolution=2.0):
+    """
+    Builds a synthetic dataset with the variables, levels, times and area of an ERA5 request.
+
+    Parameters:
+    request (dict): ERA5 request, with 'area' as 'north/west/south/east'.
+    resolution (float): Grid spacing in degrees.
+
+    Returns:
+    xr.Dataset: Dataset with (time, level, latitude, longitude) variables named as in ERA5 netCDF files.
+    """
+    north, west, south, east = (float(value) for value in str(request['area']).split('/'))
+    # Points of a global grid, as ERA5 does
+    latitude = np.arange(np.floor(north / resolution), np.ceil(south / resolution) - 0.5, -1) * resolution
+    longitude = np.arange(np.ceil(west / resolution), np.floor(east / resolution) + 0.5) * resolution
+    level = np.array([int(value) for value in request['pressure_level']])
+    times = parse_request_times(request)
+    shape = (len(times), len(level), len(latitude), len(longitude))
+    hours = ((times - pd.Timestamp('1979-01-01')) / pd.Timedelta(hours=1)).to_numpy()
+    # Deterministic values, so the same point always has the same value in any request
+    base = (np.sin(np.radians(latitude))[None, None, :, None] + np.cos(np.radians(longitude))[None, None, None, :]
+            + np.log(level)[None, :, None, None] + np.sin(hours / 24)[:, None, None, None])
+    data_vars = {VARIABLE_NAMES.get(variable, variable): (('time', 'level', 'latitude', 'longitude'),
+                                                          (base * (i + 1)).astype(np.float32))
+                 for i, variable in enumerate(request['variable'])}
+    return xr.Dataset(data_vars, coords={'time': times, 'level': level, 'latitude': latitude, 'longitude': longitude})
+
+class StandinState:
+    """
+    Results and per-key statistics shared by the request handlers.
+    """
+
+    def __init__(self, delay, resolution):
+        self.delay = delay
+        self.resolution = resolution
+        self.results = {}
+        self.requests = {}
+        self.active = {}
+        self.max_active = {}
+        self.lock = threading.Lock()
+
+class StandinHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, reply, status=200):
+        body = json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def request_key(self):
+        auth = self.headers.get('Authorization', '')
+        if not auth.startswith('Basic '):
+            return None
+        return base64.b64decode(auth[len('Basic '):]).decode()
+
+    def do_GET(self):
+        if self.path.endswith('/status.json'):
+            self.send_json({})
+        elif self.path.endswith('/stats'):
+            with self.state.lock:
+                self.send_json({'requests': self.state.requests, 'max_active': self.state.max_active})
+        elif '/download/' in self.path:
+            content = self.state.results.get(self.path.rsplit('/', 1)[-1])
+            if content is None:
+                self.send_json({'message': 'Not found'}, 404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-netcdf')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        else:
+            self.send_json({'message': 'Not found'}, 404)
+
+    def do_POST(self):
+        if '/resources/' not in self.path:
+            self.send_json({'message': 'Not found'}, 404)
+            return
+        key = self.request_key()
+        if key is None:
+            self.send_json({'message': 'Authentication failed'}, 401)
+            return
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.state.lock:
+            self.state.requests[key] = self.state.requests.get(key, 0) + 1
+            self.state.active[key] = self.state.active.get(key, 0) + 1
+            self.state.max_active[key] = max(self.state.max_active.get(key, 0), self.state.active[key])
+        try:
+            time.sleep(self.state.delay)
+            with NETCDF_LOCK:
+                content = make_era5_dataset(request, self.state.resolution).to_netcdf()
+        except Exception as e:
+            self.send_json({'message': f'Invalid request: {e}'}, 400)
+            return
+        finally:
+            with self.state.lock:
+                self.state.active[key] -= 1
+        request_id = uuid.uuid4().hex
+        self.state.results[request_id] = bytes(content)
+        self.send_json({'state': 'completed', 'request_id': request_id, 'location': f'download/{request_id}',
+                        'content_length': len(content), 'content_type': 'application/x-netcdf'})
+
+    def do_DELETE(self):
+        self.state.results.pop(self.path.rsplit('/', 1)[-1], None)
+        self.send_json({})
+
+def start_standin_server(port=0, delay=0.0, resolution=2.0):
+    """
+    Starts the stand-in server in a background thread.
+
+    Parameters:
+    port (int): Port to listen on, 0 for any free port.
+    delay (float): Seconds each request takes to complete.
+    resolution (float): Grid spacing of the returned data, in degrees.
+
+    Returns:
+    ThreadingHTTPServer: The running server. Its API url is f"http://localhost:{server.server_port}/api".
+    """
+    handler = type('Handler', (StandinHandler,), {'state': StandinState(delay, resolution)})
+    server = ThreadingHTTPServer(('localhost', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the CDS API.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.0, help="Seconds each request takes to complete.")
+    parser.add_argument('--resolution', type=float, default=2.0, help="Grid spacing of the returned data, in degrees.")
+    args = parser.parse_args()
+
+    server = start_standin_server(args.port, args.delay, args.resolution)
+    print(f"Stand-in CDS API at http://localhost:{server.server_port}/api")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,668 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    era5_cache.py                                      :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2026/10/17 18:36:09 by daniloceano       #+#    #+#              #
+#    Updated: 2026/10/17 18:36:09 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Shared, content-addressed cache of ERA5 data for the download stage of automate_run_LEC.py.
+
+ERA5 data is stored in tiles of one day and TILE_SIZE x TILE_SIZE degrees, keyed by the requested
+variables, pressure levels, time step, day and area tile. The file name of a tile is the hash of its key.
+Cyclones of the same region overlap in time and space, so most of the data of a system is usually
+already cached by an earlier one.
+
+Missing tiles of several pending systems are merged into a few larger downloads (plan_downloads), and
+the ERA5 file of each system is built by slicing its tiles from the cache (ERA5Cache.build_input).
+The cache is limited in size: the least recently used tiles are evicted first, except the ones still
+needed by systems waiting for their input. Hit, miss and volume statistics are kept in the cache index.
+
+Several launchers can share the cache. The tiles pinned by each launcher and the tiles it is downloading
+are recorded in the SQLite index, under its name and with a lease it renews while it is alive (like the
+job leases of job_database.py). No launcher evicts a tile pinned by another, nor plans a download of a
+tile another one is fetching: it waits for that tile instead, and downloads it itself if the other
+launcher's lease expires first.
+
+Usage:
+- python era5_cache.py  # Prints the cache statistics
+"""
+
+import os
+import json
+import math
+import time
+import socket
+import sqlite3
+import hashlib
+import argparse
+import itertools
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import xarray as xr
+from era5_download import build_era5_request, download_era5
+from job_database import transaction
+
+ERA5_CACHE_DIR = '../ERA5_cache'
+ERA5_CACHE_SIZE = 200 * 2**30  # Bytes
+TILE_SIZE = 10  # Degrees
+MAX_REQUEST_DAYS = 31  # Longest period of a single merged download
+MAX_WASTE = 1.5  # Largest ratio between the tiles of a merged download and the missing tiles it covers
+TILE_LEASE_DURATION = 600  # Seconds the pins and in-flight tiles of a launcher last without being renewed
+TILE_POLL_INTERVAL = 10  # Seconds between checks for the tiles downloaded by another launcher
+TIME_DIMS = ('time', 'valid_time')
+# The netCDF/HDF5 libraries are not thread-safe: all netCDF reads and writes of the cache go through this lock
+NETCDF_LOCK = threading.Lock()
+
+TileKey = namedtuple('TileKey', ['variables', 'levels', 'time_step', 'day', 'lat0', 'lon0'])
+
+def request_family(request):
+    """
+    Returns the part of the tile key shared by all tiles of a request: variables, levels and time step.
+    """
+    return (tuple(request['variable']), tuple(request['pressure_level']), int(request['time'].split('/')[-1]))
+
+def parse_area(request):
+    """
+    Returns the (north, west, south, east) area of a request.
+    """
+    return tuple(float(value) for value in str(request['area']).split('/'))
+
+def request_cells(request):
+    """
+    Returns the (day, lat0, lon0) cells covered by a request. Tiles cover [lat0, lat0 + TILE_SIZE) and
+    [lon0, lon0 + TILE_SIZE).
+    """
+    north, west, south, east = parse_area(request)
+    start, end = request['date'].split('/')
+    days = pd.date_range(pd.Timestamp(start), pd.Timestamp(end), freq='D').strftime('%Y%m%d')
+    lat_tiles = range(math.floor(south / TILE_SIZE) * TILE_SIZE, math.floor(north / TILE_SIZE) * TILE_SIZE + 1, TILE_SIZE)
+    lon_tiles = range(math.floor(west / TILE_SIZE) * TILE_SIZE, math.floor(east / TILE_SIZE) * TILE_SIZE + 1, TILE_SIZE)
+    return {(day, lat0, lon0) for day in days for lat0 in lat_tiles for lon0 in lon_tiles}
+
+def covered_cells(request):
+    """
+    Returns the (day, lat0, lon0) cells whose tiles lie entirely within a request, as for the merged downloads
+    built by cells_request.
+    """
+    north, west, south, east = parse_area(request)
+    start, end = request['date'].split('/')
+    days = pd.date_range(pd.Timestamp(start), pd.Timestamp(end), freq='D').strftime('%Y%m%d')
+    lat_tiles = range(math.ceil(south / TILE_SIZE) * TILE_SIZE, math.floor(north / TILE_SIZE) * TILE_SIZE, TILE_SIZE)
+    lon_tiles = range(math.ceil(west / TILE_SIZE) * TILE_SIZE, math.floor(east / TILE_SIZE) * TILE_SIZE, TILE_SIZE)
+    return {(day, lat0, lon0) for day in days for lat0 in lat_tiles for lon0 in lon_tiles}
+
+def tile_key(family, cell):
+    """
+    Returns the key of the tile of a request family (see request_family) at a (day, lat0, lon0) cell.
+    """
+    return TileKey(*family, *cell)
+
+def tile_hash(key):
+    """
+    Returns the content address of a tile: the SHA-256 of its key.
+    """
+    return hashlib.sha256(json.dumps(key._asdict(), sort_keys=True).encode()).hexdigest()
+
+def request_tiles(request):
+    """
+    Returns the hashes of the tiles covered by a request.
+    """
+    family = request_family(request)
+    return {tile_hash(tile_key(family, cell)) for cell in request_cells(request)}
+
+def cells_request(base_request, cells):
+    """
+    Builds the request covering a set of cells: the bounding box of their area tiles and the range of their days.
+    """
+    days = sorted(day for day, _, _ in cells)
+    lat_tiles = [lat0 for _, lat0, _ in cells]
+    lon_tiles = [lon0 for _, _, lon0 in cells]
+    area = [max(lat_tiles) + TILE_SIZE, min(lon_tiles), min(lat_tiles), max(lon_tiles) + TILE_SIZE]
+    return dict(base_request, date=f"{days[0]}/{days[-1]}", area='/'.join(str(value) for value in area))
+
+def bounding_cells(cells):
+    """
+    Returns the number of cells of the bounding box of a set of cells, in days and area tiles.
+    """
+    days = pd.to_datetime(sorted({day for day, _, _ in cells}))
+    num_days = (days[-1] - days[0]).days + 1
+    lat_tiles = [lat0 for _, lat0, _ in cells]
+    lon_tiles = [lon0 for _, _, lon0 in cells]
+    return (num_days * ((max(lat_tiles) - min(lat_tiles)) // TILE_SIZE + 1)
+            * ((max(lon_tiles) - min(lon_tiles)) // TILE_SIZE + 1)), num_days
+
+def plan_downloads(system_requests, cache, in_flight=(), max_days=MAX_REQUEST_DAYS, max_waste=MAX_WASTE):
+    """
+    Merges the missing tiles of several systems into a few larger downloads.
+
+    Systems are taken in chronological order, and the missing cells of each are added to the first download
+    of the same request family whose bounding box stays within max_days and within max_waste times the
+    number of cells it actually needs; otherwise a new download is started.
+
+    Parameters:
+    system_requests (dict): ERA5 request of each system ID, see era5_download.build_era5_request.
+    cache (ERA5Cache): The cache, or None to plan every tile.
+    in_flight (set): Tile hashes already being downloaded, which are not planned again. The tiles other
+                     launchers are downloading (see ERA5Cache.in_flight_tiles) are added to them.
+    max_days (int): Longest period of a download, in days.
+    max_waste (float): Largest ratio between the cells of a download and the missing cells it covers.
+
+    Returns:
+    list: Planned downloads, as dicts with the 'request', the 'tiles' it provides (tile hashes) and the
+          'systems' whose missing tiles it covers.
+    """
+    if cache is not None:
+        in_flight = set(in_flight) | cache.in_flight_tiles()
+    downloads = []
+    for system_id, request in sorted(system_requests.items(), key=lambda item: item[1]['date']):
+        family = request_family(request)
+        needed = {cell for cell in request_cells(request) if tile_hash(tile_key(family, cell)) not in in_flight}
+        missing = {cell for cell in needed if cache is None or not cache.contains(tile_key(family, cell))}
+        if not missing:
+            continue
+        for download in downloads:
+            if download['family'] != family:
+                continue
+            merged = download['cells'] | missing
+            size, num_days = bounding_cells(merged)
+            if num_days <= max_days and size <= max_waste * len(merged):
+                download['cells'] = merged
+                download['systems'].append(system_id)
+                break
+        else:
+            downloads.append({'family': family, 'base_request': request, 'cells': set(missing), 'systems': [system_id]})
+
+    plan = []
+    for download in downloads:
+        request = cells_request(download['base_request'], download['cells'])
+        tiles = {tile_hash(tile_key(download['family'], cell)) for cell in covered_cells(request)}
+        plan.append({'request': request, 'tiles': tiles, 'systems': download['systems']})
+    return plan
+
+def time_dim(dataset):
+    """
+    Returns the name of the time dimension of an ERA5 dataset ('time' in the legacy CDS, 'valid_time' in the new one).
+    """
+    return next(dim for dim in TIME_DIMS if dim in dataset.dims)
+
+class ERA5Cache:
+    """
+    Content-addressed tile cache, with an SQLite index of the tiles (size, last access), of the hit/miss
+    statistics, and of the tiles pinned or being downloaded by each launcher sharing the cache, leased to
+    it until renewed (see renew_leases). Thread-safe. With read_only, an existing index is opened without
+    writing to it, for the lookups of the run planner.
+    """
+
+    def __init__(self, cache_dir=ERA5_CACHE_DIR, max_bytes=ERA5_CACHE_SIZE, owner=None,
+                 lease_duration=TILE_LEASE_DURATION, read_only=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_duration = lease_duration
+        self.lock = threading.RLock()
+        # Tiles being written by the threads of this process; other launchers never store the same tiles,
+        # since they do not download the tiles in flight here
+        self.storing = set()
+        index_path = os.path.join(cache_dir, 'index.sqlite')
+        if read_only:
+            # Opens an existing index without writing to it, e.g. for planning while launchers use the cache
+            self.conn = sqlite3.connect(f'file:{index_path}?mode=ro', uri=True, isolation_level=None,
+                                        check_same_thread=False, timeout=60)
+            self.tables = {name for name, in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            return
+        os.makedirs(cache_dir, exist_ok=True)
+        self.conn = sqlite3.connect(index_path, isolation_level=None, check_same_thread=False, timeout=60)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tiles (hash TEXT PRIMARY KEY, key TEXT NOT NULL, size INTEGER NOT NULL,
+                                              last_access REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS pins (hash TEXT NOT NULL, owner TEXT NOT NULL, count INTEGER NOT NULL,
+                                             lease_expires REAL NOT NULL, PRIMARY KEY (hash, owner));
+            CREATE TABLE IF NOT EXISTS in_flight (hash TEXT PRIMARY KEY, owner TEXT NOT NULL, lease_expires REAL NOT NULL);
+        """)
+        self.tables = {'tiles', 'stats', 'pins', 'in_flight'}
+
+    def tile_path(self, tile):
+        """
+        Returns the path of a tile, from its hash.
+        """
+        return os.path.join(self.cache_dir, tile[:2], f'{tile}.nc')
+
+    def contains(self, key):
+        """
+        Returns whether the tile of a key is cached.
+        """
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM tiles WHERE hash = ?", (tile_hash(key),)).fetchone() is not None
+
+    def record(self, **amounts):
+        """
+        Adds amounts to the named statistics.
+        """
+        with self.lock:
+            self.conn.executemany("INSERT INTO stats (name, value) VALUES (?, ?) "
+                                  "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+                                  list(amounts.items()))
+
+    def stats(self):
+        """
+        Returns the cache statistics: tile hits and misses, requests and bytes downloaded, bytes served to
+        system inputs, and the number and size of the cached tiles.
+        """
+        with self.lock:
+            stats = dict(self.conn.execute("SELECT name, value FROM stats"))
+            stats['tiles'], stats['cached_bytes'] = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tiles").fetchone()
+        lookups = stats.get('tile_hits', 0) + stats.get('tile_misses', 0)
+        stats['hit_rate'] = stats.get('tile_hits', 0) / lookups if lookups else None
+        stats['saved_bytes'] = stats.get('bytes_served', 0) - stats.get('bytes_downloaded', 0)
+        return stats
+
+    def pin(self, request):
+        """
+        Protects the tiles of a request from eviction, by every launcher, until unpin is called or the
+        lease of this launcher expires.
+        """
+        lease_expires = time.time() + self.lease_duration
+        with self.lock, transaction(self.conn):
+            self.conn.executemany("INSERT INTO pins (hash, owner, count, lease_expires) VALUES (?, ?, 1, ?) "
+                                  "ON CONFLICT (hash, owner) DO UPDATE SET count = count + 1, "
+                                  "lease_expires = excluded.lease_expires",
+                                  [(tile, self.owner, lease_expires) for tile in request_tiles(request)])
+
+    def unpin(self, request):
+        """
+        Releases the tiles pinned by pin.
+        """
+        with self.lock, transaction(self.conn):
+            self.conn.executemany("UPDATE pins SET count = count - 1 WHERE hash = ? AND owner = ?",
+                                  [(tile, self.owner) for tile in request_tiles(request)])
+            self.conn.execute("DELETE FROM pins WHERE owner = ? AND count <= 0", (self.owner,))
+
+    def claim_tiles(self, tiles):
+        """
+        Marks tiles as being downloaded by this launcher, so other launchers do not plan them (see plan_downloads).
+
+        Returns:
+        set: The tiles claimed, without the ones another launcher was already downloading.
+        """
+        now = time.time()
+        claimed = set()
+        with self.lock, transaction(self.conn):
+            self.conn.execute("DELETE FROM in_flight WHERE lease_expires < ?", (now,))
+            for tile in tiles:
+                if self.conn.execute("INSERT OR IGNORE INTO in_flight (hash, owner, lease_expires) VALUES (?, ?, ?)",
+                                     (tile, self.owner, now + self.lease_duration)).rowcount:
+                    claimed.add(tile)
+        return claimed
+
+    def release_tiles(self, tiles):
+        """
+        Clears the in-flight marks set by claim_tiles, once the tiles are stored or their download failed.
+        """
+        with self.lock:
+            self.conn.executemany("DELETE FROM in_flight WHERE hash = ? AND owner = ?",
+                                  [(tile, self.owner) for tile in tiles])
+
+    def in_flight_tiles(self):
+        """
+        Returns the tiles being downloaded by any launcher whose lease has not expired.
+        """
+        if 'in_flight' not in self.tables:
+            # Read-only index written before the in-flight tiles were shared
+            return set()
+        with self.lock:
+            return {tile for tile, in self.conn.execute("SELECT hash FROM in_flight WHERE lease_expires >= ?",
+                                                        (time.time(),))}
+
+    def cached_tiles(self, tiles):
+        """
+        Returns the tiles, among the given hashes, that are cached.
+        """
+        with self.lock:
+            return {tile for tile in tiles
+                    if self.conn.execute("SELECT 1 FROM tiles WHERE hash = ?", (tile,)).fetchone() is not None}
+
+    def renew_leases(self):
+        """
+        Extends the lease of the pins and in-flight tiles of this launcher. Returns the number of rows renewed.
+        """
+        lease_expires = time.time() + self.lease_duration
+        with self.lock:
+            return sum(self.conn.execute(f"UPDATE {table} SET lease_expires = ? WHERE owner = ?",
+                                         (lease_expires, self.owner)).rowcount for table in ('pins', 'in_flight'))
+
+    def count_lookups(self, request):
+        """
+        Records the tile hits and misses of a system's request, and returns them.
+        """
+        family = request_family(request)
+        cached = [self.contains(tile_key(family, cell)) for cell in request_cells(request)]
+        self.record(tile_hits=sum(cached), tile_misses=len(cached) - sum(cached))
+        return sum(cached), len(cached) - sum(cached)
+
+    def store_download(self, request, filepath):
+        """
+        Splits a downloaded file into tiles and adds them to the cache, then evicts tiles if the cache is full.
+
+        Parameters:
+        request (dict): The request the file was downloaded with. Only the tiles it covers entirely are stored.
+        filepath (str): Path to the downloaded file.
+
+        Returns:
+        int: Number of tiles stored.
+        """
+        family = request_family(request)
+        with NETCDF_LOCK, xr.open_dataset(filepath) as dataset:
+            dataset = dataset.load()
+        time_name = time_dim(dataset)
+        days = dataset[time_name].dt.strftime('%Y%m%d').values
+        lat, lon = dataset['latitude'].values, dataset['longitude'].values
+        stored = 0
+        for day, lat0, lon0 in covered_cells(request):
+            key = tile_key(family, (day, lat0, lon0))
+            tile = tile_hash(key)
+            # Tiles already cached, or being stored from another download, are not written again
+            with self.lock:
+                if tile in self.storing or self.contains(key):
+                    continue
+                self.storing.add(tile)
+            subset = dataset.isel({time_name: np.flatnonzero(days == day),
+                                   'latitude': np.flatnonzero((lat >= lat0) & (lat < lat0 + TILE_SIZE)),
+                                   'longitude': np.flatnonzero((lon >= lon0) & (lon < lon0 + TILE_SIZE))})
+            tile_path = self.tile_path(tile)
+            os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+            try:
+                with NETCDF_LOCK:
+                    subset.to_netcdf(f'{tile_path}.{os.getpid()}.part')
+                os.replace(f'{tile_path}.{os.getpid()}.part', tile_path)
+                with self.lock:
+                    self.conn.execute("INSERT OR REPLACE INTO tiles (hash, key, size, last_access) VALUES (?, ?, ?, ?)",
+                                      (tile, json.dumps(key._asdict()), os.path.getsize(tile_path), time.time()))
+            finally:
+                with self.lock:
+                    self.storing.discard(tile)
+            stored += 1
+        self.record(requests=1, bytes_downloaded=os.path.getsize(filepath))
+        self.evict()
+        return stored
+
+    def evict(self):
+        """
+        Removes the least recently used tiles until the cache fits in max_bytes, except the ones pinned or
+        being downloaded by any launcher whose lease has not expired.
+
+        Returns:
+        int: Number of bytes freed.
+        """
+        freed = 0
+        now = time.time()
+        # In a write transaction, so no launcher pins a tile between the selection and the removal
+        with self.lock, transaction(self.conn):
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            self.conn.execute("DELETE FROM pins WHERE lease_expires < ?", (now,))
+            self.conn.execute("DELETE FROM in_flight WHERE lease_expires < ?", (now,))
+            for tile, size in self.conn.execute("SELECT hash, size FROM tiles WHERE hash NOT IN (SELECT hash FROM pins) "
+                                                "AND hash NOT IN (SELECT hash FROM in_flight) "
+                                                "ORDER BY last_access").fetchall():
+                if total - freed <= self.max_bytes:
+                    break
+                if os.path.exists(self.tile_path(tile)):
+                    os.remove(self.tile_path(tile))
+                self.conn.execute("DELETE FROM tiles WHERE hash = ?", (tile,))
+                freed += size
+        self.record(evicted_bytes=freed)
+        return freed
+
+    def build_input(self, request, target):
+        """
+        Builds the ERA5 file of a system by slicing its tiles from the cache.
+
+        Parameters:
+        request (dict): The system's ERA5 request, see era5_download.build_era5_request.
+        target (str): Path of the file to write.
+
+        Returns:
+        int: Size of the file written, in bytes.
+        """
+        tiles = sorted(request_tiles(request))
+        with self.lock:
+            self.conn.executemany("UPDATE tiles SET last_access = ? WHERE hash = ?", [(time.time(), tile) for tile in tiles])
+        north, west, south, east = parse_area(request)
+        with NETCDF_LOCK:
+            datasets = []
+            try:
+                for tile in tiles:
+                    datasets.append(xr.open_dataset(self.tile_path(tile)))
+                dataset = xr.combine_by_coords(datasets, combine_attrs='override')
+                dataset = dataset.sel(latitude=slice(north, south), longitude=slice(west, east))
+                dataset.to_netcdf(f'{target}.part')
+            finally:
+                for tile_dataset in datasets:
+                    tile_dataset.close()
+        os.replace(f'{target}.part', target)
+        self.record(bytes_served=os.path.getsize(target))
+        return os.path.getsize(target)
+
+def fetch_tiles(request, cache, credential_pool):
+    """
+    Downloads a merged request (see plan_downloads) with a credential from the pool and stores its tiles.
+    The in-flight marks of its tiles (see ERA5Cache.claim_tiles) are cleared when done, even on failure.
+
+    Returns:
+    int: Size of the downloaded file, in bytes.
+    """
+    family = request_family(request)
+    tiles = {tile_hash(tile_key(family, cell)) for cell in covered_cells(request)}
+    tmp_path = os.path.join(cache.cache_dir, f'download_{threading.get_ident()}_{time.time_ns()}.nc')
+    try:
+        with credential_pool.acquire() as credential:
+            download_era5(request, tmp_path, credential)
+        downloaded_bytes = os.path.getsize(tmp_path)
+        cache.store_download(request, tmp_path)
+        return downloaded_bytes
+    finally:
+        cache.release_tiles(tiles)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def await_tiles(request, tiles, cache, credential_pool, poll_interval=TILE_POLL_INTERVAL):
+    """
+    Waits for tiles of a system that other launchers are downloading. The tiles whose download stops
+    without storing them (it failed, or its launcher stopped renewing its lease) are downloaded here.
+
+    Parameters:
+    request (dict): The system's ERA5 request.
+    tiles (set): Hashes of the tiles to wait for.
+    cache (ERA5Cache): The cache.
+    credential_pool (CredentialPool): Pool of CDS credentials, for the tiles downloaded here.
+    poll_interval (float): Seconds between checks of the cache.
+
+    Returns:
+    int: Number of bytes downloaded here.
+    """
+    while True:
+        missing = tiles - cache.cached_tiles(tiles)
+        if not missing:
+            return 0
+        if not missing & cache.in_flight_tiles():
+            break
+        time.sleep(poll_interval)
+    downloaded_bytes = 0
+    for download in plan_downloads({None: request}, cache):
+        cache.claim_tiles(download['tiles'])
+        downloaded_bytes += fetch_tiles(download['request'], cache, credential_pool)
+    return downloaded_bytes
+
+def timed_build_input(cache, request, target):
+    """
+    Builds the ERA5 file of a system from the cache (see ERA5Cache.build_input).
+
+    Returns:
+    tuple: (size of the file in bytes, time taken in seconds).
+    """
+    start = time.time()
+    size = cache.build_input(request, target)
+    return size, time.time() - start
+
+class DownloadStage:
+    """
+    Download stage of automate_run_LEC.py, on top of the tile cache.
+
+    Systems are admitted in batches: the tiles they miss are planned as merged downloads together with
+    the ones already in flight, and the ERA5 file of a system is built from the cache as soon as all the
+    downloads it waits for are done. The tiles other launchers are downloading are waited for (see
+    await_tiles) like the downloads of this one. Downloads, waits and builds run in separate thread pools.
+
+    The stage also measures, for each system, the time until its tiles are cached, the time taken to
+    write its ERA5 file, and its share of the bytes of the downloads it waited for (see pop_metrics).
+    """
+
+    def __init__(self, cache, credential_pool, download_workers, build_workers=2):
+        self.cache = cache
+        self.credential_pool = credential_pool
+        self.downloader = ThreadPoolExecutor(max_workers=download_workers)
+        self.waiter = ThreadPoolExecutor(max_workers=download_workers)
+        self.builder = ThreadPoolExecutor(max_workers=build_workers)
+        self.requests = {}  # System ID -> ERA5 request, for the systems in the stage
+        self.targets = {}  # System ID -> path of its ERA5 file
+        self.waiting = {}  # System ID -> IDs of the downloads it waits for
+        self.downloads = {}  # Future -> (download ID, tile hashes), for downloads and waits
+        self.builds = {}  # Future -> system ID
+        self.metrics = {}  # System ID -> metrics, see pop_metrics
+        self.download_ids = itertools.count()
+
+    def __len__(self):
+        return len(self.requests)
+
+    def futures(self):
+        """
+        Returns the downloads and builds in progress.
+        """
+        return list(self.downloads) + list(self.builds)
+
+    def shutdown(self):
+        self.downloader.shutdown()
+        self.waiter.shutdown()
+        self.builder.shutdown()
+
+    def admit(self, systems):
+        """
+        Admits a batch of systems into the stage and plans the downloads of their missing tiles.
+
+        Parameters:
+        systems (dict): (track input file, ERA5 file path) of each system ID.
+
+        Returns:
+        list: (system ID, error) of the systems already done: error is None if their ERA5 file is ready.
+        """
+        events, new_requests = [], {}
+        for system_id, (track_file, target) in systems.items():
+            if os.path.exists(target):
+                events.append((system_id, None))
+                continue
+            try:
+                request = build_era5_request(track_file)
+            except Exception as e:
+                events.append((system_id, f"Could not build the ERA5 request: {e}"))
+                continue
+            tiles_cached, tiles_missing = self.cache.count_lookups(request)
+            self.metrics[system_id] = {'admitted_at': time.time(), 'tiles_cached': tiles_cached,
+                                       'tiles_missing': tiles_missing, 'bytes_downloaded': 0}
+            self.cache.pin(request)
+            self.requests[system_id], self.targets[system_id] = request, target
+            new_requests[system_id] = request
+
+        in_flight = set().union(*(tiles for _, tiles in self.downloads.values()))
+        for download in plan_downloads(new_requests, self.cache, in_flight):
+            self.cache.claim_tiles(download['tiles'])
+            future = self.downloader.submit(fetch_tiles, download['request'], self.cache, self.credential_pool)
+            self.downloads[future] = (next(self.download_ids), download['tiles'])
+
+        # A system waits for every download in flight that writes any of its tiles, and for the tiles
+        # other launchers are downloading
+        other_in_flight = self.cache.in_flight_tiles() if new_requests else set()
+        for system_id, request in new_requests.items():
+            tiles = request_tiles(request)
+            other_tiles = tiles & other_in_flight
+            other_tiles -= set().union(*(download_tiles for _, download_tiles in self.downloads.values()))
+            if other_tiles:
+                future = self.waiter.submit(await_tiles, request, other_tiles, self.cache, self.credential_pool)
+                self.downloads[future] = (next(self.download_ids), other_tiles)
+            self.waiting[system_id] = {download_id for download_id, download_tiles in self.downloads.values()
+                                       if tiles & download_tiles}
+            if not self.waiting[system_id]:
+                self.start_build(system_id)
+        return events
+
+    def start_build(self, system_id):
+        del self.waiting[system_id]
+        metrics = self.metrics[system_id]
+        metrics['download_time'] = time.time() - metrics['admitted_at']
+        future = self.builder.submit(timed_build_input, self.cache, self.requests[system_id], self.targets[system_id])
+        self.builds[future] = system_id
+
+    def pop_metrics(self, system_id):
+        """
+        Returns and forgets the metrics of a system that left the stage: download_time, write_time, bytes_downloaded,
+        input_bytes, tiles_cached and tiles_missing, when measured. Empty if its ERA5 file already existed.
+        """
+        metrics = self.metrics.pop(system_id, {})
+        metrics.pop('admitted_at', None)
+        return metrics
+
+    def release(self, system_id):
+        self.cache.unpin(self.requests.pop(system_id))
+        self.targets.pop(system_id)
+        self.waiting.pop(system_id, None)
+
+    def complete(self, future):
+        """
+        Handles a finished download or build.
+
+        Returns:
+        list: (system ID, error) of the systems done as a result: error is None if their ERA5 file is ready.
+        """
+        if future in self.builds:
+            system_id = self.builds.pop(future)
+            self.release(system_id)
+            try:
+                input_bytes, write_time = future.result()
+                self.metrics[system_id].update(input_bytes=input_bytes, write_time=write_time)
+                return [(system_id, None)]
+            except Exception as e:
+                return [(system_id, f"Could not build the ERA5 file from the cache: {e}")]
+
+        download_id, _ = self.downloads.pop(future)
+        error = future.exception()
+        events = []
+        waiting_ids = [system_id for system_id, ids in self.waiting.items() if download_id in ids]
+        for system_id in waiting_ids:
+            if error is None:
+                self.metrics[system_id]['bytes_downloaded'] += future.result() / len(waiting_ids)
+            if error is not None:
+                self.release(system_id)
+                events.append((system_id, f"Download failed: {error}"))
+                continue
+            self.waiting[system_id].discard(download_id)
+            if not self.waiting[system_id]:
+                self.start_build(system_id)
+        return events
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the ERA5 cache statistics.")
+    parser.add_argument('--cache-dir', default=ERA5_CACHE_DIR)
+    args = parser.parse_args()
+
+    for name, value in sorted(ERA5Cache(args.cache_dir).stats().items()):
+        print(f"{name}: {value}")
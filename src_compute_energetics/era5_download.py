@@ -0,0 +1,226 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    era5_download.py                                   :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2026/10/17 17:41:22 by daniloceano       #+#    #+#              #
+#    Updated: 2026/10/17 17:41:22 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+ERA5 download stage of automate_run_LEC.py.
+
+Downloads the ERA5 pressure level data of each system before LEC runs, instead of letting every LEC
+process download it with --cdsapi. Downloads are I/O bound, so they run in threads, separately from
+the CPU-bound LEC runs.
+
+CDS credentials are read from the '~/.cdsapirc-*' files and handed directly to each cdsapi.Client,
+so the shared '~/.cdsapirc' file is never overwritten. A CredentialPool gives each download its own
+credential and enforces per-key limits on concurrent requests and on the interval between requests.
+
+Setting the 'url' of the credential files to a local stand-in server (see cds_standin_server.py)
+runs the whole pipeline offline.
+"""
+
+import os
+import glob
+import math
+import time
+import fcntl
+import hashlib
+import threading
+from contextlib import contextmanager
+from collections import namedtuple
+import pandas as pd
+import requests
+import cdsapi
+
+CDSAPIRC_PATTERN = '~/.cdsapirc-*'
+CDSAPIRC_DEFAULT = '~/.cdsapirc'
+ERA5_DATASET = 'reanalysis-era5-pressure-levels'
+ERA5_VARIABLES = ['u_component_of_wind', 'v_component_of_wind', 'temperature', 'vertical_velocity', 'geopotential']
+ERA5_PRESSURE_LEVELS = ['1', '2', '3', '5', '7', '10', '20', '30', '50', '70', '100', '125', '150', '175', '200',
+                        '225', '250', '300', '350', '400', '450', '500', '550', '600', '650', '700', '750', '775',
+                        '800', '825', '850', '875', '900', '925', '950', '975', '1000']
+TRACK_BUFFER = 15  # Degrees added around the track, as done by LEC with --cdsapi
+MIN_TIME_STEP = 3  # Hours
+MAX_REQUESTS_PER_KEY = 1  # Concurrent requests per CDS key
+MIN_REQUEST_INTERVAL = 0  # Seconds between the start of two requests with the same key
+KEY_LOCK_POLL = 1  # Seconds between two checks for a key slot held by another launcher
+
+Credential = namedtuple('Credential', ['name', 'url', 'key'])
+
+def read_cdsapirc(filepath):
+    """
+    Reads the url and key of a .cdsapirc file.
+
+    Returns:
+    Credential: The credential, named after the file.
+    """
+    config = {}
+    with open(filepath) as f:
+        for line in f:
+            if ':' in line:
+                name, value = line.strip().split(':', 1)
+                config[name.strip()] = value.strip()
+    return Credential(os.path.basename(filepath), config['url'], config['key'])
+
+def read_cdsapi_credentials(pattern=CDSAPIRC_PATTERN, default=CDSAPIRC_DEFAULT):
+    """
+    Reads all the CDS credentials matching the pattern, or the default '~/.cdsapirc' if there are none.
+
+    Returns:
+    list: The credentials.
+    """
+    files = sorted(glob.glob(os.path.expanduser(pattern)))
+    if not files and os.path.exists(os.path.expanduser(default)):
+        files = [os.path.expanduser(default)]
+    return [read_cdsapirc(filepath) for filepath in files]
+
+class CredentialPool:
+    """
+    Hands out CDS credentials to concurrent downloads, with at most 'max_requests_per_key' requests in
+    flight per key and at least 'min_interval' seconds between the start of two requests with the same key.
+    Thread-safe.
+
+    With a lock_dir, the requests in flight are also counted across processes: each request holds one of
+    the 'max_requests_per_key' slots of its key, an exclusive lock on a file of lock_dir, so launchers
+    sharing lock_dir never exceed the limit together. The minimum interval is only enforced per pool.
+    """
+
+    def __init__(self, credentials, max_requests_per_key=MAX_REQUESTS_PER_KEY, min_interval=MIN_REQUEST_INTERVAL,
+                 lock_dir=None):
+        if not credentials:
+            raise ValueError("No CDS credentials available")
+        self.credentials = list(credentials)
+        self.max_requests_per_key = max_requests_per_key
+        self.min_interval = min_interval
+        self.lock_dir = lock_dir
+        if lock_dir is not None:
+            os.makedirs(lock_dir, exist_ok=True)
+        self.in_use = {credential.name: 0 for credential in self.credentials}
+        self.last_start = {credential.name: -math.inf for credential in self.credentials}
+        self.condition = threading.Condition()
+
+    def _lock_slot(self, credential):
+        """
+        Takes a free slot of a key in lock_dir. Returns the open lock file, or None if all slots are taken.
+        """
+        key_hash = hashlib.sha256(credential.key.encode()).hexdigest()[:16]
+        for slot in range(self.max_requests_per_key):
+            lock_file = open(os.path.join(self.lock_dir, f'{key_hash}.{slot}.lock'), 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return lock_file
+            except BlockingIOError:
+                lock_file.close()
+        return None
+
+    def _next_available(self, now):
+        """
+        Returns the least used credential that can start a request now, or None, its slot lock file,
+        and the time until one can.
+        """
+        wait_time = None
+        for credential in sorted(self.credentials, key=lambda c: (self.in_use[c.name], self.last_start[c.name])):
+            if self.in_use[credential.name] >= self.max_requests_per_key:
+                continue
+            remaining = self.last_start[credential.name] + self.min_interval - now
+            if remaining > 0:
+                wait_time = remaining if wait_time is None else min(wait_time, remaining)
+                continue
+            if self.lock_dir is None:
+                return credential, None, None
+            lock_file = self._lock_slot(credential)
+            if lock_file is not None:
+                return credential, lock_file, None
+            # Slots held by other launchers are released without notifying this pool
+            wait_time = KEY_LOCK_POLL if wait_time is None else min(wait_time, KEY_LOCK_POLL)
+        return None, None, wait_time
+
+    @contextmanager
+    def acquire(self):
+        """
+        Blocks until a credential can be used, and yields it for the duration of one request.
+        """
+        with self.condition:
+            while True:
+                credential, lock_file, wait_time = self._next_available(time.monotonic())
+                if credential is not None:
+                    break
+                self.condition.wait(wait_time)
+            self.in_use[credential.name] += 1
+            self.last_start[credential.name] = time.monotonic()
+        try:
+            yield credential
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+            with self.condition:
+                self.in_use[credential.name] -= 1
+                self.condition.notify_all()
+
+def build_era5_request(track_file):
+    """
+    Builds the ERA5 request of a system from its LEC track input file, with the same domain,
+    period, time step, levels and variables as LEC uses with --cdsapi.
+
+    Parameters:
+    track_file (str): Path to the LEC track input file (columns time;Lat;Lon;min_max_zeta_850).
+
+    Returns:
+    dict: The cdsapi request.
+    """
+    return era5_request(pd.read_csv(track_file, sep=';', parse_dates=['time']))
+
+def era5_request(track):
+    """
+    Builds the ERA5 request of a system from its track, see build_era5_request.
+
+    Parameters:
+    track (DataFrame): Track with 'time' (datetime), 'Lat' and 'Lon' columns.
+
+    Returns:
+    dict: The cdsapi request.
+    """
+    track = track.sort_values('time')
+    area = [math.ceil(track['Lat'].max() + TRACK_BUFFER), math.floor(track['Lon'].min() - TRACK_BUFFER),
+            math.floor(track['Lat'].min() - TRACK_BUFFER), math.ceil(track['Lon'].max() + TRACK_BUFFER)]
+    time_step = MIN_TIME_STEP
+    if len(track) > 1:
+        time_step = max(MIN_TIME_STEP, int((track['time'].iloc[1] - track['time'].iloc[0]).total_seconds() // 3600))
+    return {
+        'product_type': 'reanalysis',
+        'variable': ERA5_VARIABLES,
+        'pressure_level': ERA5_PRESSURE_LEVELS,
+        'date': f"{track['time'].iloc[0]:%Y%m%d}/{track['time'].iloc[-1]:%Y%m%d}",
+        'area': '/'.join(str(value) for value in area),
+        'time': f'00/to/23/by/{time_step}',
+        'format': 'netcdf',
+    }
+
+def download_era5(request, target, credential, dataset=ERA5_DATASET):
+    """
+    Downloads an ERA5 request with the given credential. The file is written under a temporary name
+    and moved into place once complete, so an interrupted download never looks finished.
+
+    Parameters:
+    request (dict): The cdsapi request, see build_era5_request.
+    target (str): Path of the downloaded file.
+    credential (Credential): The CDS credential to use.
+    dataset (str): The CDS dataset.
+
+    Returns:
+    int: Size of the downloaded file, in bytes.
+    """
+    # Each client gets its own session: cdsapi's default session is shared by all clients and
+    # holds the authentication of the last one created.
+    client = cdsapi.Client(url=credential.url, key=credential.key, quiet=True, progress=False,
+                           session=requests.Session())
+    tmp_target = f"{target}.part"
+    client.retrieve(dataset, request, tmp_target)
+    os.replace(tmp_target, target)
+    return os.path.getsize(target)
@@ -0,0 +1,122 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    job_costs.py                                       :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2026/10/17 19:24:50 by daniloceano       #+#    #+#              #
+#    Updated: 2026/10/17 19:24:50 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Run time and memory estimates of the LEC jobs launched by automate_run_LEC.py.
+
+The cost of a LEC run grows with the number of time steps of the track and with the area of its ERA5
+domain (the track's bounding box plus the buffer LEC adds around it). Both are combined into a single
+'work' measure, time steps x area. Until enough jobs have completed, run times are estimated from a rough
+prior and memory from a fixed default; afterwards, both are fitted on the observed run times and peak
+memory of the completed jobs of all regions.
+
+The estimates are used to dispatch the longest jobs first and to admit new LEC runs only while their
+estimated peak memory fits in the available memory.
+"""
+
+import numpy as np
+import pandas as pd
+from era5_download import TRACK_BUFFER
+from job_database import job_history, set_job_estimates
+
+MIN_OBSERVATIONS = 5  # Completed jobs needed before the estimates are fitted on observations
+PRIOR_SECONDS_PER_WORK = 0.004  # Rough prior: about 10 minutes for a median system (68 steps, 45 x 50 degrees)
+DEFAULT_JOB_MEMORY = 4 * 2**30  # Bytes, assumed peak memory of a LEC run before any has been observed
+MEMORY_MARGIN = 1.2  # Safety factor applied to the fitted peak memory
+
+def track_features(tracks):
+    """
+    Computes the features the cost of each job is estimated from, in a single grouped pass.
+
+    Parameters:
+    tracks (DataFrame): Tracks with 'track_id', 'lat vor' and 'lon vor' columns.
+
+    Returns:
+    DataFrame: Indexed by system_id, with the number of 'time_steps' and the 'area' of the ERA5 domain in square degrees.
+    """
+    grouped = tracks.groupby('track_id')
+    features = pd.DataFrame({
+        'time_steps': grouped.size(),
+        'area': ((grouped['lat vor'].max() - grouped['lat vor'].min() + 2 * TRACK_BUFFER)
+                 * (grouped['lon vor'].max() - grouped['lon vor'].min() + 2 * TRACK_BUFFER)),
+    })
+    features.index.name = 'system_id'
+    return features
+
+def job_work(features):
+    """
+    Returns the work measure of jobs: time steps x area of the ERA5 domain.
+    """
+    return features['time_steps'].astype(float) * features['area'].astype(float)
+
+def fit_linear(work, observed):
+    """
+    Fits observed = slope * work + intercept by least squares, with a non-negative slope.
+
+    Returns:
+    tuple: (slope, intercept).
+    """
+    if work.nunique() < 2:
+        return 0.0, float(observed.mean())
+    slope, intercept = np.polyfit(work, observed, 1)
+    if slope < 0:
+        return 0.0, float(observed.mean())
+    return float(slope), float(intercept)
+
+def estimate_jobs(features, history, default_memory=DEFAULT_JOB_MEMORY):
+    """
+    Estimates the LEC run time and peak memory of jobs.
+
+    Parameters:
+    features (DataFrame): Indexed by system_id, with 'time_steps' and 'area' columns.
+    history (DataFrame): Completed jobs, with 'time_steps', 'area', 'compute_time' and 'peak_rss' columns
+                         (see job_database.job_history).
+    default_memory (float): Peak memory assumed before enough runs have been observed, in bytes.
+
+    Returns:
+    DataFrame: Indexed by system_id, with 'estimated_time' (seconds) and 'estimated_rss' (bytes) columns.
+    """
+    work = job_work(features)
+    history = history.dropna(subset=['time_steps', 'area'])
+    history_work = job_work(history)
+
+    timed = history['compute_time'].notna()
+    if timed.sum() >= MIN_OBSERVATIONS:
+        slope, intercept = fit_linear(history_work[timed], history['compute_time'][timed])
+        estimated_time = (slope * work + intercept).clip(lower=history['compute_time'][timed].min())
+    else:
+        estimated_time = PRIOR_SECONDS_PER_WORK * work
+
+    measured = history['peak_rss'].notna()
+    if measured.sum() >= MIN_OBSERVATIONS:
+        slope, intercept = fit_linear(history_work[measured], history['peak_rss'][measured])
+        estimated_rss = MEMORY_MARGIN * (slope * work + intercept).clip(lower=history['peak_rss'][measured].min())
+    else:
+        estimated_rss = pd.Series(float(default_memory), index=features.index)
+
+    return pd.DataFrame({'estimated_time': estimated_time, 'estimated_rss': estimated_rss})
+
+def update_job_estimates(conn, features, default_memory=DEFAULT_JOB_MEMORY):
+    """
+    Re-estimates the run time and peak memory of jobs from the jobs completed so far, and stores them.
+
+    Parameters:
+    conn (sqlite3.Connection): Job database connection.
+    features (DataFrame): Features of the jobs to estimate, see track_features.
+    default_memory (float): Peak memory assumed before enough runs have been observed, in bytes.
+
+    Returns:
+    DataFrame: The estimates, see estimate_jobs.
+    """
+    estimates = estimate_jobs(features, job_history(conn), default_memory)
+    set_job_estimates(conn, estimates)
+    return estimates
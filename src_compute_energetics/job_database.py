@@ -0,0 +1,370 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    job_database.py                                    :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2026/10/17 17:12:05 by daniloceano       #+#    #+#              #
+#    Updated: 2026/10/17 17:12:05 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Persistent job table for the LEC runs launched by automate_run_LEC.py.
+
+Stores one row per system with its state, number of attempts, timings, exit code and error of the
+last attempt, in a SQLite database. Progress is read from this table instead of from the LEC results
+directory, so a crashed LEC run is recorded as failed instead of looking like one that never started,
+and a campaign can be resumed, retried or reported on with a single query.
+
+Several launchers, on one host or on several hosts sharing the database file, can work on the same
+region: each one claims jobs atomically (claim_jobs) and holds a lease on them, which it renews while
+it is alive (renew_leases). Jobs whose lease expired, because their launcher crashed or was killed,
+are reclaimed by the other launchers (reclaim_expired_leases) and retried.
+
+Job states:
+- pending: not run yet.
+- running: an attempt is in progress, by the launcher in 'owner', until 'lease_expires' unless renewed.
+- completed: LEC finished with exit code 0.
+- failed: the last attempt failed. It is retried after 'next_attempt_at', until 'max_attempts' is reached.
+
+Usage:
+- python job_database.py --region ARG
+"""
+
+import os
+import time
+import sqlite3
+import argparse
+from contextlib import contextmanager
+import pandas as pd
+
+JOB_DATABASE = '../LEC_jobs.sqlite'
+PENDING = 'pending'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+RETRY_DELAY = 60  # Seconds before the first retry, doubled after every failed attempt
+MAX_RETRY_DELAY = 3600
+LEASE_DURATION = 600  # Seconds a claimed job stays leased to its launcher without being renewed
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    system_id INTEGER PRIMARY KEY,
+    region TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    duration REAL,
+    exit_code INTEGER,
+    error TEXT,
+    next_attempt_at REAL,
+    time_steps INTEGER,
+    area REAL,
+    compute_time REAL,
+    peak_rss REAL,
+    estimated_time REAL,
+    estimated_rss REAL,
+    owner TEXT,
+    lease_expires REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_region_state ON jobs (region, state);
+"""
+
+# Columns added after the first version of the table, created in older databases when they are opened
+ADDED_COLUMNS = {'time_steps': 'INTEGER', 'area': 'REAL', 'compute_time': 'REAL', 'peak_rss': 'REAL',
+                 'estimated_time': 'REAL', 'estimated_rss': 'REAL', 'owner': 'TEXT', 'lease_expires': 'REAL'}
+
+def connect_job_database(database_path=JOB_DATABASE, journal_mode='WAL', read_only=False):
+    """
+    Opens the job database, creating the jobs table if needed.
+
+    Parameters:
+    database_path (str): Path to the SQLite file.
+    journal_mode (str): SQLite journal mode. WAL only works for launchers on the same host: launchers
+                        on several hosts sharing the file over a network filesystem must use DELETE.
+    read_only (bool): Open an existing database without writing to it, e.g. for planning.
+
+    Returns:
+    sqlite3.Connection: Connection in autocommit mode.
+    """
+    if read_only:
+        return sqlite3.connect(f'file:{database_path}?mode=ro', uri=True, isolation_level=None, timeout=60)
+    conn = sqlite3.connect(database_path, isolation_level=None, timeout=60)
+    conn.execute(f'PRAGMA journal_mode={journal_mode}')
+    conn.executescript(SCHEMA)
+    with transaction(conn):
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+    return conn
+
+@contextmanager
+def transaction(conn):
+    """
+    Runs a block in a write transaction, so that no other launcher writes the database in between.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def register_jobs(conn, system_ids, region):
+    """
+    Adds the systems that are not in the table yet as pending jobs. Existing jobs are left untouched.
+
+    Returns:
+    list: System IDs of the jobs added. When several launchers register the same systems, only one gets each ID.
+    """
+    with transaction(conn):
+        known = {row[0] for row in conn.execute("SELECT system_id FROM jobs")}
+        new_ids = [int(system_id) for system_id in system_ids if int(system_id) not in known]
+        now = time.time()
+        conn.executemany("INSERT INTO jobs (system_id, region, created_at) VALUES (?, ?, ?)",
+                         [(system_id, region, now) for system_id in new_ids])
+    return new_ids
+
+def set_job_features(conn, features):
+    """
+    Stores the features the cost of each job is estimated from (see job_costs.track_features).
+
+    Parameters:
+    conn (sqlite3.Connection): Job database connection.
+    features (DataFrame): Indexed by system_id, with 'time_steps' and 'area' columns.
+    """
+    conn.executemany("UPDATE jobs SET time_steps = ?, area = ? WHERE system_id = ?",
+                     [(int(row.time_steps), float(row.area), int(system_id)) for system_id, row in features.iterrows()])
+
+def set_job_estimates(conn, estimates):
+    """
+    Stores the estimated LEC run time and peak memory of jobs.
+
+    Parameters:
+    conn (sqlite3.Connection): Job database connection.
+    estimates (DataFrame): Indexed by system_id, with 'estimated_time' (seconds) and 'estimated_rss' (bytes) columns.
+    """
+    conn.executemany("UPDATE jobs SET estimated_time = ?, estimated_rss = ? WHERE system_id = ?",
+                     [(float(row.estimated_time), float(row.estimated_rss), int(system_id))
+                      for system_id, row in estimates.iterrows()])
+
+def job_estimates(conn, region):
+    """
+    Returns the estimated LEC run time and peak memory of the jobs of a region.
+
+    Returns:
+    dict: (estimated time, estimated peak RSS) of each system ID. Unknown values are None.
+    """
+    rows = conn.execute("SELECT system_id, estimated_time, estimated_rss FROM jobs WHERE region = ?", (region,)).fetchall()
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+def mark_completed(conn, system_ids):
+    """
+    Marks systems as completed without running them, e.g. when importing results computed before the job table existed.
+    """
+    conn.executemany("UPDATE jobs SET state = ?, exit_code = 0, error = NULL, next_attempt_at = NULL WHERE system_id = ?",
+                     [(COMPLETED, int(system_id)) for system_id in system_ids])
+
+def reclaim_expired_leases(conn, region, dead_owners=(), now=None):
+    """
+    Marks the jobs left running by a launcher that stopped (crash, kill, reboot) as failed, so they are
+    retried: jobs whose lease expired, or was never set, and jobs of the launchers known to be dead.
+
+    Parameters:
+    conn (sqlite3.Connection): Job database connection.
+    region (str): Region of the jobs.
+    dead_owners (iterable): Launchers known to have stopped, whose jobs are reclaimed without waiting for their lease.
+    now (float): Current time. Defaults to now.
+
+    Returns:
+    int: Number of reclaimed jobs.
+    """
+    now = time.time() if now is None else now
+    dead_owners = list(dead_owners)
+    cursor = conn.execute("UPDATE jobs SET state = ?, error = 'Interrupted: the launcher ' || COALESCE(owner, '') || "
+                          "' stopped during this attempt', next_attempt_at = ?, owner = NULL, lease_expires = NULL "
+                          f"WHERE region = ? AND state = ? AND (COALESCE(lease_expires, 0) < ? "
+                          f"OR owner IN ({', '.join('?' * len(dead_owners))}))",
+                          (FAILED, now, region, RUNNING, now, *dead_owners))
+    return cursor.rowcount
+
+def lease_owners(conn, region):
+    """
+    Returns the launchers that hold running jobs of a region.
+    """
+    rows = conn.execute("SELECT DISTINCT owner FROM jobs WHERE region = ? AND state = ? AND owner IS NOT NULL",
+                        (region, RUNNING)).fetchall()
+    return [row[0] for row in rows]
+
+def next_jobs(conn, region, limit, max_attempts, now=None):
+    """
+    Returns the jobs that can be started now: pending jobs, and failed jobs whose retry delay has passed
+    and that have attempts left.
+
+    Returns:
+    list: System IDs, pending jobs first, longest estimated run time first.
+    """
+    now = time.time() if now is None else now
+    rows = conn.execute("SELECT system_id FROM jobs WHERE region = ? AND (state = ? OR (state = ? AND attempts < ? "
+                        "AND next_attempt_at <= ?)) ORDER BY state = ?, COALESCE(estimated_time, 0) DESC, system_id LIMIT ?",
+                        (region, PENDING, FAILED, max_attempts, now, FAILED, limit)).fetchall()
+    return [row[0] for row in rows]
+
+def next_retry_time(conn, region, max_attempts):
+    """
+    Returns the earliest time at which a failed job can be retried, or None if no job is waiting for a retry.
+    """
+    return conn.execute("SELECT MIN(next_attempt_at) FROM jobs WHERE region = ? AND state = ? AND attempts < ?",
+                        (region, FAILED, max_attempts)).fetchone()[0]
+
+def count_remaining_jobs(conn, region, max_attempts):
+    """
+    Counts the jobs that still have to run: pending, running, and failed with attempts left.
+    """
+    return conn.execute("SELECT COUNT(*) FROM jobs WHERE region = ? AND (state IN (?, ?) OR (state = ? AND attempts < ?))",
+                        (region, PENDING, RUNNING, FAILED, max_attempts)).fetchone()[0]
+
+def recent_completions(conn, region, since, limit):
+    """
+    Lists the finishing times of the last LEC runs completed since a given time, by any launcher, in order.
+    Jobs marked as completed without running LEC are left out.
+    """
+    rows = conn.execute("SELECT finished_at FROM jobs WHERE region = ? AND state = ? AND compute_time IS NOT NULL "
+                        "AND finished_at >= ? ORDER BY finished_at DESC LIMIT ?",
+                        (region, COMPLETED, since, limit)).fetchall()
+    return [row[0] for row in reversed(rows)]
+
+def skipped_jobs(conn, region, max_attempts):
+    """
+    Lists the jobs a run will not attempt, with the reason: 'completed', or 'out_of_attempts' for failed
+    jobs that used all their attempts.
+    """
+    return conn.execute("SELECT system_id, CASE state WHEN ? THEN 'completed' ELSE 'out_of_attempts' END FROM jobs "
+                        "WHERE region = ? AND (state = ? OR (state = ? AND attempts >= ?)) ORDER BY system_id",
+                        (COMPLETED, region, COMPLETED, FAILED, max_attempts)).fetchall()
+
+def start_job(conn, system_id, owner=None, lease_expires=None):
+    """
+    Marks a job as running, leased to owner until lease_expires, and counts the attempt. Returns the attempt number.
+    """
+    conn.execute("UPDATE jobs SET state = ?, attempts = attempts + 1, started_at = ?, finished_at = NULL, "
+                 "duration = NULL, next_attempt_at = NULL, owner = ?, lease_expires = ? WHERE system_id = ?",
+                 (RUNNING, time.time(), owner, lease_expires, int(system_id)))
+    row = conn.execute("SELECT attempts FROM jobs WHERE system_id = ?", (int(system_id),)).fetchone()
+    return row[0] if row else None
+
+def claim_jobs(conn, region, limit, max_attempts, owner, lease_duration=LEASE_DURATION, now=None):
+    """
+    Atomically selects the next jobs that can be started (see next_jobs) and starts them, leased to owner.
+    Launchers claiming concurrently never get the same job.
+
+    Returns:
+    list: (system ID, attempt number) of the claimed jobs.
+    """
+    now = time.time() if now is None else now
+    with transaction(conn):
+        return [(system_id, start_job(conn, system_id, owner, now + lease_duration))
+                for system_id in next_jobs(conn, region, limit, max_attempts, now)]
+
+def renew_leases(conn, owner, lease_duration=LEASE_DURATION):
+    """
+    Extends the lease of the running jobs of owner. Returns the number of jobs renewed.
+    """
+    return conn.execute("UPDATE jobs SET lease_expires = ? WHERE owner = ? AND state = ?",
+                        (time.time() + lease_duration, owner, RUNNING)).rowcount
+
+def finish_job(conn, system_id, exit_code, error=None, started_at=None, finished_at=None,
+               retry_delay=RETRY_DELAY, max_retry_delay=MAX_RETRY_DELAY, compute_time=None, peak_rss=None, owner=None):
+    """
+    Records the outcome of an attempt: completed if LEC exited with code 0 and no error was reported,
+    failed otherwise. A failed job gets an exponential backoff before its next attempt.
+
+    Parameters:
+    conn (sqlite3.Connection): Job database connection.
+    system_id (int): System ID.
+    exit_code (int): Exit code of the LEC run. None if it could not be started.
+    error (str): Error message, or the end of the LEC standard error.
+    started_at (float): Start time of the attempt. Defaults to the time recorded by start_job.
+    finished_at (float): End time of the attempt. Defaults to now.
+    retry_delay (float): Delay before the first retry, in seconds, doubled at every further attempt.
+    max_retry_delay (float): Upper bound of the retry delay, in seconds.
+    compute_time (float): Run time of LEC itself, in seconds, without the time spent in the download stage.
+    peak_rss (float): Peak resident memory of the LEC process, in bytes.
+    owner (str): Launcher that ran the attempt. If the job has been reclaimed by another launcher since, it is left untouched.
+
+    Returns:
+    bool: False if the job was not updated because owner lost its lease, True otherwise.
+    """
+    finished_at = time.time() if finished_at is None else finished_at
+    with transaction(conn):
+        if owner is not None:
+            row = conn.execute("SELECT state, owner FROM jobs WHERE system_id = ?", (int(system_id),)).fetchone()
+            if row is None or row != (RUNNING, owner):
+                return False
+        conn.execute("UPDATE jobs SET compute_time = ?, peak_rss = ?, owner = NULL, lease_expires = NULL WHERE system_id = ?",
+                     (compute_time, peak_rss, int(system_id)))
+        if exit_code == 0 and error is None:
+            conn.execute("UPDATE jobs SET state = ?, started_at = COALESCE(?, started_at), finished_at = ?, "
+                         "duration = ? - COALESCE(?, started_at), exit_code = 0, error = NULL WHERE system_id = ?",
+                         (COMPLETED, started_at, finished_at, finished_at, started_at, int(system_id)))
+            return True
+        attempts = conn.execute("SELECT attempts FROM jobs WHERE system_id = ?", (int(system_id),)).fetchone()[0]
+        delay = min(retry_delay * 2 ** max(attempts - 1, 0), max_retry_delay)
+        conn.execute("UPDATE jobs SET state = ?, started_at = COALESCE(?, started_at), finished_at = ?, "
+                     "duration = ? - COALESCE(?, started_at), exit_code = ?, error = ?, next_attempt_at = ? WHERE system_id = ?",
+                     (FAILED, started_at, finished_at, finished_at, started_at, exit_code, error,
+                      finished_at + delay, int(system_id)))
+    return True
+
+def job_history(conn):
+    """
+    Returns the features, LEC run time and peak memory of the completed jobs of all regions.
+    """
+    return pd.read_sql_query("SELECT system_id, region, time_steps, area, compute_time, peak_rss FROM jobs "
+                             "WHERE state = ? AND compute_time IS NOT NULL", conn, params=(COMPLETED,))
+
+def job_report(conn, region=None):
+    """
+    Summarizes the jobs by region and state in a single query.
+
+    Returns:
+    DataFrame: Number of jobs, attempts and mean and total duration of the last attempt per region and state.
+    """
+    query = ("SELECT region, state, COUNT(*) AS jobs, SUM(attempts) AS attempts, AVG(duration) AS mean_duration, "
+             "SUM(duration) AS total_duration FROM jobs {} GROUP BY region, state ORDER BY region, state")
+    if region is None:
+        return pd.read_sql_query(query.format(''), conn)
+    return pd.read_sql_query(query.format('WHERE region = ?'), conn, params=(region,))
+
+def failed_jobs(conn, region=None):
+    """
+    Lists the failed jobs with their attempts, exit code and error.
+    """
+    query = "SELECT system_id, region, attempts, exit_code, error, finished_at FROM jobs WHERE state = ?"
+    params = (FAILED,)
+    if region is not None:
+        query += " AND region = ?"
+        params += (region,)
+    failed = pd.read_sql_query(query + " ORDER BY system_id", conn, params=params)
+    failed['finished_at'] = pd.to_datetime(failed['finished_at'], unit='s')
+    return failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report on the LEC job database.")
+    parser.add_argument('--database', default=JOB_DATABASE, help="Path to the job database.")
+    parser.add_argument('--region', help="Only report on this region.")
+    parser.add_argument('--failed', action='store_true', help="List the failed jobs and their errors.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.database):
+        raise SystemExit(f"Job database not found: {args.database}")
+    conn = connect_job_database(args.database)
+    print(job_report(conn, args.region).to_string(index=False))
+    if args.failed:
+        print(failed_jobs(conn, args.region).to_string(index=False))
@@ -0,0 +1,363 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    land_mask.py                                       :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2026/10/17 11:03:27 by daniloceano       #+#    #+#              #
+#    Updated: 2026/10/17 11:03:27 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Land membership of track points.
+
+Determines which track positions lie over the continent, using the Natural Earth land polygons.
+The land geometry is split into its individual polygons, prepared and indexed with an STRtree once,
+so all track points can be tested in a single bulk query. The share of time steps spent over land
+is then computed per track with a single groupby, giving a reusable table of land fractions.
+
+For faster lookups, the land polygons can also be rasterized once into a regular lon/lat mask, saved as a
+memory-mapped .npy file next to the shapefile. Points are then looked up by index arithmetic, and only
+points falling in coastline cells (partly land, partly water) fall back to the exact polygon test.
+compare_land_methods reports how much the raster lookup disagrees with the exact method.
+
+compute_land_fractions_parallel splits the work across processes without pickling the tracks: the
+lon/lat/track_id columns are placed once in shared memory and each task only receives a row-offset range.
+"""
+
+import os
+from multiprocessing import Pool, shared_memory
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+CONTINENT_SHAPEFILE = '../natural_earth_continents/ne_50m_land.shp'
+LAND_MASK_RESOLUTION = 0.25  # Degrees, the ERA5 grid spacing
+
+# Land mask cell codes
+WATER = 0
+LAND = 1
+COAST_WATER = 2  # Cell partly over land, with its center over water
+COAST_LAND = 3  # Cell partly over land, with its center over land
+
+def build_land_index(continent_gdf):
+    """
+    Builds the spatial index used for land membership tests.
+
+    Parameters:
+    continent_gdf (GeoDataFrame): Land polygons (e.g. ne_50m_land.shp).
+
+    Returns:
+    shapely.STRtree: Tree over the prepared land polygons.
+    """
+    polygons = shapely.get_parts(np.asarray(continent_gdf.geometry.values, dtype=object))
+    shapely.prepare(polygons)
+    return shapely.STRtree(polygons)
+
+def points_on_land(lon, lat, land_index):
+    """
+    Tests which points lie within the land polygons, in a single bulk query.
+
+    Parameters:
+    lon (array-like): Longitudes of the points, in the -180 to 180 range.
+    lat (array-like): Latitudes of the points.
+    land_index (shapely.STRtree): Tree built by build_land_index.
+
+    Returns:
+    np.ndarray: Boolean array, True where the point is over land.
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    # Bounding box candidates from the tree, then one vectorized test against the prepared polygons
+    point_indices, polygon_indices = land_index.query(shapely.points(lon, lat))
+    inside = shapely.contains_xy(land_index.geometries[polygon_indices], lon[point_indices], lat[point_indices])
+    on_land = np.zeros(len(lon), dtype=bool)
+    on_land[point_indices[inside]] = True
+    return on_land
+
+def compute_land_fractions(tracks, land_index, land_mask=None):
+    """
+    Computes, for every track, the number of time steps and the percentage of them spent over land.
+
+    Parameters:
+    tracks (DataFrame): Track data with 'track_id', 'lon vor' and 'lat vor' columns.
+    land_index (shapely.STRtree): Tree built by build_land_index. With a land mask, it is only
+                                  used for points in coastline cells and can be None to skip them.
+    land_mask (np.ndarray): Mask built by rasterize_land_mask. If given, points are looked up in the mask.
+
+    Returns:
+    DataFrame: Indexed by track_id, with columns 'time_steps', 'land_steps' and 'land_percentage'.
+    """
+    if land_mask is not None:
+        on_land = points_on_land_raster(tracks['lon vor'], tracks['lat vor'], land_mask, land_index)
+    else:
+        on_land = points_on_land(tracks['lon vor'], tracks['lat vor'], land_index)
+    land_fractions = pd.DataFrame({'track_id': tracks['track_id'].values, 'on_land': on_land}).groupby(
+        'track_id', sort=False)['on_land'].agg(time_steps='size', land_steps='sum')
+    land_fractions['land_percentage'] = land_fractions['land_steps'] / land_fractions['time_steps'] * 100
+    return land_fractions
+
+def land_mask_path(resolution=LAND_MASK_RESOLUTION, shapefile=CONTINENT_SHAPEFILE):
+    """
+    Returns the path of the rasterized land mask for a given resolution, next to the shapefile.
+    """
+    return f"{os.path.splitext(shapefile)[0]}_mask_{resolution:g}deg.npy"
+
+def rasterize_land_mask(continent_gdf, resolution=LAND_MASK_RESOLUTION, mask_path=None):
+    """
+    Rasterizes the land polygons onto a global regular grid and saves it as a .npy file.
+    Row i, column j is the cell with its south-west corner at (-180 + j * resolution, -90 + i * resolution).
+    Each cell is coded as WATER, LAND, COAST_WATER or COAST_LAND.
+
+    Parameters:
+    continent_gdf (GeoDataFrame): Land polygons.
+    resolution (float): Grid spacing in degrees. Must divide 180.
+    mask_path (str): Output path. Defaults to land_mask_path(resolution).
+
+    Returns:
+    np.memmap: The land mask, memory-mapped read-only.
+    """
+    mask_path = mask_path or land_mask_path(resolution)
+    n_lat, n_lon = int(round(180 / resolution)), int(round(360 / resolution))
+    if not np.isclose(n_lat * resolution, 180):
+        raise ValueError(f"Resolution {resolution} does not divide 180 degrees")
+    land_index = build_land_index(continent_gdf)
+
+    # Coastline cells: every cell crossed by a polygon boundary. Boundaries are densified to half a cell
+    # so no crossed cell is skipped between vertices, and the result is dilated by one cell to also
+    # catch boundaries that only clip a cell corner.
+    boundaries = shapely.segmentize(shapely.boundary(land_index.geometries), resolution / 2)
+    coordinates = shapely.get_coordinates(boundaries)
+    coast = np.zeros((n_lat, n_lon), dtype=bool)
+    coast[np.clip(((coordinates[:, 1] + 90) // resolution).astype(np.int64), 0, n_lat - 1),
+          np.clip(((coordinates[:, 0] + 180) // resolution).astype(np.int64), 0, n_lon - 1)] = True
+    dilated = coast.copy()
+    for row_shift in (-1, 0, 1):
+        for col_shift in (-1, 0, 1):
+            shifted = np.roll(coast, col_shift, axis=1)  # Longitude wraps around
+            if row_shift > 0:
+                dilated[1:] |= shifted[:-1]
+            elif row_shift < 0:
+                dilated[:-1] |= shifted[1:]
+            else:
+                dilated |= shifted
+
+    tmp_path = mask_path + '.tmp.npy'
+    land_mask = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=(n_lat, n_lon))
+    lon_center = -180 + resolution * (np.arange(n_lon) + 0.5)
+    # Classify cell centers one latitude row at a time to keep memory bounded at fine resolutions
+    for row in range(n_lat):
+        lat_center = np.full(n_lon, -90 + resolution * (row + 0.5))
+        center_on_land = points_on_land(lon_center, lat_center, land_index)
+        land_mask[row] = np.where(dilated[row],
+                                  np.where(center_on_land, COAST_LAND, COAST_WATER),
+                                  np.where(center_on_land, LAND, WATER))
+    land_mask.flush()
+    del land_mask
+    os.replace(tmp_path, mask_path)
+    return np.load(mask_path, mmap_mode='r')
+
+def load_land_mask(continent_gdf, resolution=LAND_MASK_RESOLUTION, mask_path=None):
+    """
+    Loads the rasterized land mask as a memory-mapped array, rasterizing it first if needed.
+
+    Parameters:
+    continent_gdf (GeoDataFrame): Land polygons, only used if the mask has to be built.
+    resolution (float): Grid spacing in degrees.
+    mask_path (str): Path of the mask. Defaults to land_mask_path(resolution).
+
+    Returns:
+    np.memmap: The land mask, memory-mapped read-only.
+    """
+    mask_path = mask_path or land_mask_path(resolution)
+    if os.path.exists(mask_path):
+        return np.load(mask_path, mmap_mode='r')
+    return rasterize_land_mask(continent_gdf, resolution, mask_path)
+
+def lookup_land_mask(lon, lat, land_mask):
+    """
+    Looks up the land mask codes of points by index arithmetic on the regular grid.
+
+    Parameters:
+    lon (array-like): Longitudes of the points, in the -180 to 180 range.
+    lat (array-like): Latitudes of the points.
+    land_mask (np.ndarray): Mask built by rasterize_land_mask.
+
+    Returns:
+    np.ndarray: The cell code of each point.
+    """
+    n_lat, n_lon = land_mask.shape
+    resolution = 360 / n_lon
+    rows = np.clip(((np.asarray(lat, dtype=float) + 90) // resolution).astype(np.int64), 0, n_lat - 1)
+    cols = np.clip(((np.asarray(lon, dtype=float) + 180) // resolution).astype(np.int64), 0, n_lon - 1)
+    return land_mask[rows, cols]
+
+def points_on_land_raster(lon, lat, land_mask, land_index=None):
+    """
+    Tests which points lie over land using the rasterized land mask.
+    Points in coastline cells fall back to the exact polygon test when land_index is given.
+    Otherwise they are classified by whether the cell center is over land.
+
+    Parameters:
+    lon (array-like): Longitudes of the points, in the -180 to 180 range.
+    lat (array-like): Latitudes of the points.
+    land_mask (np.ndarray): Mask built by rasterize_land_mask.
+    land_index (shapely.STRtree): Tree built by build_land_index, used for the exact fallback.
+
+    Returns:
+    np.ndarray: Boolean array, True where the point is over land.
+    """
+    codes = lookup_land_mask(lon, lat, land_mask)
+    on_land = (codes == LAND) | (codes == COAST_LAND)
+    if land_index is not None:
+        ambiguous = codes >= COAST_WATER
+        on_land[ambiguous] = points_on_land(np.asarray(lon, dtype=float)[ambiguous],
+                                            np.asarray(lat, dtype=float)[ambiguous], land_index)
+    return on_land
+
+def compare_land_methods(tracks, land_index, land_mask, threshold_percentage=80):
+    """
+    Reports how much the raster land mask lookup disagrees with the exact polygon test.
+
+    Parameters:
+    tracks (DataFrame): Track data with 'track_id', 'lon vor' and 'lat vor' columns.
+    land_index (shapely.STRtree): Tree built by build_land_index.
+    land_mask (np.ndarray): Mask built by rasterize_land_mask.
+    threshold_percentage (float): Threshold used to compare the pass/fail result of each track.
+
+    Returns:
+    dict: Point and track level disagreement statistics, for the raster lookup with and without
+          the exact fallback in coastline cells.
+    """
+    lon, lat = tracks['lon vor'].to_numpy(dtype=float), tracks['lat vor'].to_numpy(dtype=float)
+    exact = points_on_land(lon, lat, land_index)
+    ambiguous = lookup_land_mask(lon, lat, land_mask) >= COAST_WATER
+    report = {
+        'resolution': 360 / land_mask.shape[1],
+        'points': len(exact),
+        'coastline_points': int(ambiguous.sum()),
+        'coastline_points_percentage': float(ambiguous.mean() * 100) if len(exact) else 0.0,
+    }
+    exact_percentage = pd.Series(exact).groupby(tracks['track_id'].values).mean() * 100
+    for label, fallback in (('raster', None), ('raster_with_fallback', land_index)):
+        on_land = points_on_land_raster(lon, lat, land_mask, fallback)
+        percentage = pd.Series(on_land).groupby(tracks['track_id'].values).mean() * 100
+        report[f'{label}_point_disagreements'] = int((on_land != exact).sum())
+        report[f'{label}_max_land_percentage_difference'] = float((percentage - exact_percentage).abs().max())
+        report[f'{label}_tracks_flipped'] = int(((percentage < threshold_percentage) !=
+                                                 (exact_percentage < threshold_percentage)).sum())
+    return report
+
+# State of each land fraction worker process, set once by init_land_worker
+_worker_state = {}
+
+def init_land_worker(land_polygons, shared_arrays, land_mask_source):
+    """
+    Initializes a worker process: attaches to the shared track arrays and builds the land index once.
+
+    Parameters:
+    land_polygons (str or list): Path to the land polygons shapefile, or the land polygons as WKB.
+    shared_arrays (dict): Column name -> (shared memory name, dtype string, length).
+    land_mask_source (str, np.ndarray or None): Path to a memory-mapped land mask, the mask itself, or None.
+    """
+    if isinstance(land_polygons, str):
+        continent_gdf = gpd.read_file(land_polygons)
+    else:
+        continent_gdf = gpd.GeoDataFrame(geometry=shapely.from_wkb(land_polygons))
+    _worker_state['land_index'] = build_land_index(continent_gdf)
+    _worker_state['shared_memory'] = []
+    for column, (name, dtype, length) in shared_arrays.items():
+        block = shared_memory.SharedMemory(name=name)
+        _worker_state['shared_memory'].append(block)  # Keep the block open while its array is in use
+        _worker_state[column] = np.ndarray((length,), dtype=dtype, buffer=block.buf)
+    if isinstance(land_mask_source, str):
+        land_mask_source = np.load(land_mask_source, mmap_mode='r')
+    _worker_state['land_mask'] = land_mask_source
+
+def land_steps_for_rows(start, stop):
+    """
+    Counts time steps and time steps over land for the tracks in a range of rows of the shared arrays.
+    The range must start and end on track boundaries.
+
+    Parameters:
+    start (int): First row.
+    stop (int): Row after the last one.
+
+    Returns:
+    tuple: (track_ids, time_steps, land_steps) arrays, one entry per track in the range.
+    """
+    lon = _worker_state['lon'][start:stop]
+    lat = _worker_state['lat'][start:stop]
+    track_id = _worker_state['track_id'][start:stop]
+    if _worker_state['land_mask'] is not None:
+        on_land = points_on_land_raster(lon, lat, _worker_state['land_mask'], _worker_state['land_index'])
+    else:
+        on_land = points_on_land(lon, lat, _worker_state['land_index'])
+    track_starts = np.flatnonzero(np.r_[True, track_id[1:] != track_id[:-1]])
+    time_steps = np.diff(np.r_[track_starts, len(track_id)])
+    land_steps = np.add.reduceat(on_land.astype(np.int64), track_starts) if len(track_id) else np.zeros(0, np.int64)
+    return track_id[track_starts].copy(), time_steps, land_steps
+
+def compute_land_fractions_parallel(tracks, land_polygons=CONTINENT_SHAPEFILE, num_workers=None, land_mask=None):
+    """
+    Computes per-track land fractions in parallel, handing the track columns to the workers through shared memory.
+    Each task only carries a row-offset range, so the pickled input per task is a few bytes and the memory
+    used does not grow with the number of workers.
+
+    Parameters:
+    tracks (DataFrame): Track data with 'track_id', 'lon vor' and 'lat vor' columns.
+    land_polygons (str or GeoDataFrame): Path to the land polygons shapefile, read once by each worker, or the
+                                         land polygons themselves, handed to the workers as WKB.
+    num_workers (int): Number of worker processes. Defaults to the number of CPUs.
+    land_mask (np.ndarray): Rasterized land mask. Memory-mapped masks are reopened from their file by the workers.
+
+    Returns:
+    DataFrame: Indexed by track_id, with columns 'time_steps', 'land_steps' and 'land_percentage'.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    track_id = tracks['track_id'].to_numpy(dtype=np.int64)
+    # Tasks are split on track boundaries, so each track must occupy contiguous rows
+    track_starts = np.flatnonzero(np.r_[True, track_id[1:] != track_id[:-1]])
+    if len(track_starts) != len(np.unique(track_id)):
+        tracks = tracks.sort_values('track_id', kind='stable')
+        track_id = tracks['track_id'].to_numpy(dtype=np.int64)
+        track_starts = np.flatnonzero(np.r_[True, track_id[1:] != track_id[:-1]])
+    columns = {'lon': tracks['lon vor'].to_numpy(dtype=np.float64),
+               'lat': tracks['lat vor'].to_numpy(dtype=np.float64),
+               'track_id': track_id}
+
+    blocks = []
+    try:
+        shared_arrays = {}
+        for column, values in columns.items():
+            block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+            shared_arrays[column] = (block.name, values.dtype.str, len(values))
+        del columns
+
+        # Several tasks per worker keep the load balanced when track lengths vary
+        boundaries = [chunk[0] for chunk in np.array_split(track_starts, num_workers * 4) if len(chunk)]
+        ranges = list(zip(boundaries, boundaries[1:] + [len(track_id)]))
+        land_mask_source = land_mask.filename if isinstance(land_mask, np.memmap) else land_mask
+        if not isinstance(land_polygons, str):
+            land_polygons = list(shapely.to_wkb(np.asarray(land_polygons.geometry.values, dtype=object)))
+        with Pool(num_workers, initializer=init_land_worker,
+                  initargs=(land_polygons, shared_arrays, land_mask_source)) as pool:
+            results = pool.starmap(land_steps_for_rows, [(int(start), int(stop)) for start, stop in ranges])
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    if results:
+        track_ids, time_steps, land_steps = (np.concatenate(values) for values in zip(*results))
+    else:
+        track_ids, time_steps, land_steps = (np.zeros(0, np.int64) for _ in range(3))
+    land_fractions = pd.DataFrame({'time_steps': time_steps, 'land_steps': land_steps},
+                                  index=pd.Index(track_ids, name='track_id'))
+    land_fractions['land_percentage'] = land_fractions['land_steps'] / land_fractions['time_steps'] * 100
+    return land_fractions
@@ -0,0 +1,145 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    run_metrics.py                                     :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2026/10/17 09:14:37 by daniloceano       #+#    #+#              #
+#    Updated: 2026/10/17 09:14:37 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Per-system metrics of the LEC runs launched by automate_run_LEC.py.
+
+Each attempt of a system, and each system skipped by a run, is written as one JSON line to the metrics
+file, with the time spent in every stage of the pipeline:
+- prep_time: share of the single-pass writing of the track input files.
+- download_time: from admission into the download stage until all the ERA5 tiles of the system are cached.
+- write_time: writing the system's ERA5 file from the cache.
+- queue_time: waiting for a free LEC worker.
+- compute_time: the LEC run.
+and the bytes downloaded for the system (its share of the merged downloads it waited for), the size of
+its ERA5 file, its cached and missing tiles, the peak RSS of the LEC run, the exit code and error, or
+the reason why it was skipped. Lines of one launch share the same 'run_id'.
+
+Usage:
+- python run_metrics.py                 # summary of the last run
+- python run_metrics.py --run 1700000000
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+from collections import deque
+import pandas as pd
+
+METRICS_FILE = '../LEC_metrics.jsonl'
+ETA_WINDOW = 20  # Number of recent LEC runs the completion rate is computed on
+PHASES = ['prep_time', 'download_time', 'write_time', 'queue_time', 'compute_time', 'total_time']
+
+class MetricsWriter:
+    """
+    Appends per-system metrics to a JSON lines file. Safe to use from several threads.
+    """
+
+    def __init__(self, path, run_id=None):
+        self.path = path
+        self.run_id = run_id if run_id is not None else int(time.time())
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def write(self, record):
+        line = json.dumps({'run_id': self.run_id, **record}, default=lambda value: value.item())
+        with self.lock, open(self.path, 'a') as f:
+            f.write(line + '\n')
+
+class RollingRate:
+    """
+    Estimates the completion time of a run from the finishing times of its last window LEC runs,
+    so skipped systems, which finish instantly, and old throughput do not bias the estimate.
+    """
+
+    def __init__(self, start_time, window=ETA_WINDOW):
+        self.start_time = start_time
+        self.finished = deque(maxlen=window)
+
+    def add(self, finished_at):
+        self.finished.append(finished_at)
+
+    def eta(self, remaining, now=None):
+        """
+        Returns the estimated completion time of the remaining systems, or None before the first LEC run.
+        """
+        now = time.time() if now is None else now
+        if not self.finished:
+            return None
+        if len(self.finished) == 1:
+            rate = 1 / max(self.finished[0] - self.start_time, 1e-9)
+        else:
+            rate = (len(self.finished) - 1) / max(self.finished[-1] - self.finished[0], 1e-9)
+        return now + remaining / rate
+
+def read_metrics(path=METRICS_FILE, run_id=None):
+    """
+    Reads the metrics of one run, by default the last one.
+
+    Parameters:
+    path (str): Path to the metrics file.
+    run_id (int): Run to read, or None for the last one.
+
+    Returns:
+    DataFrame: One row per system attempt or skipped system.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return pd.DataFrame()
+    metrics = pd.read_json(path, lines=True)
+    if metrics.empty:
+        return metrics
+    run_id = metrics['run_id'].max() if run_id is None else run_id
+    return metrics[metrics['run_id'] == run_id].reset_index(drop=True)
+
+def outcome_summary(metrics):
+    """
+    Counts the attempts of a run by status and skip reason.
+    """
+    outcomes = metrics.assign(skip_reason=metrics.get('skip_reason', pd.Series(index=metrics.index)).fillna(''))
+    return outcomes.groupby(['status', 'skip_reason']).size().rename('systems').reset_index()
+
+def phase_summary(metrics):
+    """
+    Summarizes the time spent in each stage by the systems that were not skipped, and the volumes they moved.
+
+    Returns:
+    DataFrame: Count, total, mean, median, 95th percentile and maximum of each metric.
+    """
+    ran = metrics[metrics['status'] != 'skipped']
+    columns = [column for column in PHASES + ['bytes_downloaded', 'input_bytes', 'peak_rss'] if column in ran]
+    rows = []
+    for column in columns:
+        values = ran[column].dropna()
+        if values.empty:
+            continue
+        rows.append({'metric': column, 'count': len(values), 'total': values.sum(), 'mean': values.mean(),
+                     'median': values.median(), 'p95': values.quantile(0.95), 'max': values.max()})
+    return pd.DataFrame(rows, columns=['metric', 'count', 'total', 'mean', 'median', 'p95', 'max'])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the per-system metrics of a LEC run.")
+    parser.add_argument('--metrics', default=METRICS_FILE, help="Path to the metrics file.")
+    parser.add_argument('--run', type=int, help="Run ID to summarize. Defaults to the last run.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.metrics):
+        raise SystemExit(f"Metrics file not found: {args.metrics}")
+    metrics = read_metrics(args.metrics, args.run)
+    if metrics.empty:
+        raise SystemExit("No metrics recorded")
+    print(f"Run {metrics['run_id'].iloc[0]}")
+    print(outcome_summary(metrics).to_string(index=False))
+    phases = phase_summary(metrics)
+    if not phases.empty:
+        print(phases.to_string(index=False, float_format='%.2f'))
@@ -0,0 +1,183 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    run_planner.py                                     :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2026/10/17 11:02:51 by daniloceano       #+#    #+#              #
+#    Updated: 2026/10/17 11:02:51 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Dry-run planner of automate_run_LEC.py: predicts the ERA5 download volume and the LEC run time of a
+region before launching it, without network access and without running LEC.
+
+For each system still to run, the ERA5 input size follows from its request (domain, period, time step,
+levels and variables), calibrated on the sizes of the ERA5 files written by previous runs (see
+run_metrics.py), and the LEC run time from job_costs.py, fitted on the completed jobs when there are
+enough. The download volume is planned as the download stage would: the missing tiles of the systems,
+in dispatch order and in batches, merged into downloads (see era5_cache.plan_downloads). The makespan
+is the one of the longest-first dispatch over the LEC workers.
+
+Usage:
+- python automate_run_LEC.py ARG --plan --workers 32
+"""
+
+import heapq
+import pandas as pd
+from era5_download import era5_request
+from era5_cache import parse_area, plan_downloads
+from job_database import job_history, skipped_jobs
+from job_costs import DEFAULT_JOB_MEMORY, MIN_OBSERVATIONS, track_features, estimate_jobs
+
+ERA5_RESOLUTION = 0.25  # Degrees
+PRIOR_BYTES_PER_VALUE = 4  # float32 values, used until ERA5 files of previous runs are available for calibration
+
+def region_requests(tracks):
+    """
+    Builds the ERA5 request of every system of a set of tracks (see era5_download.era5_request).
+
+    Parameters:
+    tracks (DataFrame): Tracks with 'track_id', 'date', 'lat vor' and 'lon vor' columns.
+
+    Returns:
+    dict: ERA5 request of each system ID.
+    """
+    tracks = pd.DataFrame({'track_id': tracks['track_id'], 'time': pd.to_datetime(tracks['date']),
+                           'Lat': tracks['lat vor'], 'Lon': tracks['lon vor']})
+    return {int(system_id): era5_request(track) for system_id, track in tracks.groupby('track_id')}
+
+def request_values(request):
+    """
+    Returns the number of values of an ERA5 request: time steps x levels x variables x grid points.
+    """
+    north, west, south, east = parse_area(request)
+    start, end = request['date'].split('/')
+    num_days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    time_step = int(request['time'].split('/')[-1])
+    num_times = num_days * -(-24 // time_step)
+    num_points = (round((north - south) / ERA5_RESOLUTION) + 1) * (round((east - west) / ERA5_RESOLUTION) + 1)
+    return num_times * len(request['pressure_level']) * len(request['variable']) * num_points
+
+def calibrate_bytes_per_value(tracks, metrics):
+    """
+    Estimates the bytes per value of the ERA5 files from the sizes of the ERA5 files written by previous runs.
+
+    Parameters:
+    tracks (DataFrame): Tracks of all regions, to rebuild the requests of the systems in metrics.
+    metrics (DataFrame): Per-system metrics of previous runs, see run_metrics.py, or None.
+
+    Returns:
+    tuple: (bytes per value, number of files it was calibrated on). The prior if no file was recorded.
+    """
+    if metrics is None or metrics.empty or 'input_bytes' not in metrics:
+        return PRIOR_BYTES_PER_VALUE, 0
+    sizes = metrics.dropna(subset=['input_bytes']).groupby('system_id')['input_bytes'].last()
+    sizes = sizes[sizes.index.isin(tracks['track_id'])]
+    if sizes.empty:
+        return PRIOR_BYTES_PER_VALUE, 0
+    requests = region_requests(tracks[tracks['track_id'].isin(sizes.index)])
+    ratios = [size / request_values(requests[int(system_id)]) for system_id, size in sizes.items()]
+    return float(pd.Series(ratios).median()), len(ratios)
+
+def lpt_makespan(run_times, num_workers):
+    """
+    Returns the makespan of running jobs longest first on num_workers workers, each job going to the
+    first worker to become free.
+    """
+    workers = [0.0] * max(num_workers, 1)
+    for run_time in sorted(run_times, reverse=True):
+        heapq.heappush(workers, heapq.heappop(workers) + run_time)
+    return max(workers)
+
+def plan_region(tracks, region, num_workers, download_batch, conn=None, cache=None, metrics=None,
+                done_ids=(), max_attempts=3, default_memory=DEFAULT_JOB_MEMORY):
+    """
+    Predicts the download volume and run time of the systems of a region that are not done yet.
+
+    Parameters:
+    tracks (DataFrame): Filtered tracks of all regions.
+    region (str): Region to plan.
+    num_workers (int): Number of LEC runs in parallel.
+    download_batch (int): Number of systems whose downloads are merged together, as in the download stage.
+    conn (sqlite3.Connection): Job database, read only, or None. Its completed jobs calibrate the run times,
+                               and the systems it would skip are left out.
+    cache (ERA5Cache): ERA5 tile cache, whose tiles are not downloaded again, or None.
+    metrics (DataFrame): Per-system metrics of previous runs, to calibrate the ERA5 file sizes, or None.
+    done_ids (iterable): Other systems to leave out, e.g. those with results.
+    max_attempts (int): Maximum number of attempts per system.
+    default_memory (float): Peak memory assumed for a LEC run before any has been observed, in bytes.
+
+    Returns:
+    tuple: (DataFrame indexed by system_id with the 'time_steps', 'area', 'input_bytes', 'estimated_time'
+           and 'estimated_rss' of each system to run, dict of region totals).
+    """
+    tracks_region = tracks[tracks['region'] == region]
+    features = track_features(tracks_region)
+    skipped = set(done_ids)
+    if conn is not None:
+        skipped |= {system_id for system_id, _ in skipped_jobs(conn, region, max_attempts)}
+    plan = features[~features.index.isin(skipped)].copy()
+
+    requests = region_requests(tracks_region[tracks_region['track_id'].isin(plan.index)])
+    bytes_per_value, calibration_files = calibrate_bytes_per_value(tracks, metrics)
+    plan['input_bytes'] = [request_values(requests[int(system_id)]) * bytes_per_value for system_id in plan.index]
+
+    history = job_history(conn) if conn is not None else pd.DataFrame(
+        columns=['time_steps', 'area', 'compute_time', 'peak_rss'])
+    plan = plan.join(estimate_jobs(plan, history, default_memory))
+
+    # The download stage admits systems longest first, in batches, and merges their missing tiles
+    order = plan.sort_values('estimated_time', ascending=False).index
+    planned_tiles, downloads = set(), []
+    for start in range(0, len(order), download_batch):
+        batch = {int(system_id): requests[int(system_id)] for system_id in order[start:start + download_batch]}
+        for download in plan_downloads(batch, cache, planned_tiles):
+            planned_tiles |= download['tiles']
+            downloads.append(download)
+
+    totals = {
+        'systems': len(features),
+        'skipped': len(features) - len(plan),
+        'to_run': len(plan),
+        'input_bytes': float(plan['input_bytes'].sum()),
+        'download_bytes': float(sum(request_values(download['request']) for download in downloads) * bytes_per_value),
+        'downloads': len(downloads),
+        'bytes_per_value': bytes_per_value,
+        'calibration_files': calibration_files,
+        'timed_jobs': int(history['compute_time'].notna().sum()),
+        'compute_time': float(plan['estimated_time'].sum()),
+        'longest_job': float(plan['estimated_time'].max()) if len(plan) else 0.0,
+        'makespan': lpt_makespan(plan['estimated_time'], num_workers),
+        'workers': num_workers,
+    }
+    return plan, totals
+
+def plan_report(region, totals, download_rate=None):
+    """
+    Formats the totals of plan_region as text.
+
+    Parameters:
+    region (str): The region.
+    totals (dict): Totals returned by plan_region.
+    download_rate (float): Download throughput in MB/s, to estimate the download time, or None.
+    """
+    time_basis = (f"fitted on {totals['timed_jobs']} completed jobs" if totals['timed_jobs'] >= MIN_OBSERVATIONS
+                  else "from the prior, too few completed jobs")
+    size_basis = (f"{totals['bytes_per_value']:.2f} bytes per value, calibrated on {totals['calibration_files']} ERA5 files"
+                  if totals['calibration_files'] else f"{totals['bytes_per_value']:.0f} bytes per value (prior)")
+    lines = [
+        f"Region {region}: {totals['systems']} systems, {totals['skipped']} done or out of attempts, {totals['to_run']} to run",
+        f"ERA5 input files: {totals['input_bytes'] / 2**30:.1f} GB ({size_basis})",
+        f"ERA5 downloads: {totals['download_bytes'] / 2**30:.1f} GB in {totals['downloads']} requests, after the tile cache",
+        f"LEC run time: {totals['compute_time'] / 3600:.1f} hours in total, longest system "
+        f"{totals['longest_job'] / 60:.1f} minutes ({time_basis})",
+        f"Makespan with {totals['workers']} workers: {totals['makespan'] / 3600:.1f} hours",
+    ]
+    if download_rate:
+        download_time = totals['download_bytes'] / (download_rate * 2**20)
+        lines.append(f"Download time at {download_rate:g} MB/s: {download_time / 3600:.1f} hours. Downloads overlap "
+                     f"with the LEC runs: the run takes at least {max(download_time, totals['makespan']) / 3600:.1f} hours")
+    return '\n'.join(lines)
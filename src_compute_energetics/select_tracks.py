@@ -22,15 +22,27 @@ import pandas as pd
 import numpy as np
 from glob import glob
 from multiprocessing import Pool
-import concurrent.futures
-import multiprocessing
 from tqdm import tqdm
 import geopandas as gpd
+import shapely
 import os 
+import sys
 import logging
+import argparse
+import json
+import hashlib
+import shutil
+from track_store import (TRACK_COLUMNS, TRACKS_RAW_DIR, TRACK_STORE_DIR, RAW_FILE_GLOB, store_exists, read_tracks,
+                         read_raw_track_file, convert_track_file, partition_from_filename, partition_path,
+                         iter_track_chunks, file_fingerprint, refresh_track_store)
+from land_mask import (CONTINENT_SHAPEFILE, LAND_MASK_RESOLUTION, build_land_index, compute_land_fractions,
+                       load_land_mask, compare_land_methods, compute_land_fractions_parallel)
+from track_summary import TRACK_SUMMARY_FILE, add_partition_offsets, build_track_summary, save_track_summary, load_track_summary
 
 
 # Constants defining the geographic boundaries of regions of interest.
+# Each region is a list of (lon_min, lat_min, lon_max, lat_max) boxes or polygons given as (lon, lat) vertices.
+# The order matters: a genesis point inside overlapping regions is assigned to the one listed first.
 REGIONS = {
     "SE-BR": [(-52, -38, -37, -23)],
     "LA-PLATA": [(-69, -38, -52, -23)],
@@ -43,37 +55,51 @@ REGIONS = {
 
 PATH_TO_RAW_DATA = '../raw_data/SAt'
 
-def read_csv_file(filepath):
-    """
-    Reads a CSV file and returns its content as a pandas DataFrame.
+# Selection applied to the tracks: genesis regions kept and maximum percentage of time steps over the continent
+SELECTED_REGIONS = ['ARG', 'LA-PLATA', 'SE-BR']
+CONTINENT_THRESHOLD_PERCENTAGE = 80
 
-    Parameters:
-    filepath (str): Path to the CSV file.
+OUTPUT_FILE = '../tracks_SAt_filtered/tracks_SAt_filtered.csv'
+OUTPUT_COLUMNS = TRACK_COLUMNS + ['region']
+MANIFEST_FILE = '../tracks_SAt_filtered/manifest.json'
+SWEEP_FILE = '../tracks_SAt_filtered/selection_sweep.parquet'
 
-    Returns:
-    DataFrame: The content of the CSV file.
+def get_tracks(logger, columns=None, date_range=None, track_id_range=None, bbox=None,
+               raw_dir=TRACKS_RAW_DIR, store_dir=TRACK_STORE_DIR):
     """
-    return pd.read_csv(filepath, header=None)
-
-def get_tracks(logger):
-    """
-    Reads and merges track data from CSV files located in the "../tracks_SAt" directory.
-    Adjusts longitude values and filters tracks based on the first time step being within predefined regions.
+    Reads and merges track data, either from the columnar track store (see track_store.py), brought up
+    to date with the raw files first, or, if it has not been built yet, from the CSV files located in
+    the "../tracks_SAt" directory.
+    Adjusts longitude values to the -180 to 180 range.
     
     Parameters:
     logger (logging.Logger): Logger for logging information.
+    columns (list): Columns to load. Only used with the track store.
+    date_range (tuple): (start, end) datetimes, inclusive. Only used with the track store.
+    track_id_range (tuple): (first_id, last_id), inclusive. Only used with the track store.
+    bbox (tuple): (lon_min, lat_min, lon_max, lat_max). Only used with the track store.
+    raw_dir (str): Directory containing the raw monthly track files.
+    store_dir (str): Root directory of the columnar track store.
 
     Returns:
-    pd.DataFrame: The merged and filtered track data with columns for track ID, date, longitude, latitude, and vor42.
+    pd.DataFrame: The merged track data with columns for track ID, date, longitude, latitude, and vor42.
     """
-    logger.info("Reading raw track files...")
-    file_list = glob("../tracks_SAt/*.csv")
+    if store_exists(store_dir):
+        refresh_track_store(raw_dir, store_dir, logger)
+        logger.info(f"Reading tracks from {store_dir}...")
+        tracks = read_tracks(store_dir, columns=columns, date_range=date_range,
+                             track_id_range=track_id_range, bbox=bbox)
+        logger.info("Done.")
+        return tracks
+
+    if any(arg is not None for arg in (columns, date_range, track_id_range, bbox)):
+        logger.warning("Track store not found: column and row selections are ignored when reading raw CSV files.")
+    logger.info("Reading raw track files (run track_store.py once to speed this up)...")
+    file_list = sorted(glob(os.path.join(raw_dir, RAW_FILE_GLOB)))
     with Pool() as pool:
-        dfs = pool.map(read_csv_file, tqdm(file_list))
+        dfs = pool.map(read_raw_track_file, tqdm(file_list))
     logger.info("Merging tracks...")
     tracks = pd.concat(dfs, ignore_index=True)
-    tracks.columns = ['track_id', 'date', 'lon vor', 'lat vor', 'vor42']
-    tracks['lon vor'] = np.where(tracks['lon vor'] > 180, tracks['lon vor'] - 360, tracks['lon vor'])
     logger.info("Done.")
     return tracks
 
@@ -100,114 +126,258 @@ def configure_logging():
 
     return logger
 
-def is_first_step_in_region(track_group, region_bounds):
+def split_region_parts(regions):
     """
-    Determines if the system have genesis within the specified region.
-    Handles empty track groups by returning False.
+    Splits the region definitions into rectangular boxes and polygons.
+    Each region is a list of parts, where a part is either a (lon_min, lat_min, lon_max, lat_max) box
+    or a polygon, given as a shapely Polygon or as a sequence of (lon, lat) vertices.
 
     Parameters:
-    track_group (DataFrame): Grouped data for a single system.
-    region_bounds (tuple): A tuple of (lon_min, lat_min, lon_max, lat_max) defining the region.
+    regions (dict): Region definitions, in the same format as REGIONS.
 
     Returns:
-    bool: True if the first time step of the track is in the region, False otherwise.
+    tuple: (boxes, box_region, polygons, polygon_region), where boxes is an (n, 4) array,
+           polygons is a list of shapely geometries and the *_region arrays hold the index of the
+           region each part belongs to.
     """
-    if track_group.empty:
-        return False
-    first_step = track_group.iloc[0]
-    lon_min, lat_min, lon_max, lat_max = region_bounds
-    lon = first_step['lon vor']
-    lat = first_step['lat vor']
-    return lon_min <= lon <= lon_max and lat_min <= lat <= lat_max
+    boxes, box_region, polygons, polygon_region = [], [], [], []
+    for region_index, parts in enumerate(regions.values()):
+        for part in parts:
+            if isinstance(part, (tuple, list)) and len(part) == 4 and np.isscalar(part[0]):
+                boxes.append(part)
+                box_region.append(region_index)
+            else:
+                polygons.append(part if isinstance(part, shapely.Geometry) else shapely.Polygon(part))
+                polygon_region.append(region_index)
+    return (np.asarray(boxes, dtype=float).reshape(-1, 4), np.asarray(box_region, dtype=int),
+            polygons, np.asarray(polygon_region, dtype=int))
+
+def classify_genesis_regions(lon, lat, regions=REGIONS):
+    """
+    Assigns a region to each genesis point, testing all regions at once.
+    Points on a region boundary are considered inside it. When regions overlap, the point is assigned
+    to the region listed first in the regions dictionary.
 
-def filter_tracks_for_single_region(grouped_tracks, region_name, bounds):
+    Parameters:
+    lon (array-like): Longitudes of the genesis points, in the -180 to 180 range.
+    lat (array-like): Latitudes of the genesis points.
+    regions (dict): Region definitions, in the same format as REGIONS.
+
+    Returns:
+    np.ndarray: Region name of each point (object array), or None where no region matches.
     """
-    Filters tracks for a single region.
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    region_names = np.array(list(regions) + [None], dtype=object)
+    boxes, box_region, polygons, polygon_region = split_region_parts(regions)
+
+    in_region = np.zeros((len(lon), len(regions)), dtype=bool)
+    if len(boxes):
+        # (points, boxes) membership matrix computed with a single broadcast
+        in_box = ((lon[:, None] >= boxes[:, 0]) & (lat[:, None] >= boxes[:, 1]) &
+                  (lon[:, None] <= boxes[:, 2]) & (lat[:, None] <= boxes[:, 3]))
+        for box_index, region_index in enumerate(box_region):
+            in_region[:, region_index] |= in_box[:, box_index]
+    for polygon, region_index in zip(polygons, polygon_region):
+        in_region[:, region_index] |= shapely.intersects_xy(polygon, lon, lat)
+
+    # argmax returns the first matching region, which gives the priority order; unmatched points get None
+    first_match = np.where(in_region.any(axis=1), in_region.argmax(axis=1), len(regions))
+    return region_names[first_match]
+
+def get_genesis_regions(tracks, regions=REGIONS):
+    """
+    Takes the first time step of every track in a single grouped pass and classifies it into the regions.
 
     Parameters:
-    grouped_tracks (DataFrameGroupBy): Grouped track data.
-    region_name (str): Name of the region.
-    bounds (tuple): Boundary coordinates of the region.
+    tracks (DataFrame): The input tracks data.
+    regions (dict): Region definitions, in the same format as REGIONS. Earlier regions take priority.
 
     Returns:
-    DataFrame: Filtered tracks for the specified region.
+    pd.Series: Region of genesis of each track, indexed by track_id (None where no region matches).
     """
-    matching_tracks = grouped_tracks.filter(lambda x: is_first_step_in_region(x, bounds)).index
-    result = pd.Series(region_name, index=matching_tracks)
-    return result
+    genesis = tracks.groupby('track_id', sort=False).head(1)
+    return pd.Series(classify_genesis_regions(genesis['lon vor'], genesis['lat vor'], regions),
+                     index=genesis['track_id'].values, dtype=object)
 
-def filter_tracks_by_region(tracks, logger):
+def filter_tracks_by_region(tracks, logger, regions=REGIONS):
     """
     Filter tracks, selecting only systems with genesis in the defined regions.
     Adds a 'region' column to the DataFrame indicating the region of genesis.
-    Uses parallel processing to improve performance.
+    The first time step of every track is taken in a single grouped pass and all regions are tested at once.
 
     Parameters:
     tracks (DataFrame): The input tracks data.
     logger (logging.Logger): Logger for logging information.
+    regions (dict): Region definitions, in the same format as REGIONS. Earlier regions take priority.
 
     Returns:
     DataFrame: The input tracks data with an additional 'region' column.
     """
     logger.info("Filtering tracks by region...")
-    grouped_tracks = tracks.groupby('track_id')
-    tracks['region'] = None  # Initialize the 'region' column
-    
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        futures = [executor.submit(filter_tracks_for_single_region, grouped_tracks, region_name, bounds[0]) 
-                   for region_name, bounds in REGIONS.items()]
-        
-        for future in tqdm(concurrent.futures.as_completed(futures), total=len(REGIONS)):
-            result = future.result()
-            tracks.loc[result.index, 'region'] = result
-
+    tracks['region'] = tracks['track_id'].map(get_genesis_regions(tracks, regions))
     logger.info("Done.")
     return tracks
 
-def prepare_tracks(tracks, continent_gdf):
+def check_tracks_on_continent(land_fractions, threshold_percentage):
     """
-    Prepare the tracks DataFrame for efficient continent checks.
+    Check which tracks spend less than the threshold percentage of their time steps over the continent.
+
+    Parameters:
+    land_fractions (DataFrame): Per-track land fractions, as returned by land_mask.compute_land_fractions.
+    threshold_percentage (float): Maximum percentage of time steps over the continent.
+
+    Returns:
+    pd.Series: Boolean series indexed by track_id, True for tracks that pass the check.
     """
-    # Convert all track points to a GeoSeries
-    points = gpd.points_from_xy(tracks['lon vor'], tracks['lat vor'])
-    tracks_geo = gpd.GeoDataFrame(tracks, geometry=points, crs=continent_gdf.crs)
-    return tracks_geo
+    return land_fractions['land_percentage'] < threshold_percentage
 
-def check_tracks_on_continent(tracks, track_ids, continent_gdf, threshold_percentage):
+def compute_track_land_fractions(tracks, continent_gdf, land_mask=None, num_workers=1):
     """
-    Check a batch of tracks for the percentage of time spent on the continent.
+    Computes the per-track land fractions with the requested method.
+
+    Parameters:
+    tracks (DataFrame): The input tracks data.
+    continent_gdf (GeoDataFrame): Land polygons.
+    land_mask (np.ndarray): Rasterized land mask (see land_mask.load_land_mask). If given, points are looked up
+                            in the mask and only points in coastline cells use the exact polygon test.
+    num_workers (int): Number of worker processes. With more than one, the track coordinates are handed to
+                       the workers through shared memory and the land polygons as WKB.
+
+    Returns:
+    DataFrame: Per-track land fractions, see land_mask.compute_land_fractions.
     """
-    results = []
-    for cyclone_id in tqdm(track_ids, desc="Processing Batch"):
-        cyclone_track = tracks[tracks['track_id'] == cyclone_id]
-        on_continent_count = cyclone_track['geometry'].within(continent_gdf.unary_union).sum()
-        total_time_steps = len(cyclone_track)
-        percentage_on_continent = (on_continent_count / total_time_steps) * 100
-        results.append((cyclone_id, percentage_on_continent < threshold_percentage))
-    return results
+    if num_workers > 1:
+        return compute_land_fractions_parallel(tracks, continent_gdf, num_workers, land_mask)
+    return compute_land_fractions(tracks, build_land_index(continent_gdf), land_mask)
 
-def filter_tracks_by_continent(tracks, continent_gdf, threshold_percentage=80):
+def filter_tracks_by_continent(tracks, continent_gdf, threshold_percentage=80, land_fractions=None, land_mask=None,
+                               num_workers=1):
     """
     Filter tracks based on the percentage of time spent over the continent.
+
+    Parameters:
+    tracks (DataFrame): The input tracks data.
+    continent_gdf (GeoDataFrame): Land polygons.
+    threshold_percentage (float): Tracks with this percentage of time steps over land, or more, are removed.
+    land_fractions (DataFrame): Precomputed per-track land fractions. Computed from continent_gdf if not given.
+    land_mask (np.ndarray): Rasterized land mask, see compute_track_land_fractions.
+    num_workers (int): Number of worker processes, see compute_track_land_fractions.
+
+    Returns:
+    DataFrame: The tracks spending less than threshold_percentage of their time over the continent.
     """
-    # Prepare the tracks DataFrame
-    tracks = prepare_tracks(tracks, continent_gdf)
+    if land_fractions is None:
+        land_fractions = compute_track_land_fractions(tracks, continent_gdf, land_mask, num_workers)
+    is_valid = check_tracks_on_continent(land_fractions, threshold_percentage)
+    valid_track_ids = is_valid.index[is_valid.values]
+    return tracks[tracks['track_id'].isin(valid_track_ids)]
 
-    # Create batches of track IDs
-    unique_cyclone_ids = tracks['track_id'].unique()
-    num_cores = multiprocessing.cpu_count() or 1  # Ensure num_cores is at least 1
-    id_batches = np.array_split(unique_cyclone_ids, num_cores)
+def select_completed_tracks(tracks, land_index, land_mask=None):
+    """
+    Applies the track selection to a batch of complete tracks, reusing a prebuilt land index.
 
-    # Process in parallel
-    with multiprocessing.Pool() as pool:
-        results = pool.starmap(
-            check_tracks_on_continent,
-            [(tracks, batch, continent_gdf, threshold_percentage) for batch in id_batches]
-        )
+    Parameters:
+    tracks (DataFrame): Complete tracks.
+    land_index (shapely.STRtree): Tree built by land_mask.build_land_index.
+    land_mask (np.ndarray): Rasterized land mask, see filter_tracks_by_continent.
 
-    # Flatten results and filter tracks
-    valid_track_ids = [cyclone_id for batch in results for cyclone_id, is_valid in batch if is_valid]
-    return tracks[tracks['track_id'].isin(valid_track_ids)]
+    Returns:
+    tuple: (region of each track as a Series indexed by track_id, selected tracks, track summary).
+    """
+    genesis_region = get_genesis_regions(tracks)
+    tracks = tracks.assign(region=tracks['track_id'].map(genesis_region))
+    land_fractions = compute_land_fractions(tracks, land_index, land_mask)
+    filtered_tracks = tracks[tracks['region'].isin(SELECTED_REGIONS)]
+    selected_tracks = filter_tracks_by_continent(filtered_tracks, None, CONTINENT_THRESHOLD_PERCENTAGE,
+                                                 land_fractions=land_fractions)
+    summary = build_track_summary(tracks, land_fractions, genesis_region, selected_tracks['track_id'].unique())
+    return genesis_region, selected_tracks, summary
+
+def stream_selection(continent_gdf, logger, output_file=OUTPUT_FILE, chunk_rows=100_000, land_mask=None):
+    """
+    Selects the tracks in a single streaming pass over the monthly files, in chronological order.
+
+    Tracks are contiguous within each monthly file, so a track is complete once the reader moves on to the next
+    one, unless its last time step is in the last hour of the month. Such tracks are held back and carried until
+    the following file has been read, in case they continue there. Complete tracks are classified and
+    land-filtered right away and the selected ones are appended to the output file, so peak memory is set by the
+    chunk size and the longest tracks, not by the size of the archive.
+
+    Parameters:
+    continent_gdf (GeoDataFrame): Land polygons.
+    logger (logging.Logger): Logger for logging information.
+    output_file (str): Path to the output CSV file.
+    chunk_rows (int): Maximum number of rows read at once.
+    land_mask (np.ndarray): Rasterized land mask, see filter_tracks_by_continent.
+
+    Returns:
+    tuple: (number of tracks with genesis in each region, with None for unmatched tracks, track summary).
+    """
+    land_index = build_land_index(continent_gdf)
+    pending = {}  # track_id -> list of row blocks, for tracks that may still receive rows
+    carried_ids = set()  # Tracks from the previous monthly file, kept open until the current one ends
+    current_month = None
+    month_rows = 0  # Rows read so far from the current monthly file, for the store offsets in the summary
+    region_counts = pd.Series(dtype='int64')
+    summaries = []
+    tmp_file = output_file + '.tmp'
+    write_header = True
+
+    def process(track_ids):
+        nonlocal region_counts, write_header
+        if not track_ids:
+            return
+        completed = pd.concat([block for track_id in track_ids for block in pending.pop(track_id)], ignore_index=True)
+        genesis_region, selected_tracks, summary = select_completed_tracks(completed, land_index, land_mask)
+        region_counts = region_counts.add(genesis_region.value_counts(dropna=False), fill_value=0)
+        summaries.append(summary)
+        selected_tracks[OUTPUT_COLUMNS].to_csv(tmp_file, index=False, mode='w' if write_header else 'a',
+                                               header=write_header)
+        write_header = False
+
+    def month_end():
+        return pd.Timestamp(year=current_month[0], month=current_month[1], day=1) + pd.offsets.MonthBegin(1)
+
+    def active_at_month_end():
+        # Tracks that reach the last hour of the month may continue in the next monthly file
+        last_hour = month_end() - pd.Timedelta(hours=1)
+        return {track_id for track_id, blocks in pending.items() if blocks[-1]['date'].iloc[-1] >= last_hour}
+
+    def close_month():
+        nonlocal carried_ids
+        # Tracks carried from the month before are complete once this month's file has been read, unless
+        # they are still active at its end
+        still_active = active_at_month_end()
+        process([track_id for track_id in pending if track_id not in still_active])
+        carried_ids = still_active
+
+    logger.info("Streaming track selection...")
+    for year, month, chunk in tqdm(iter_track_chunks(TRACKS_RAW_DIR, TRACK_STORE_DIR, chunk_rows)):
+        if current_month is not None and (year, month) != current_month:
+            close_month()
+            month_rows = 0
+        current_month = (year, month)
+        chunk = add_partition_offsets(chunk, year, month, month_rows)
+        month_rows += len(chunk)
+        chunk_ids = chunk['track_id'].to_numpy()
+        block_starts = np.flatnonzero(np.r_[True, chunk_ids[1:] != chunk_ids[:-1]])
+        for start, stop in zip(block_starts, np.r_[block_starts[1:], len(chunk)]):
+            pending.setdefault(int(chunk_ids[start]), []).append(chunk.iloc[start:stop])
+        # The last track of the chunk may continue in the next chunk; carried tracks and tracks active at the
+        # end of the month wait for the end of the month
+        held_ids = carried_ids | active_at_month_end() | {int(chunk_ids[-1])}
+        process([track_id for track_id in pending if track_id not in held_ids])
+    if current_month is not None:
+        close_month()
+        process(list(pending))
+
+    if write_header:
+        pd.DataFrame(columns=OUTPUT_COLUMNS).to_csv(tmp_file, index=False)
+    os.replace(tmp_file, output_file)
+    logger.info("Done.")
+    return region_counts.astype('int64'), pd.concat(summaries) if summaries else build_track_summary(
+        pd.DataFrame(columns=TRACK_COLUMNS).astype({'date': 'datetime64[s]'}))
 
 def verify_track_numbers(tracks, logger):
     for region_name in REGIONS:
@@ -216,33 +386,309 @@ def verify_track_numbers(tracks, logger):
     num_unmatched_tracks = len(tracks[tracks['region'].isnull()].groupby('track_id'))
     logger.info(f"Number of unmatched tracks: {num_unmatched_tracks}")
 
-if __name__ == "__main__":
-    logger = configure_logging()
+def apply_selection(tracks, continent_gdf, logger, land_mask=None, num_workers=1):
+    """
+    Applies the track selection: genesis in SELECTED_REGIONS and less than CONTINENT_THRESHOLD_PERCENTAGE
+    of the time steps over the continent.
 
-    # Get the tracks
-    logger.info("Starting track processing")
-    tracks = get_tracks(logger)
+    Parameters:
+    tracks (DataFrame): The input tracks data.
+    continent_gdf (GeoDataFrame): Land polygons.
+    logger (logging.Logger): Logger for logging information.
+    land_mask (np.ndarray): Rasterized land mask, see filter_tracks_by_continent.
+    num_workers (int): Number of processes used for the continent filter.
 
-    # Filter the tracks by region
-    logger.info("Filtering tracks by region")
+    Returns:
+    tuple: (tracks with the 'region' column, selected tracks, track summary).
+    """
     tracks = filter_tracks_by_region(tracks, logger)
+    # Land fractions are computed for every track, so they are also available in the track summary
+    land_fractions = compute_track_land_fractions(tracks, continent_gdf, land_mask, num_workers)
+    filtered_tracks = tracks[tracks['region'].isin(SELECTED_REGIONS)]
+    logger.info("Filtering tracks by continent")
+    selected_tracks = filter_tracks_by_continent(filtered_tracks, continent_gdf, CONTINENT_THRESHOLD_PERCENTAGE,
+                                                 land_fractions=land_fractions)
+    genesis_region = tracks.groupby('track_id', sort=False)['region'].first()
+    summary = build_track_summary(tracks, land_fractions, genesis_region, selected_tracks['track_id'].unique())
+    return tracks, selected_tracks, summary
 
+def selection_config(land_mask=None):
+    """
+    Returns the parameters of the selection. The incremental mode only reuses previous results
+    when they were produced with the same parameters.
 
-    # Here we will work only with tracks that have genesis in one of the regions
-    # over South American coast: ARG, LA-PLATA and SE-BR.
-    filtered_tracks = tracks[tracks['region'].isin(['ARG', 'LA-PLATA', 'SE-BR'])]
+    Parameters:
+    land_mask (np.ndarray): Rasterized land mask used for the land fractions, or None for the exact polygon tests.
+    """
+    config = {'regions': {name: REGIONS[name] for name in SELECTED_REGIONS},
+              'threshold_percentage': CONTINENT_THRESHOLD_PERCENTAGE,
+              # None for the exact polygon tests
+              'land_mask_resolution': None if land_mask is None else 360 / land_mask.shape[1]}
+    # Round trip through JSON so it compares equal to the config stored in the manifest
+    return json.loads(json.dumps(config))
+
+def load_manifest(manifest_file=MANIFEST_FILE):
+    """
+    Loads the manifest of processed raw track files, or an empty one if it does not exist.
+    For each file, the manifest holds its fingerprint and the IDs of the tracks it contains.
+    """
+    if not os.path.exists(manifest_file):
+        return {'config': None, 'files': {}}
+    with open(manifest_file) as file:
+        return json.load(file)
 
-    # Filter the tracks, excluding systems that spend 80% of their time in the over the continent
-    continent_shapefile = '../natural_earth_continents/ne_50m_land.shp'
-    continent_gdf = gpd.read_file(continent_shapefile)
-    logger.info("Filtering tracks by continent")
-    filtered_tracks_no_continental = filter_tracks_by_continent(filtered_tracks, continent_gdf)
+def save_manifest(manifest, manifest_file=MANIFEST_FILE):
+    """
+    Saves the manifest atomically, so an interrupted run never leaves a partial manifest.
+    """
+    tmp_file = manifest_file + '.tmp'
+    with open(tmp_file, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(tmp_file, manifest_file)
+
+def read_track_ids(filepath):
+    """
+    Reads the unique track IDs in a raw track file.
+    """
+    return pd.read_csv(filepath, header=None, usecols=[0])[0].unique().tolist()
+
+def build_manifest(file_list, previous_manifest=None, land_mask=None):
+    """
+    Builds the manifest entries for a list of raw track files.
+
+    Parameters:
+    file_list (list): Paths to the raw track files.
+    previous_manifest (dict): Manifest from a previous run, used to avoid rehashing unchanged files.
+    land_mask (np.ndarray): Rasterized land mask used by the selection, see selection_config.
+
+    Returns:
+    dict: Manifest with the current selection config and one entry per file.
+    """
+    previous_files = (previous_manifest or {}).get('files', {})
+    with Pool() as pool:
+        track_ids = pool.map(read_track_ids, file_list)
+    files = {}
+    for filepath, ids in zip(file_list, track_ids):
+        name = os.path.basename(filepath)
+        files[name] = {**file_fingerprint(filepath, previous_files.get(name)), 'track_ids': ids}
+    return {'config': selection_config(land_mask), 'files': files}
+
+def update_selection_incrementally(continent_gdf, logger, land_mask=None, num_workers=1):
+    """
+    Updates the selected tracks, reprocessing only the raw track files that are new or changed since the last run.
+
+    The affected tracks are the ones found in new, changed or removed files, before or after the change.
+    Tracks crossing month-file boundaries are rebuilt from all the files containing them. The affected tracks
+    are removed from the output file and the ones passing the selection are merged back. If the track store
+    exists, the partitions of the changed files are converted again.
+
+    Parameters:
+    continent_gdf (GeoDataFrame): Land polygons.
+    logger (logging.Logger): Logger for logging information.
+    land_mask (np.ndarray): Rasterized land mask, see filter_tracks_by_continent.
+    num_workers (int): Number of processes used for the continent filter.
+
+    Returns:
+    bool: False if no previous run can be reused and a full run is needed, True otherwise.
+    """
+    manifest = load_manifest()
+    if manifest['config'] != selection_config(land_mask) or not os.path.exists(OUTPUT_FILE):
+        logger.info("No previous selection with the current parameters, a full run is needed.")
+        return False
+
+    file_paths = {os.path.basename(path): path for path in sorted(glob(os.path.join(TRACKS_RAW_DIR, RAW_FILE_GLOB)))}
+    previous_files = manifest['files']
+    fingerprints = {name: file_fingerprint(path, previous_files.get(name)) for name, path in file_paths.items()}
+    changed = [name for name, fingerprint in fingerprints.items()
+               if name not in previous_files or previous_files[name]['sha256'] != fingerprint['sha256']]
+    removed = [name for name in previous_files if name not in file_paths]
+    logger.info(f"{len(changed)} new or changed and {len(removed)} removed raw track files")
+
+    files = {name: {**fingerprint, 'track_ids': previous_files.get(name, {}).get('track_ids', [])}
+             for name, fingerprint in fingerprints.items()}
+    if not changed and not removed:
+        save_manifest({'config': manifest['config'], 'files': files})
+        logger.info("Selection is up to date.")
+        return True
+
+    affected_ids = {track_id for name in changed + removed for track_id in previous_files.get(name, {}).get('track_ids', [])}
+    changed_tracks = []
+    for name in changed:
+        month_tracks = add_partition_offsets(read_raw_track_file(file_paths[name]), *partition_from_filename(name))
+        files[name]['track_ids'] = month_tracks['track_id'].unique().tolist()
+        affected_ids.update(files[name]['track_ids'])
+        changed_tracks.append(month_tracks)
+    # Unchanged files holding other parts of the affected tracks
+    for name, entry in files.items():
+        if name not in changed and affected_ids.intersection(entry['track_ids']):
+            month_tracks = add_partition_offsets(read_raw_track_file(file_paths[name]), *partition_from_filename(name))
+            changed_tracks.append(month_tracks[month_tracks['track_id'].isin(affected_ids)])
+    if store_exists(TRACK_STORE_DIR):
+        for name in changed:
+            convert_track_file(file_paths[name], TRACK_STORE_DIR)
+        for name in removed:
+            shutil.rmtree(os.path.dirname(partition_path(TRACK_STORE_DIR, *partition_from_filename(name))),
+                          ignore_errors=True)
+
+    logger.info(f"Reprocessing {len(affected_ids)} affected tracks")
+    if changed_tracks:
+        tracks = pd.concat(changed_tracks, ignore_index=True).drop_duplicates(['track_id', 'date'])
+        tracks = tracks.sort_values(['track_id', 'date'], kind='stable').reset_index(drop=True)
+        _, selected_tracks, summary = apply_selection(tracks, continent_gdf, logger, land_mask, num_workers)
+    else:
+        # Only removed files, whose tracks are not in any other file: they are just dropped
+        selected_tracks, summary = pd.DataFrame(columns=OUTPUT_COLUMNS), None
+
+    previous_output = pd.read_csv(OUTPUT_FILE, parse_dates=['date'])
+    previous_output = previous_output[~previous_output['track_id'].isin(affected_ids)]
+    if len(selected_tracks):
+        merged = pd.concat([previous_output, selected_tracks[OUTPUT_COLUMNS]], ignore_index=True)
+    else:
+        merged = previous_output
+    merged = merged.sort_values(['track_id', 'date'], kind='stable')
+    tmp_file = OUTPUT_FILE + '.tmp'
+    merged.to_csv(tmp_file, index=False)
+    os.replace(tmp_file, OUTPUT_FILE)
+    if os.path.exists(TRACK_SUMMARY_FILE):
+        previous_summary = load_track_summary()
+        previous_summary = previous_summary[~previous_summary.index.isin(affected_ids)]
+        if summary is not None:
+            previous_summary = pd.concat([previous_summary, summary])
+        save_track_summary(previous_summary.sort_index())
+    save_manifest({'config': manifest['config'], 'files': files})
+    logger.info(f"Merged {selected_tracks['track_id'].nunique()} selected tracks into {OUTPUT_FILE}")
+    return True
+
+def sweep_selection(summary, thresholds, region_definitions=None, selected_regions=SELECTED_REGIONS):
+    """
+    Evaluates a grid of continent thresholds and region definitions against the cached per-track quantities
+    (genesis point and land percentage) of the track summary, without reprocessing any track.
+
+    Parameters:
+    summary (DataFrame): Track summary, see track_summary.build_track_summary.
+    thresholds (list): Continent threshold percentages to evaluate.
+    region_definitions (dict): Name -> regions dictionary in the same format as REGIONS. Defaults to REGIONS.
+    selected_regions (list): Regions counted together in the 'selected' rows, as in the normal selection.
+
+    Returns:
+    DataFrame: One row per (region_definition, threshold_percentage, region), with the number of tracks and
+               their IDs. The 'selected' region rows combine the selected_regions.
+    """
+    region_definitions = region_definitions or {'default': REGIONS}
+    track_ids = summary.index.to_numpy()
+    land_percentage = summary['land_percentage'].to_numpy()
+    rows = []
+    for definition_name, regions in region_definitions.items():
+        genesis_region = classify_genesis_regions(summary['genesis_lon'], summary['genesis_lat'], regions)
+        in_selected_regions = np.isin(genesis_region, [name for name in selected_regions if name in regions])
+        region_masks = {region_name: genesis_region == region_name for region_name in regions}
+        region_masks['selected'] = in_selected_regions
+        for threshold in thresholds:
+            below_threshold = land_percentage < threshold
+            for region_name, in_region in region_masks.items():
+                ids = track_ids[in_region & below_threshold]
+                rows.append({'region_definition': definition_name, 'threshold_percentage': threshold,
+                             'region': region_name, 'num_tracks': len(ids), 'track_ids': ids.tolist()})
+    return pd.DataFrame(rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Select SAt tracks by genesis region and time spent over the continent.")
+    parser.add_argument('--land-mask-resolution', type=float, default=None,
+                        help="Use a rasterized land mask with this resolution (degrees) instead of exact polygon tests.")
+    parser.add_argument('--compare-land-methods', action='store_true',
+                        help="Report how much the rasterized land mask disagrees with the exact polygon tests.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of processes used for the continent filter (shared-memory worker path if > 1).")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only reprocess raw track files that are new or changed since the last run.")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Select the tracks in a single bounded-memory pass over the monthly files.")
+    parser.add_argument('--chunk-rows', type=int, default=100_000,
+                        help="Maximum number of rows read at once in streaming mode.")
+    parser.add_argument('--sweep', action='store_true',
+                        help="Evaluate a grid of continent thresholds and region definitions from the track summary.")
+    parser.add_argument('--sweep-thresholds', type=float, nargs='+', default=[50, 60, 70, 80, 90, 100],
+                        help="Continent threshold percentages evaluated by --sweep.")
+    parser.add_argument('--sweep-regions', default=None,
+                        help="JSON file mapping names to alternative region definitions (same format as REGIONS).")
+    args = parser.parse_args()
+
+    logger = configure_logging()
+
+    # The sweep only needs the per-track quantities cached in the track summary
+    if args.sweep and os.path.exists(TRACK_SUMMARY_FILE):
+        region_definitions = {'default': REGIONS}
+        if args.sweep_regions:
+            with open(args.sweep_regions) as file:
+                region_definitions.update(json.load(file))
+        sweep = sweep_selection(load_track_summary(), args.sweep_thresholds, region_definitions)
+        sweep.to_parquet(SWEEP_FILE)
+        counts = sweep.pivot_table(index=['region_definition', 'region'], columns='threshold_percentage',
+                                   values='num_tracks', aggfunc='first', sort=False)
+        logger.info(f"Track counts per configuration:\n{counts.to_string()}")
+        logger.info(f"Sweep results saved to {SWEEP_FILE}")
+        sys.exit(0)
+    elif args.sweep:
+        logger.error(f"{TRACK_SUMMARY_FILE} not found: run select_tracks.py once before using --sweep")
+        sys.exit(1)
+
+    logger.info("Starting track processing")
+
+    continent_gdf = gpd.read_file(CONTINENT_SHAPEFILE)
+    land_mask = None
+    if args.land_mask_resolution or args.compare_land_methods:
+        land_mask = load_land_mask(continent_gdf, args.land_mask_resolution or LAND_MASK_RESOLUTION)
+        logger.info(f"Using land mask with {360 / land_mask.shape[1]:g} degrees resolution")
+    selection_land_mask = land_mask if args.land_mask_resolution else None
+    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
+
+    if args.incremental and update_selection_incrementally(continent_gdf, logger, selection_land_mask, args.workers):
+        logger.info("Track processing completed.")
+        sys.exit(0)
+
+    # Fingerprint the raw files before reading them, so the manifest describes the data that was selected
+    # and a file changed during the run is picked up by the next --incremental run
+    manifest = build_manifest(sorted(glob(os.path.join(TRACKS_RAW_DIR, RAW_FILE_GLOB))), load_manifest(),
+                              selection_land_mask)
+    if args.streaming:
+        region_counts, summary = stream_selection(continent_gdf, logger, OUTPUT_FILE, args.chunk_rows,
+                                                  selection_land_mask)
+        for region_name, num_tracks in region_counts.items():
+            logger.info(f"Number of tracks in {region_name if pd.notnull(region_name) else 'no region'}: {num_tracks}")
+        logger.info(f"Filtered tracks saved to {OUTPUT_FILE}")
+        save_track_summary(summary)
+        logger.info(f"Track summary saved to {TRACK_SUMMARY_FILE}")
+        save_manifest(manifest)
+        logger.info("Track processing completed.")
+        sys.exit(0)
+
+    # Get the tracks, with their position in the track store for the track summary
+    if store_exists(TRACK_STORE_DIR):
+        tracks = get_tracks(logger, columns=TRACK_COLUMNS + ['year', 'month'])
+        tracks['partition_row'] = tracks.groupby(['year', 'month']).cumcount()
+    else:
+        tracks = get_tracks(logger)
+
+    if args.compare_land_methods:
+        report = compare_land_methods(tracks, build_land_index(continent_gdf), land_mask)
+        for key, value in report.items():
+            logger.info(f"Land mask comparison - {key}: {value}")
+
+    # Filter the tracks by region and time over the continent. Here we will work only with tracks that
+    # have genesis in one of the regions over South American coast (ARG, LA-PLATA and SE-BR) and exclude
+    # systems that spend 80% of their time over the continent.
+    logger.info("Filtering tracks by region")
+    tracks, filtered_tracks_no_continental, summary = apply_selection(tracks, continent_gdf, logger,
+                                                                      selection_land_mask, args.workers)
 
     verify_track_numbers(tracks, logger)
 
-    os.makedirs('../tracks_SAt_filtered', exist_ok=True)
-    output_file = '../tracks_SAt_filtered/tracks_SAt_filtered.csv'
-    filtered_tracks_no_continental.to_csv(output_file, index=False)
-    logger.info(f"Filtered tracks saved to {output_file}")
+    filtered_tracks_no_continental[OUTPUT_COLUMNS].to_csv(OUTPUT_FILE, index=False)
+    logger.info(f"Filtered tracks saved to {OUTPUT_FILE}")
+    save_track_summary(summary)
+    logger.info(f"Track summary saved to {TRACK_SUMMARY_FILE}")
+
+    # Record the processed raw files, so later runs can use --incremental
+    save_manifest(manifest)
+    logger.info(f"Manifest of processed files saved to {MANIFEST_FILE}")
     logger.info("Track processing completed.")
-    
\ No newline at end of file
@@ -0,0 +1,129 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    synthetic_tracks.py                                :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2026/10/17 16:40:12 by daniloceano       #+#    #+#              #
+#    Updated: 2026/10/17 16:40:12 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Synthetic track generator for benchmarking.
+
+Writes monthly track files in the exact format of tracks_SAt (ff_cyc_SAt_era5_YYYYMM.csv, no header,
+columns track_id, date, lon vor, lat vor, vor42), at a configurable multiple of the size of the real archive.
+The number of tracks per month, track lengths, genesis positions, drift and vor42 values roughly follow
+the statistics of the real 1979-2020 archive, so the select_tracks stages see realistic region and
+land fractions.
+
+Usage:
+- python synthetic_tracks.py --scale 2 --output ../benchmarks/data/scale_2/tracks_SAt
+"""
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+# Statistics of the real archive
+TRACKS_PER_MONTH = 88
+MIN_TRACK_LENGTH = 24  # Hours
+MEDIAN_EXTRA_LENGTH = 44  # Hours above the minimum
+MAX_TRACK_LENGTH = 480
+GENESIS_LON = (-40, 50)  # Mean and standard deviation
+GENESIS_LAT = (-45, 15)
+LON_DRIFT = (0.4, 0.3)  # Degrees per hour
+LAT_DRIFT = (-0.03, 0.1)
+
+def generate_month(year, month, num_tracks, first_sequence, id_digits, rng):
+    """
+    Generates the tracks with genesis in a given month.
+
+    Parameters:
+    year (int): Year of the month.
+    month (int): Month.
+    num_tracks (int): Number of tracks of the month.
+    first_sequence (int): Sequence number of the first track of the month within its year.
+    id_digits (int): Number of digits of the sequence number in the track IDs, the same for the whole year.
+    rng (np.random.Generator): Random number generator.
+
+    Returns:
+    DataFrame: Rows with columns track_id, date, lon vor, lat vor and vor42, in the raw file format.
+    """
+    month_start = pd.Timestamp(year=year, month=month, day=1)
+    hours_in_month = int((month_start + pd.offsets.MonthBegin(1) - month_start) / pd.Timedelta(hours=1))
+    lengths = np.clip(MIN_TRACK_LENGTH + np.round(MEDIAN_EXTRA_LENGTH * rng.lognormal(0, 0.7, num_tracks)),
+                      MIN_TRACK_LENGTH, MAX_TRACK_LENGTH).astype(np.int64)
+    genesis_hour = rng.integers(0, hours_in_month, num_tracks)
+
+    # One row per time step, with the index of its track and the step number within the track
+    track_index = np.repeat(np.arange(num_tracks), lengths)
+    track_starts = np.r_[0, np.cumsum(lengths)[:-1]]
+    step = np.arange(len(track_index)) - track_starts[track_index]
+
+    sequence = first_sequence + np.arange(num_tracks)
+    track_id = year * 10 ** id_digits + sequence
+
+    # Cumulative drift restarted at the beginning of each track
+    lon_drift = np.cumsum(rng.normal(*LON_DRIFT, len(step)))
+    lat_drift = np.cumsum(rng.normal(*LAT_DRIFT, len(step)))
+    lon = rng.normal(*GENESIS_LON, num_tracks)[track_index] + lon_drift - lon_drift[track_starts][track_index]
+    lat = rng.normal(*GENESIS_LAT, num_tracks)[track_index] + lat_drift - lat_drift[track_starts][track_index]
+    lat = np.clip(lat, -89, -1)
+    # The real files mix the -180/180 and 0/360 conventions, with values above 180 for tracks crossing the date line
+    lon = np.where(lon < -180, lon + 360, lon)
+
+    life_fraction = (step + 1) / (lengths[track_index] + 1)
+    peak = rng.uniform(1, 10, num_tracks)[track_index]
+    vor42 = 1 + peak * np.sin(np.pi * life_fraction) + rng.normal(0, 0.05, len(step))
+
+    dates = month_start + pd.to_timedelta(genesis_hour[track_index] + step, unit='h')
+    return pd.DataFrame({'track_id': track_id[track_index], 'date': dates.strftime('%Y-%m-%d %H:%M:%S'),
+                         'lon vor': lon, 'lat vor': lat, 'vor42': np.abs(vor42)})
+
+def generate_tracks(output_dir, scale=1.0, start_year=1979, end_year=2020, seed=0):
+    """
+    Writes synthetic monthly track files.
+
+    Parameters:
+    output_dir (str): Directory where the 'ff_cyc_SAt_era5_YYYYMM.csv' files are written.
+    scale (float): Multiple of the size of the real archive.
+    start_year (int): First year.
+    end_year (int): Last year, inclusive.
+    seed (int): Seed of the random number generator, for reproducible archives.
+
+    Returns:
+    int: Total number of rows written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    total_rows = 0
+    for year in range(start_year, end_year + 1):
+        # The track counts of the whole year are drawn first, so all its track IDs have the same number of
+        # digits (YYYY#### as in the real archive, more only if the year has over 9999 tracks) and sort
+        # chronologically
+        month_tracks = rng.poisson(TRACKS_PER_MONTH * scale, 12)
+        id_digits = max(4, len(str(month_tracks.sum())))
+        sequence = 1
+        for month, num_tracks in enumerate(month_tracks, start=1):
+            tracks = generate_month(year, month, num_tracks, sequence, id_digits, rng)
+            sequence += num_tracks
+            output_path = os.path.join(output_dir, f"ff_cyc_SAt_era5_{year}{month:02d}.csv")
+            tracks.to_csv(output_path, header=False, index=False, float_format='%.5f')
+            total_rows += len(tracks)
+    return total_rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic track files in the tracks_SAt format.")
+    parser.add_argument('--output', required=True, help="Output directory.")
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiple of the size of the real archive.")
+    parser.add_argument('--start-year', type=int, default=1979)
+    parser.add_argument('--end-year', type=int, default=2020)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rows = generate_tracks(args.output, args.scale, args.start_year, args.end_year, args.seed)
+    print(f"Wrote {rows} rows to {args.output}")
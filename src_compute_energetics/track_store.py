@@ -0,0 +1,338 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    track_store.py                                     :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2026/10/17 09:12:40 by daniloceano       #+#    #+#              #
+#    Updated: 2026/10/17 09:12:40 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Columnar storage for the SAt track data set.
+
+The raw tracks are distributed as one CSV file per month (tracks_SAt/ff_cyc_SAt_era5_YYYYMM.csv),
+each file holding every system with genesis in that month. Parsing the ~500 files as text on every
+run is the most expensive part of reading the archive, so this module converts them once into a
+Parquet data set partitioned by year and month (year=YYYY/month=MM/tracks.parquet), with typed
+columns, parsed datetimes and longitudes already converted to the -180 to 180 range.
+
+The reader (read_tracks) supports column projection and predicate pushdown by date range,
+track_id range and bounding box, so callers only load the rows and columns they need.
+
+Each partition records the fingerprint of the raw file it was converted from in its Parquet metadata.
+refresh_track_store compares them with the raw directory, converts the new or changed files again and
+removes the partitions whose raw file is gone, so the store never serves stale tracks.
+
+Usage:
+- Run this script once from the src_compute_energetics directory to build '../tracks_SAt_store'.
+- select_tracks.get_tracks will then read from the store instead of the raw CSV files.
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+from glob import glob
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from tqdm import tqdm
+
+TRACKS_RAW_DIR = '../tracks_SAt'
+TRACK_STORE_DIR = '../tracks_SAt_store'
+TRACK_COLUMNS = ['track_id', 'date', 'lon vor', 'lat vor', 'vor42']
+TRACK_SCHEMA = pa.schema([
+    ('track_id', pa.int64()),
+    ('date', pa.timestamp('s')),
+    ('lon vor', pa.float64()),
+    ('lat vor', pa.float64()),
+    ('vor42', pa.float64()),
+])
+PARTITION_SCHEMA = pa.schema([('year', pa.int32()), ('month', pa.int32())])
+RAW_FILE_PATTERN = re.compile(r'ff_cyc_SAt_era5_(\d{4})(\d{2})\.csv$')
+RAW_FILE_GLOB = 'ff_cyc_SAt_era5_*.csv'
+
+def file_fingerprint(filepath, previous=None):
+    """
+    Returns the size, modification time and SHA-256 hash of a file.
+    The hash is reused from the previous fingerprint when size and modification time did not change.
+
+    Parameters:
+    filepath (str): Path to the file.
+    previous (dict): Previous fingerprint of the same file, if any.
+
+    Returns:
+    dict: Fingerprint with 'size', 'mtime' and 'sha256' keys.
+    """
+    stat = os.stat(filepath)
+    fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+    if previous and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime_ns:
+        fingerprint['sha256'] = previous['sha256']
+        return fingerprint
+    sha256 = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha256.update(block)
+    fingerprint['sha256'] = sha256.hexdigest()
+    return fingerprint
+
+def partition_from_filename(filepath):
+    """
+    Extracts the year and month of a raw track file from its name.
+
+    Parameters:
+    filepath (str): Path to a file named like 'ff_cyc_SAt_era5_YYYYMM.csv'.
+
+    Returns:
+    tuple: (year, month) as integers.
+    """
+    match = RAW_FILE_PATTERN.search(os.path.basename(filepath))
+    if match is None:
+        raise ValueError(f"Unexpected track file name: {filepath}")
+    return int(match.group(1)), int(match.group(2))
+
+def partition_path(store_dir, year, month):
+    """
+    Returns the path of the Parquet file holding the tracks of a given year and month.
+    """
+    return os.path.join(store_dir, f"year={year}", f"month={month:02d}", "tracks.parquet")
+
+def read_raw_track_file(filepath):
+    """
+    Reads a raw monthly track CSV file into a typed DataFrame.
+    Dates are parsed and longitudes are converted from 0-360 to -180-180.
+
+    Parameters:
+    filepath (str): Path to the CSV file.
+
+    Returns:
+    DataFrame: Track data with columns track_id, date, lon vor, lat vor and vor42.
+    """
+    tracks = pd.read_csv(filepath, header=None, names=TRACK_COLUMNS,
+                         dtype={'track_id': 'int64', 'lon vor': 'float64', 'lat vor': 'float64', 'vor42': 'float64'})
+    tracks['date'] = pd.to_datetime(tracks['date'], format='%Y-%m-%d %H:%M:%S').astype('datetime64[s]')
+    tracks['lon vor'] = np.where(tracks['lon vor'] > 180, tracks['lon vor'] - 360, tracks['lon vor'])
+    return tracks
+
+def convert_track_file(filepath, store_dir=TRACK_STORE_DIR):
+    """
+    Converts a single raw monthly track file into its Parquet partition.
+
+    Parameters:
+    filepath (str): Path to the raw CSV file.
+    store_dir (str): Root directory of the columnar track store.
+
+    Returns:
+    str: Path to the written Parquet file.
+    """
+    year, month = partition_from_filename(filepath)
+    output_path = partition_path(store_dir, year, month)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    # Fingerprint the file before reading it, so a change during the conversion is caught by the next refresh
+    source = {'name': os.path.basename(filepath), **file_fingerprint(filepath)}
+    table = pa.Table.from_pandas(read_raw_track_file(filepath), schema=TRACK_SCHEMA, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'source': json.dumps(source)})
+    # Write to a temporary file first so an interrupted conversion never leaves a truncated partition
+    tmp_path = output_path + '.tmp'
+    pq.write_table(table, tmp_path, compression='zstd')
+    os.replace(tmp_path, output_path)
+    return output_path
+
+def convert_tracks_to_store(raw_dir=TRACKS_RAW_DIR, store_dir=TRACK_STORE_DIR, logger=None):
+    """
+    One-time conversion of all raw monthly track files into the partitioned columnar store.
+
+    Parameters:
+    raw_dir (str): Directory containing the raw 'ff_cyc_SAt_era5_YYYYMM.csv' files.
+    store_dir (str): Root directory of the columnar track store.
+    logger (logging.Logger): Logger for logging information.
+
+    Returns:
+    list: Paths to the written Parquet files.
+    """
+    logger = logger or logging.getLogger(__name__)
+    file_list = sorted(glob(os.path.join(raw_dir, RAW_FILE_GLOB)))
+    logger.info(f"Converting {len(file_list)} raw track files to {store_dir}...")
+    with Pool() as pool:
+        written = pool.starmap(convert_track_file, tqdm([(filepath, store_dir) for filepath in file_list]))
+    logger.info("Done.")
+    return written
+
+def store_exists(store_dir=TRACK_STORE_DIR):
+    """
+    Checks whether the columnar track store has been built.
+    """
+    return bool(glob(os.path.join(store_dir, 'year=*', 'month=*', 'tracks.parquet')))
+
+def partition_source(path):
+    """
+    Returns the fingerprint of the raw file a partition was converted from, with its 'name',
+    or None for partitions written before the fingerprints were recorded.
+    """
+    metadata = pq.read_schema(path).metadata or {}
+    return json.loads(metadata[b'source']) if b'source' in metadata else None
+
+def stale_partitions(raw_dir=TRACKS_RAW_DIR, store_dir=TRACK_STORE_DIR):
+    """
+    Compares the track store with the raw track files.
+
+    Parameters:
+    raw_dir (str): Directory containing the raw 'ff_cyc_SAt_era5_YYYYMM.csv' files.
+    store_dir (str): Root directory of the columnar track store.
+
+    Returns:
+    tuple: (raw files that are new or changed since their conversion, partition files whose raw file is gone).
+    """
+    file_list = sorted(glob(os.path.join(raw_dir, RAW_FILE_GLOB)))
+    stale, expected = [], set()
+    for filepath in file_list:
+        output_path = partition_path(store_dir, *partition_from_filename(filepath))
+        expected.add(output_path)
+        source = partition_source(output_path) if os.path.exists(output_path) else None
+        if (source is None or source['name'] != os.path.basename(filepath)
+                or file_fingerprint(filepath, source)['sha256'] != source['sha256']):
+            stale.append(filepath)
+    orphans = [path for path in sorted(glob(os.path.join(store_dir, 'year=*', 'month=*', 'tracks.parquet')))
+               if path not in expected]
+    return stale, orphans
+
+def refresh_track_store(raw_dir=TRACKS_RAW_DIR, store_dir=TRACK_STORE_DIR, logger=None):
+    """
+    Brings the track store up to date with the raw track files: the new or changed files are converted
+    again and the partitions whose raw file is gone are removed. Without any raw file, the store is
+    used as it is.
+
+    Parameters:
+    raw_dir (str): Directory containing the raw 'ff_cyc_SAt_era5_YYYYMM.csv' files.
+    store_dir (str): Root directory of the columnar track store.
+    logger (logging.Logger): Logger for logging information.
+
+    Returns:
+    int: Number of partitions converted or removed.
+    """
+    logger = logger or logging.getLogger(__name__)
+    if not glob(os.path.join(raw_dir, RAW_FILE_GLOB)):
+        logger.warning(f"No raw track files in {raw_dir}: the track store cannot be checked for changes.")
+        return 0
+    stale, orphans = stale_partitions(raw_dir, store_dir)
+    if stale:
+        logger.info(f"Converting {len(stale)} new or changed raw track files to {store_dir}...")
+        with Pool() as pool:
+            pool.starmap(convert_track_file, [(filepath, store_dir) for filepath in stale])
+    for path in orphans:
+        logger.info(f"Removing {os.path.dirname(path)}: its raw track file is gone")
+        os.remove(path)
+        if not os.listdir(os.path.dirname(path)):
+            os.rmdir(os.path.dirname(path))
+    return len(stale) + len(orphans)
+
+def open_track_store(store_dir=TRACK_STORE_DIR):
+    """
+    Opens the columnar track store as a pyarrow Dataset with year/month hive partitioning.
+    """
+    return ds.dataset(store_dir, format='parquet', schema=TRACK_SCHEMA.append(PARTITION_SCHEMA.field('year'))
+                      .append(PARTITION_SCHEMA.field('month')),
+                      partitioning=ds.partitioning(PARTITION_SCHEMA, flavor='hive'))
+
+def build_filter(date_range=None, track_id_range=None, bbox=None):
+    """
+    Builds the pyarrow filter expression used for predicate pushdown.
+
+    Since each partition holds the systems with genesis in its month, the upper bound of a date range
+    also prunes whole partitions, while the lower bound relies on the Parquet column statistics.
+
+    Parameters:
+    date_range (tuple): (start, end) datetimes, inclusive. Either bound can be None.
+    track_id_range (tuple): (first_id, last_id), inclusive. Either bound can be None.
+    bbox (tuple): (lon_min, lat_min, lon_max, lat_max), the same convention used for REGIONS.
+
+    Returns:
+    pyarrow.dataset.Expression or None: The filter, or None if no predicate was given.
+    """
+    conditions = []
+    if date_range is not None:
+        start, end = date_range
+        if start is not None:
+            conditions.append(ds.field('date') >= pa.scalar(pd.Timestamp(start).to_pydatetime(), pa.timestamp('s')))
+        if end is not None:
+            end = pd.Timestamp(end)
+            conditions.append(ds.field('date') <= pa.scalar(end.to_pydatetime(), pa.timestamp('s')))
+            conditions.append((ds.field('year') < end.year) |
+                              ((ds.field('year') == end.year) & (ds.field('month') <= end.month)))
+    if track_id_range is not None:
+        first_id, last_id = track_id_range
+        if first_id is not None:
+            conditions.append(ds.field('track_id') >= first_id)
+        if last_id is not None:
+            conditions.append(ds.field('track_id') <= last_id)
+    if bbox is not None:
+        lon_min, lat_min, lon_max, lat_max = bbox
+        conditions.append((ds.field('lon vor') >= lon_min) & (ds.field('lon vor') <= lon_max) &
+                          (ds.field('lat vor') >= lat_min) & (ds.field('lat vor') <= lat_max))
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+def read_tracks(store_dir=TRACK_STORE_DIR, columns=None, date_range=None, track_id_range=None, bbox=None):
+    """
+    Reads track data from the columnar store, loading only the requested columns and rows.
+
+    Parameters:
+    store_dir (str): Root directory of the columnar track store.
+    columns (list): Columns to load. Defaults to all track columns.
+    date_range (tuple): (start, end) datetimes, inclusive.
+    track_id_range (tuple): (first_id, last_id), inclusive.
+    bbox (tuple): (lon_min, lat_min, lon_max, lat_max). Note that this selects time steps, not whole tracks.
+
+    Returns:
+    pd.DataFrame: The selected track data, ordered by partition and by track within each partition.
+    """
+    columns = list(columns) if columns is not None else TRACK_COLUMNS
+    dataset = open_track_store(store_dir)
+    table = dataset.to_table(columns=columns,
+                             filter=build_filter(date_range, track_id_range, bbox))
+    return table.to_pandas()
+
+def iter_track_chunks(raw_dir=TRACKS_RAW_DIR, store_dir=TRACK_STORE_DIR, chunk_rows=100_000):
+    """
+    Iterates over the track data in chronological order of the monthly files, in chunks of bounded size.
+    Reads from the columnar store when it exists, after bringing it up to date with the raw files
+    (see refresh_track_store), and from the raw CSV files otherwise.
+
+    Parameters:
+    raw_dir (str): Directory containing the raw 'ff_cyc_SAt_era5_YYYYMM.csv' files.
+    store_dir (str): Root directory of the columnar track store.
+    chunk_rows (int): Maximum number of rows per chunk.
+
+    Yields:
+    tuple: (year, month, DataFrame) for each chunk, with the same columns and types as read_raw_track_file.
+    """
+    if store_exists(store_dir):
+        refresh_track_store(raw_dir, store_dir)
+        for path in sorted(glob(os.path.join(store_dir, 'year=*', 'month=*', 'tracks.parquet'))):
+            year = int(os.path.basename(os.path.dirname(os.path.dirname(path))).split('=')[1])
+            month = int(os.path.basename(os.path.dirname(path)).split('=')[1])
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=TRACK_COLUMNS):
+                yield year, month, batch.to_pandas()
+        return
+    for filepath in sorted(glob(os.path.join(raw_dir, RAW_FILE_GLOB))):
+        year, month = partition_from_filename(filepath)
+        for chunk in pd.read_csv(filepath, header=None, names=TRACK_COLUMNS, chunksize=chunk_rows,
+                                 dtype={'track_id': 'int64', 'lon vor': 'float64', 'lat vor': 'float64', 'vor42': 'float64'}):
+            chunk['date'] = pd.to_datetime(chunk['date'], format='%Y-%m-%d %H:%M:%S').astype('datetime64[s]')
+            chunk['lon vor'] = np.where(chunk['lon vor'] > 180, chunk['lon vor'] - 360, chunk['lon vor'])
+            yield year, month, chunk
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    convert_tracks_to_store(logger=logging.getLogger(__name__))
@@ -0,0 +1,181 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    track_summary.py                                   :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2026/10/17 14:26:51 by daniloceano       #+#    #+#              #
+#    Updated: 2026/10/17 14:26:51 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Per-track summary index.
+
+Holds one row per track with its genesis and lysis position and time, duration, bounding box,
+maximum and minimum vor42, percentage of time steps over land, region of genesis, whether it passed
+the selection, and its row offsets into the columnar track store (see track_store.py).
+
+The summary is built by select_tracks.py. Counts and selections such as "ARG-genesis systems lasting
+more than 48 h" become lookups on this small table, and the rows of a single track are read as a
+slice of its store partition instead of a boolean mask over the whole archive.
+
+Usage:
+- python track_summary.py --region ARG --min-duration 48
+"""
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from track_store import TRACK_STORE_DIR, partition_path
+
+TRACK_SUMMARY_FILE = '../tracks_SAt_filtered/track_summary.parquet'
+
+def add_partition_offsets(tracks, year, month, first_row=0):
+    """
+    Adds the store partition and the row position within it to tracks read from a single monthly file.
+
+    Parameters:
+    tracks (DataFrame): Rows of one monthly file, in file order.
+    year (int): Year of the monthly file.
+    month (int): Month of the monthly file.
+    first_row (int): Position of the first row within the file.
+
+    Returns:
+    DataFrame: The tracks with 'year', 'month' and 'partition_row' columns.
+    """
+    return tracks.assign(year=year, month=month, partition_row=np.arange(first_row, first_row + len(tracks)))
+
+def build_track_summary(tracks, land_fractions=None, genesis_region=None, selected_ids=None):
+    """
+    Builds the per-track summary table in a single grouped pass.
+
+    Parameters:
+    tracks (DataFrame): Complete tracks. If it has 'year', 'month' and 'partition_row' columns
+                        (see add_partition_offsets), the row offsets into the track store are included.
+    land_fractions (DataFrame): Per-track land fractions, see land_mask.compute_land_fractions.
+    genesis_region (pd.Series): Region of genesis of each track, indexed by track_id.
+    selected_ids (array-like): IDs of the tracks that passed the selection.
+
+    Returns:
+    DataFrame: Summary indexed by track_id.
+    """
+    aggregations = {
+        'genesis_date': ('date', 'first'), 'lysis_date': ('date', 'last'),
+        'genesis_lon': ('lon vor', 'first'), 'genesis_lat': ('lat vor', 'first'),
+        'lysis_lon': ('lon vor', 'last'), 'lysis_lat': ('lat vor', 'last'),
+        'lon_min': ('lon vor', 'min'), 'lat_min': ('lat vor', 'min'),
+        'lon_max': ('lon vor', 'max'), 'lat_max': ('lat vor', 'max'),
+        'vor42_max': ('vor42', 'max'), 'vor42_min': ('vor42', 'min'),
+        'time_steps': ('date', 'size'),
+    }
+    has_offsets = {'year', 'month', 'partition_row'}.issubset(tracks.columns)
+    if has_offsets:
+        aggregations.update({'year': ('year', 'first'), 'month': ('month', 'first'),
+                             'row_offset': ('partition_row', 'first')})
+    summary = tracks.groupby('track_id', sort=False).agg(**aggregations)
+    summary['duration_hours'] = (summary['lysis_date'] - summary['genesis_date']) / pd.Timedelta(hours=1)
+    if not has_offsets:
+        summary[['year', 'month', 'row_offset']] = -1
+    summary['land_percentage'] = land_fractions['land_percentage'] if land_fractions is not None else np.nan
+    summary['region'] = genesis_region if genesis_region is not None else None
+    summary['selected'] = summary.index.isin(selected_ids) if selected_ids is not None else False
+    return summary
+
+def save_track_summary(summary, summary_file=TRACK_SUMMARY_FILE):
+    """
+    Saves the track summary as a Parquet file.
+    """
+    tmp_file = summary_file + '.tmp'
+    summary.to_parquet(tmp_file)
+    os.replace(tmp_file, summary_file)
+
+def load_track_summary(summary_file=TRACK_SUMMARY_FILE):
+    """
+    Loads the track summary, indexed by track_id.
+    """
+    return pd.read_parquet(summary_file)
+
+def query_track_summary(summary, region=None, time_window=None, min_duration=None, max_duration=None,
+                        min_vor42=None, genesis_bbox=None, selected_only=False):
+    """
+    Selects tracks from the summary.
+
+    Parameters:
+    summary (DataFrame): Track summary.
+    region (str or list): Region(s) of genesis.
+    time_window (tuple): (start, end) datetimes. Selects tracks active at some time within the window.
+    min_duration (float): Minimum duration, in hours.
+    max_duration (float): Maximum duration, in hours.
+    min_vor42 (float): Minimum value of the maximum vor42 along the track.
+    genesis_bbox (tuple): (lon_min, lat_min, lon_max, lat_max) containing the genesis point.
+    selected_only (bool): Only tracks that passed the selection.
+
+    Returns:
+    DataFrame: The matching rows of the summary.
+    """
+    mask = np.ones(len(summary), dtype=bool)
+    if region is not None:
+        mask &= summary['region'].isin([region] if isinstance(region, str) else region).to_numpy()
+    if time_window is not None:
+        start, end = time_window
+        if start is not None:
+            mask &= (summary['lysis_date'] >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (summary['genesis_date'] <= pd.Timestamp(end)).to_numpy()
+    if min_duration is not None:
+        mask &= (summary['duration_hours'] >= min_duration).to_numpy()
+    if max_duration is not None:
+        mask &= (summary['duration_hours'] <= max_duration).to_numpy()
+    if min_vor42 is not None:
+        mask &= (summary['vor42_max'] >= min_vor42).to_numpy()
+    if genesis_bbox is not None:
+        lon_min, lat_min, lon_max, lat_max = genesis_bbox
+        mask &= summary['genesis_lon'].between(lon_min, lon_max).to_numpy()
+        mask &= summary['genesis_lat'].between(lat_min, lat_max).to_numpy()
+    if selected_only:
+        mask &= summary['selected'].to_numpy()
+    return summary[mask]
+
+def read_track_rows(summary, store_dir=TRACK_STORE_DIR):
+    """
+    Reads the rows of the tracks in a summary (or a query result) from the track store.
+    Each store partition is read once and every track is taken as a slice of it.
+
+    Parameters:
+    summary (DataFrame): Track summary rows, with store offsets.
+    store_dir (str): Root directory of the columnar track store.
+
+    Returns:
+    DataFrame: The rows of the requested tracks.
+    """
+    if (summary['row_offset'] < 0).any():
+        raise ValueError("The summary has no track store offsets: build the track store and rerun select_tracks.py")
+    pieces = []
+    for (year, month), tracks_in_partition in summary.groupby(['year', 'month'], sort=True):
+        table = pq.read_table(partition_path(store_dir, year, month))
+        for row_offset, time_steps in zip(tracks_in_partition['row_offset'], tracks_in_partition['time_steps']):
+            pieces.append(table.slice(row_offset, time_steps))
+    if not pieces:
+        return pd.DataFrame(columns=['track_id', 'date', 'lon vor', 'lat vor', 'vor42'])
+    return pd.concat([piece.to_pandas() for piece in pieces], ignore_index=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the per-track summary index.")
+    parser.add_argument('--region', nargs='+', default=None, help="Region(s) of genesis.")
+    parser.add_argument('--start', default=None, help="Start of the time window.")
+    parser.add_argument('--end', default=None, help="End of the time window.")
+    parser.add_argument('--min-duration', type=float, default=None, help="Minimum duration (hours).")
+    parser.add_argument('--max-duration', type=float, default=None, help="Maximum duration (hours).")
+    parser.add_argument('--min-vor42', type=float, default=None, help="Minimum peak vor42.")
+    parser.add_argument('--selected-only', action='store_true', help="Only tracks that passed the selection.")
+    args = parser.parse_args()
+
+    result = query_track_summary(load_track_summary(), region=args.region, time_window=(args.start, args.end),
+                                 min_duration=args.min_duration, max_duration=args.max_duration,
+                                 min_vor42=args.min_vor42, selected_only=args.selected_only)
+    print(result.groupby('region', dropna=False).size().to_string())
+    print(f"Total: {len(result)} tracks")
@@ -15,104 +15,937 @@ Energy Cycle Analysis for Cyclone Systems
 
 This script is designed to process directories containing results from the Lorenz energy cycle analysis
 of cyclone systems. For each system, it computes average values for specified periods using data from CSV files.
+The period statistics are computed with cumulative sums and a binary search on the time index, so all the
+periods of one or many systems are processed in a single array computation (see period_statistic_arrays).
 
 The script operates in parallel across multiple directories, each representing a different cyclone system,
-to efficiently handle a large dataset. The results are then saved as CSV files, with each file containing
-the average values for the different energy terms across the specified periods of a system's life cycle.
+to efficiently handle a large dataset. Each worker task processes a batch of systems, and the results are
+streamed into a consolidated Parquet database with one row per system, period and statistic.
 
 Usage:
-- Set the 'base_path' variable to the directory containing subdirectories for each cyclone system.
+- python export_results.py [base_path] [--csv] [--incremental]
+- base_path is the directory containing subdirectories for each cyclone system.
 - Ensure that each system's subdirectory contains a 'track_results.csv' with energy term data and a 'periods.csv' with specified periods.
-- The script will output CSV files with averages to the 'database_energy_by_periods' directory.
+- With --incremental, only the systems whose files changed since the last export are processed.
 
 Outputs:
-- A CSV file for each system with the average values of energy terms for specified life cycle periods.
+- A consolidated Parquet database ('database_energy_by_periods.parquet') with the mean, std, min, max,
+  median, sample count and time integral of every energy term for each period of every system.
+- Optionally (--csv), a CSV file for each system with the average values of energy terms for specified
+  life cycle periods, in the 'database_energy_by_periods' directory.
+- The life cycle store ('database_energy_life_cycle.npy' and its index), with the results of every system
+  resampled onto a fixed number of points per life cycle phase (see life_cycle_store.py).
 """
 
 import os
+import json
+import hashlib
+import warnings
+import argparse
+from collections import Counter
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
+from life_cycle_store import (LIFE_CYCLE_ARRAY, LIFE_CYCLE_INDEX, PHASES, POINTS_PER_PHASE, resample_life_cycles,
+                              store_axes, write_life_cycle_store)
 
-def process_system_dir(system_dir, base_path):
+LEC_RESULTS_PATH = '/home/daniloceano/Documents/Programs_and_scripts/LEC_Results_energetic-patterns'
+ENERGETICS_DATABASE = '../database_energy_by_periods.parquet'
+PERIODS_CSV_DIR = '../database_energy_by_periods'
+TRACK_SUMMARY_FILE = '../tracks_SAt_filtered/track_summary.parquet'
+ENERGETICS_MANIFEST = '../database_energy_by_periods_manifest.parquet'
+SOURCE_FILES = ('results', 'periods')
+CHUNK_SIZE = 32
+STATISTICS = ('mean', 'std', 'min', 'max', 'median', 'count', 'integral')
+ORDER_STATISTICS_BLOCK = 1 << 22
+WRITE_ROWS = 8192
+KEY_SCHEMA = pa.schema([
+    ('system_id', pa.int64()),
+    ('phase', pa.string()),
+    ('phase_order', pa.int16()),
+    ('statistic', pa.string()),
+])
+TRACK_METADATA_SCHEMA = pa.schema([
+    ('region', pa.string()),
+    ('genesis_date', pa.timestamp('s')),
+    ('lysis_date', pa.timestamp('s')),
+    ('duration_hours', pa.float64()),
+    ('genesis_lat', pa.float64()),
+    ('genesis_lon', pa.float64()),
+])
+
+def source_files(system_dir, base_path):
     """
-    Process a single system directory to calculate average values for specified periods.
+    Locate the LEC results and the periods files of a single system directory.
 
     Parameters:
-    - system_dir: The directory name of the current system being processed.
+    - system_dir: The directory name of the system.
     - base_path: The base directory path containing all system directories.
 
     Returns:
-    - A tuple containing the system directory name and a DataFrame with average values for each period,
-      or None if the required files are not found or an error occurs.
+    - A tuple (results_path, periods_path). results_path is None if no results file is found.
     """
     # Construct the full path to the system directory
     system_path = os.path.join(base_path, system_dir)
     # Try to find the results CSV file by pattern
-    results_file = next((f for f in os.listdir(system_path) if f.endswith('track_results.csv')), None)
-    if not results_file:
-        # Return None if the file is not found
-        return system_dir, None
+    with os.scandir(system_path) as entries:
+        results_path = next((entry.path for entry in entries if entry.name.endswith('track_results.csv')), None)
+    return results_path, os.path.join(system_path, 'periods.csv')
 
-    # Construct the full paths to the results and periods CSV files
-    results_path = os.path.join(system_path, results_file)
-    periods_path = os.path.join(system_path, 'periods.csv')
+def read_system_dir(system_dir, base_path):
+    """
+    Read the LEC results and the periods of a single system directory.
+
+    Parameters:
+    - system_dir: The directory name of the system.
+    - base_path: The base directory path containing all system directories.
+
+    Returns:
+    - A tuple (results_df, periods_df), or None if the required files are not found.
+    """
+    results_path, periods_path = source_files(system_dir, base_path)
+    if not results_path:
+        return None
 
     try:
         # Attempt to read the CSV files into DataFrames
         results_df = pd.read_csv(results_path, index_col=0, parse_dates=True)
         periods_df = pd.read_csv(periods_path)
     except FileNotFoundError:
+        return None
+
+    return results_df, periods_df
+
+def prepare_systems(systems):
+    """
+    Convert the results and periods of several systems into the arrays used by the period
+    computations. Times are in seconds since the first time step of their system, floored.
+    The period bounds of all systems are parsed at once: starts are ceiled and ends floored,
+    and a missing start or end is replaced by the lowest or highest int64, leaving that side
+    of the period open.
+
+    Parameters:
+    - systems: A list of (results_df, periods_df) tuples. results_df is indexed by time and
+      periods_df holds the period name, start and end in its first three columns. The results of
+      all systems must have the same columns, in the same order (see align_energy_terms).
+
+    Returns:
+    - A dictionary with 'times' and 'values' (one array per system, sorted by time),
+      'system_periods' (the number of periods of each system), and 'period_names', 'starts'
+      and 'ends' (one entry per period of all systems).
+    """
+    times, first_times, values, period_times = [], [], [], []
+    for results_df, periods_df in systems:
+        if not results_df.columns.equals(systems[0][0].columns):
+            raise ValueError(f"Energy terms {list(results_df.columns)} differ from {list(systems[0][0].columns)}")
+        results_df = results_df.sort_index(kind='stable')
+        time_ns = pd.DatetimeIndex(results_df.index).as_unit('ns').asi8
+        first_time = time_ns[0] if len(time_ns) else 0
+        times.append((time_ns - first_time) // 10**9)
+        first_times.append(first_time)
+        values.append(results_df.to_numpy(dtype=np.float64))
+        period_times.append(periods_df.iloc[:, 1:3].to_numpy())
+    system_periods = [len(p) for p in period_times]
+
+    # Parse the period bounds of all systems at once
+    period_times = np.concatenate(period_times)
+    period_first = np.repeat(first_times, system_periods)
+    try:
+        period_bounds = pd.to_datetime(period_times.ravel(), format='ISO8601')
+    except ValueError:
+        period_bounds = pd.to_datetime(period_times.ravel(), format='mixed')
+    period_bounds = pd.DatetimeIndex(period_bounds).as_unit('ns')
+    period_starts, period_ends = period_bounds[0::2], period_bounds[1::2]
+    starts = np.where(period_starts.isna(), np.iinfo(np.int64).min,
+                      -((period_first - period_starts.asi8) // 10**9))
+    ends = np.where(period_ends.isna(), np.iinfo(np.int64).max,
+                    (period_ends.asi8 - period_first) // 10**9)
+
+    period_names = np.concatenate([periods_df.iloc[:, 0].to_numpy(dtype=object) for _, periods_df in systems])
+    return {'times': times, 'values': values, 'system_periods': system_periods,
+            'period_names': period_names, 'starts': starts, 'ends': ends}
+
+def period_statistic_arrays(systems, statistics=STATISTICS, prepared=None):
+    """
+    Calculate statistics of every period of many systems in one array computation.
+
+    Each statistic equals the one of results_df.loc[start:end]: the period includes both of its
+    ends and NaNs are skipped. All systems are stacked into one array and their times are turned
+    into keys that sort by system first, then by time (at one-second resolution). A single
+    searchsorted then finds the rows of every period.
+
+    The mean, std (ddof=1), count and time integral come from differences of cumulative sums.
+    The cumulative sums restart at each system, so the result of a system does not depend on
+    the batch it is computed in, and the values are centred on the mean of their system before
+    summing their squares. The integral is the trapezoidal integral over the time steps of the
+    period, in units of the term times seconds, skipping steps next to a NaN. The min, max and
+    median are taken over the rows of the periods gathered into NaN-padded blocks.
+
+    Parameters:
+    - systems: A list of (results_df, periods_df) tuples. results_df is indexed by time and
+      periods_df holds the period name, start and end in its first three columns.
+    - statistics: Names of the statistics to compute, among STATISTICS.
+    - prepared: The systems already converted by prepare_systems, if available.
+
+    Returns:
+    - A tuple (statistics, system_periods): a dictionary mapping each statistic to an array with
+      one row per period of all systems and one column per energy term, and the number of periods
+      of each system.
+    """
+    if not systems:
+        return {name: np.empty((0, 0)) for name in statistics}, []
+
+    prepared = prepare_systems(systems) if prepared is None else prepared
+    times, values, starts, ends = prepared['times'], prepared['values'], prepared['starts'], prepared['ends']
+    system_rows = [len(t) for t in times]
+    system_periods = prepared['system_periods']
+
+    # Give each system its own band of keys, wide enough for the longest system
+    span = max((t[-1] for t in times if len(t)), default=0) + 2
+    band = np.arange(len(systems), dtype=np.int64) * span
+    row_keys = np.repeat(band, system_rows) + np.concatenate(times) + 1
+    period_band = np.repeat(band, system_periods)
+    start_keys = period_band + np.clip(starts, -1, span - 1) + 1
+    end_keys = period_band + np.clip(ends, -1, span - 2) + 1
+
+    # Rows [lo, hi) of every period
+    lo = np.searchsorted(row_keys, start_keys, side='left')
+    hi = np.searchsorted(row_keys, end_keys, side='right')
+    hi = np.maximum(hi, lo)
+
+    columns = values[0].shape[1]
+    if any(v.shape[1] != columns for v in values):
+        raise ValueError("All systems must have the same number of energy terms")
+
+    # Cumulative sums of each system, preceded by a row of zeros: the rows [lo, hi) of a period of
+    # system i give P[hi + i] - P[lo + i]
+    shifts, sums, squares, counts, integrals = [], [], [], [], []
+    zeros = np.zeros((1, columns))
+    for system_times, system_values in zip(times, values):
+        valid = ~np.isnan(system_values)
+        with warnings.catch_warnings():
+            # All-NaN terms are not shifted
+            warnings.simplefilter('ignore', RuntimeWarning)
+            shift = np.nan_to_num(np.nanmean(system_values, axis=0)) if len(system_values) else np.zeros(columns)
+        centred = np.where(valid, system_values - shift, 0.0)
+        # Trapezoid of each time step with the next one, zero for the last step
+        steps = np.zeros_like(centred)
+        steps[:-1] = np.where(valid[:-1] & valid[1:], (system_values[:-1] + system_values[1:]) / 2, 0.0) \
+            * np.diff(system_times)[:, None]
+        shifts.append(shift)
+        sums += [zeros, np.cumsum(centred, axis=0)]
+        squares += [zeros, np.cumsum(centred ** 2, axis=0)]
+        counts += [zeros, np.cumsum(valid, axis=0)]
+        integrals += [zeros, np.cumsum(steps, axis=0)]
+    shifts = np.stack(shifts)
+    sums, squares, counts, integrals = (np.concatenate(arrays) for arrays in (sums, squares, counts, integrals))
+    period_system = np.repeat(np.arange(len(systems)), system_periods)
+    first, last = lo + period_system, hi + period_system
+
+    period_counts = counts[last] - counts[first]
+    empty = period_counts == 0
+    results = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        centred_sums = sums[last] - sums[first]
+        if 'mean' in statistics:
+            results['mean'] = centred_sums / period_counts + shifts[period_system]
+        if 'std' in statistics:
+            variance = (squares[last] - squares[first] - centred_sums ** 2 / period_counts) / (period_counts - 1)
+            results['std'] = np.sqrt(np.clip(variance, 0.0, None))
+            results['std'][period_counts < 2] = np.nan
+        if 'count' in statistics:
+            results['count'] = period_counts.astype(np.float64)
+        if 'integral' in statistics:
+            # Steps lo .. hi - 2 lie within the period
+            results['integral'] = integrals[np.maximum(last - 1, first)] - integrals[first]
+    for name in ('mean', 'integral'):
+        if name in results:
+            results[name][empty] = np.nan
+
+    # Order statistics over the rows of the periods, gathered into NaN-padded blocks
+    order_statistics = [name for name in ('min', 'max', 'median') if name in statistics]
+    if order_statistics:
+        for name in order_statistics:
+            results[name] = np.full((len(lo), columns), np.nan)
+        stacked = np.concatenate(values)
+        width = int((hi - lo).max(initial=0))
+        if width and len(stacked):
+            block = max(1, ORDER_STATISTICS_BLOCK // (width * max(columns, 1)))
+            functions = {'min': np.nanmin, 'max': np.nanmax, 'median': np.nanmedian}
+            for start in range(0, len(lo), block):
+                rows = lo[start:start + block, None] + np.arange(width)
+                inside = rows < hi[start:start + block, None]
+                window = stacked[np.where(inside, rows, 0)]
+                window[~inside] = np.nan
+                with warnings.catch_warnings():
+                    # All-NaN periods give NaN
+                    warnings.simplefilter('ignore', RuntimeWarning)
+                    for name in order_statistics:
+                        results[name][start:start + block] = functions[name](window, axis=1)
+
+    return {name: results[name] for name in statistics}, system_periods
+
+def batch_period_statistics(systems, statistics=STATISTICS):
+    """
+    Calculate statistics of every period of many systems in one array computation, see
+    period_statistic_arrays.
+
+    Parameters:
+    - systems: A list of (results_df, periods_df) tuples.
+    - statistics: Names of the statistics to compute, among STATISTICS.
+
+    Returns:
+    - A list with one dictionary per system, mapping each statistic to a DataFrame indexed by
+      period name with one column per energy term.
+    """
+    results, system_periods = period_statistic_arrays(systems, statistics)
+    splits = np.cumsum(system_periods)[:-1]
+    system_statistics = [{} for _ in systems]
+    for name in statistics:
+        for (results_df, periods_df), statistic, block in zip(systems, system_statistics, np.split(results[name], splits)):
+            statistic[name] = pd.DataFrame(block, index=pd.Index(periods_df.iloc[:, 0]).rename(None),
+                                           columns=results_df.columns)
+    return system_statistics
+
+def batch_period_means(systems):
+    """
+    Calculate the average values of every period of many systems in one array computation,
+    see batch_period_statistics.
+
+    Parameters:
+    - systems: A list of (results_df, periods_df) tuples.
+
+    Returns:
+    - A list with one DataFrame of average values per system, indexed by period name.
+    """
+    return [statistics['mean'] for statistics in batch_period_statistics(systems, ('mean',))]
+
+def period_means(results_df, periods_df):
+    """
+    Calculate the average values of a single system for each of its periods.
+
+    Parameters:
+    - results_df: DataFrame with the energy terms of the system, indexed by time.
+    - periods_df: DataFrame with the period name, start and end in its first three columns.
+
+    Returns:
+    - A DataFrame with the average values for each period.
+    """
+    return batch_period_means([(results_df, periods_df)])[0]
+
+def process_system_dir(system_dir, base_path):
+    """
+    Process a single system directory to calculate average values for specified periods.
+
+    Parameters:
+    - system_dir: The directory name of the current system being processed.
+    - base_path: The base directory path containing all system directories.
+
+    Returns:
+    - A tuple containing the system directory name and a DataFrame with average values for each period,
+      or None if the required files are not found or an error occurs.
+    """
+    system_data = read_system_dir(system_dir, base_path)
+    if system_data is None:
         # Return None if any of the files are not found
         return system_dir, None
 
-    # Initialize a DataFrame to hold the average values for each period
-    averages_df = pd.DataFrame(columns=results_df.columns)
-    for _, row in periods_df.iterrows():
-        # For each period, calculate the average of each column in the results DataFrame
-        period_name = row[0]
-        start_time = pd.to_datetime(row[1])
-        end_time = pd.to_datetime(row[2])
-        period_data = results_df.loc[start_time:end_time].mean()
-        averages_df.loc[period_name] = period_data
+    return system_dir, period_means(*system_data)
+
+def align_energy_terms(systems):
+    """
+    Put the energy terms of several systems in the same order, since the period computations stack the
+    results of all systems by column position. The reference is the set of energy terms shared by most
+    systems, in the order of the first system with it.
 
-    return system_dir, averages_df
+    Parameters:
+    - systems: A dictionary mapping system directory names to their (results_df, periods_df) tuple.
+      The systems with other energy terms than the reference are removed from it.
 
-def main(base_path):
+    Returns:
+    - A list of (system_dir, message) for the systems removed.
     """
-    Main function to process all system directories in parallel and save the average values
-    for specified periods to CSV files.
+    term_sets = Counter(frozenset(results_df.columns) for results_df, _ in systems.values()
+                        if results_df.columns.is_unique)
+    if not term_sets:
+        return []
+    reference = term_sets.most_common(1)[0][0]
+    energy_terms = next(results_df.columns for results_df, _ in systems.values()
+                        if results_df.columns.is_unique and frozenset(results_df.columns) == reference)
+    errors = []
+    for system_dir, (results_df, periods_df) in list(systems.items()):
+        if results_df.columns.equals(energy_terms):
+            continue
+        if results_df.columns.is_unique and frozenset(results_df.columns) == reference:
+            systems[system_dir] = (results_df[energy_terms], periods_df)
+        else:
+            errors.append((system_dir, f"Energy terms {list(results_df.columns)} differ from "
+                                       f"{list(energy_terms)} of the other systems"))
+            del systems[system_dir]
+    return errors
+
+def reorder_energy_terms(stacked, energy_terms):
+    """
+    Put the energy terms of a batch packed by process_system_batch in the given order.
 
     Parameters:
+    - stacked: The packed batch, see stack_statistics.
+    - energy_terms: The energy terms of the export, in order.
+
+    Returns:
+    - The packed batch with its 'values' and 'life_cycles' reordered, or None if its energy terms
+      are not the same.
+    """
+    if stacked['energy_terms'] == list(energy_terms):
+        return stacked
+    if sorted(stacked['energy_terms']) != sorted(energy_terms):
+        return None
+    order = [stacked['energy_terms'].index(term) for term in energy_terms]
+    return dict(stacked, energy_terms=list(energy_terms), values=stacked['values'][..., order],
+                life_cycles=stacked['life_cycles'][..., order])
+
+def system_arrays(systems, statistics=STATISTICS, points_per_phase=POINTS_PER_PHASE):
+    """
+    Compute the period statistics of several systems and resample their results onto the life
+    cycle axis, converting the systems with prepare_systems only once for both.
+
+    Parameters:
+    - systems: A list of (results_df, periods_df) tuples, see period_statistic_arrays.
+    - statistics: Names of the statistics to compute, among STATISTICS.
+    - points_per_phase: Number of points of each phase of the life cycle axis.
+
+    Returns:
+    - A tuple (statistics, system_periods, life_cycles): the first two as returned by
+      period_statistic_arrays, and the array returned by resample_life_cycles.
+    """
+    if not systems:
+        return (*period_statistic_arrays(systems, statistics),
+                np.empty((0, len(PHASES) * points_per_phase, 0), dtype=np.float32))
+    prepared = prepare_systems(systems)
+    return (*period_statistic_arrays(systems, statistics, prepared),
+            resample_life_cycles(prepared, PHASES, points_per_phase))
+
+def process_system_batch(system_dirs, base_path, csv_dir=None, statistics=STATISTICS, points_per_phase=POINTS_PER_PHASE):
+    """
+    Process a batch of system directories in a single worker task: the statistics of their periods
+    are computed in one array computation (see period_statistic_arrays), their results are resampled
+    onto the life cycle axis (see life_cycle_store.py), and both are sent back as compact arrays.
+
+    Parameters:
+    - system_dirs: The directory names of the systems of the batch.
     - base_path: The base directory path containing all system directories.
+    - csv_dir: If given, the worker also saves the averages of each system to a CSV file in this directory.
+    - statistics: Names of the statistics to compute, among STATISTICS.
+    - points_per_phase: Number of points of each phase of the life cycle axis.
+
+    Returns:
+    - A tuple (stacked, errors): the statistics packed by stack_statistics, with the resampled
+      results under 'life_cycles', and a list of (system_dir, message) for the systems that could
+      not be processed. Systems without results or periods files are in neither.
     """
-    # List all directories that match the expected pattern
-    system_dirs = [d for d in os.listdir(base_path) if d.endswith('_ERA5_track')]
-    system_averages = {}
-
-    # Use a ProcessPoolExecutor to process directories in parallel
-    with ProcessPoolExecutor() as executor:
-        # Map each system directory to a future task
-        future_to_system_dir = {executor.submit(process_system_dir, system_dir, base_path): system_dir for system_dir in system_dirs}
-        # Monitor the progress of tasks with a progress bar
-        for future in tqdm(as_completed(future_to_system_dir), total=len(system_dirs)):
-            system_dir = future_to_system_dir[future]
+    systems, errors = {}, []
+    for system_dir in system_dirs:
+        try:
+            system_data = read_system_dir(system_dir, base_path)
+        except Exception as e:
+            errors.append((system_dir, str(e)))
+            continue
+        if system_data is not None:
+            systems[system_dir] = system_data
+    errors.extend(align_energy_terms(systems))
+
+    try:
+        results, system_periods, life_cycles = system_arrays(list(systems.values()), statistics, points_per_phase)
+    except Exception:
+        # Process the systems one by one so a single bad system does not fail the whole batch
+        system_results = {}
+        for system_dir, system_data in list(systems.items()):
             try:
-                # Attempt to retrieve the result of each task
-                _, averages_df = future.result()
-                if averages_df is not None:
-                    system_averages[system_dir] = averages_df
+                system_results[system_dir] = system_arrays([system_data], statistics, points_per_phase)
             except Exception as e:
-                print(f"Error processing {system_dir}: {e}")
+                errors.append((system_dir, str(e)))
+                del systems[system_dir]
+        results = {name: np.concatenate([result[name] for result, _, _ in system_results.values()])
+                   if system_results else np.empty((0, 0)) for name in statistics}
+        system_periods = [periods[0] for _, periods, _ in system_results.values()]
+        life_cycles = (np.concatenate([resampled for _, _, resampled in system_results.values()]) if system_results
+                       else np.empty((0, len(PHASES) * points_per_phase, 0), dtype=np.float32))
+
+    if csv_dir and 'mean' in statistics:
+        means = np.split(results['mean'], np.cumsum(system_periods)[:-1]) if systems else []
+        export_period_csvs({system_dir: pd.DataFrame(block, index=pd.Index(periods_df.iloc[:, 0]).rename(None),
+                                                     columns=results_df.columns)
+                            for (system_dir, (results_df, periods_df)), block in zip(systems.items(), means)}, csv_dir)
+    stacked = stack_statistics(list(systems), list(systems.values()), results, system_periods)
+    stacked['life_cycles'] = life_cycles
+    return stacked, errors
+
+def load_track_metadata(summary_file=TRACK_SUMMARY_FILE):
+    """
+    Load the region and track metadata of every system from the track summary built by
+    src_compute_energetics/select_tracks.py.
 
-    # Save the computed averages to CSV files
-    output_base_path = os.path.join("../", 'database_energy_by_periods')
+    Parameters:
+    - summary_file: Path to the track summary Parquet file.
+
+    Returns:
+    - A DataFrame indexed by system ID with the TRACK_METADATA_SCHEMA columns, or None if the
+      summary does not exist.
+    """
+    if not os.path.exists(summary_file):
+        return None
+    return pd.read_parquet(summary_file, columns=TRACK_METADATA_SCHEMA.names)
+
+def stack_averages(system_averages):
+    """
+    Pack the average values of several systems into compact arrays, sorted by system ID.
+
+    Parameters:
+    - system_averages: A dictionary mapping system directory names to their DataFrame of average values.
+
+    Returns:
+    - A dictionary with 'system_ids' and 'phase_counts' (one entry per system), 'phases' (one entry
+      per period), 'statistics' (['mean']), 'energy_terms', and 'values', an array of shape
+      periods x statistics x energy terms.
+    """
+    system_dirs = sorted(system_averages, key=lambda system_dir: int(system_dir.split('_')[0]))
+    frames = [system_averages[system_dir] for system_dir in system_dirs]
+    energy_terms = list(frames[0].columns) if frames else []
+    values = np.concatenate([(frame if frame.columns.equals(frames[0].columns) else frame[energy_terms])
+                             .to_numpy(dtype=np.float64) for frame in frames]) if frames else np.empty((0, 0))
+    return {
+        'system_ids': np.array([int(system_dir.split('_')[0]) for system_dir in system_dirs], dtype=np.int64),
+        'phase_counts': np.array([len(frame) for frame in frames], dtype=np.int64),
+        'phases': np.concatenate([frame.index.to_numpy(dtype=object) for frame in frames]) if frames else np.array([], dtype=object),
+        'statistics': ['mean'],
+        'energy_terms': energy_terms,
+        'values': values[:, None, :],
+    }
+
+def stack_statistics(system_dirs, systems, statistics, system_periods):
+    """
+    Pack the period statistics of several systems, as returned by period_statistic_arrays, into
+    the compact arrays of stack_averages, in the order of the systems.
+
+    Parameters:
+    - system_dirs: The directory names of the systems.
+    - systems: The (results_df, periods_df) tuple of each system.
+    - statistics: A dictionary mapping each statistic to an array with one row per period.
+    - system_periods: The number of periods of each system.
+
+    Returns:
+    - A dictionary of arrays, see stack_averages.
+    """
+    names = list(statistics)
+    energy_terms = list(systems[0][0].columns) if systems else []
+    return {
+        'system_ids': np.array([int(system_dir.split('_')[0]) for system_dir in system_dirs], dtype=np.int64),
+        'phase_counts': np.array(system_periods, dtype=np.int64),
+        'phases': np.concatenate([periods_df.iloc[:, 0].to_numpy(dtype=object) for _, periods_df in systems])
+                  if systems else np.array([], dtype=object),
+        'statistics': names,
+        'energy_terms': energy_terms,
+        'values': np.stack([statistics[name] for name in names], axis=1) if systems else np.empty((0, len(names), 0)),
+    }
+
+def energetics_table(stacked, track_metadata=None):
+    """
+    Build the consolidated energetics table: one typed row per system, period and statistic, keyed
+    by system_id, phase, phase_order (the position of the period in the life cycle) and statistic,
+    with the region and track metadata of the system and one column per energy term.
+
+    Parameters:
+    - stacked: The statistics of the systems packed by stack_averages or stack_statistics.
+    - track_metadata: A DataFrame indexed by system ID with the track metadata, see load_track_metadata.
+
+    Returns:
+    - A pyarrow Table with the rows of each period together, in the order of the statistics. The
+      names of the energy terms are stored in the 'energy_terms' entry of the schema metadata.
+    """
+    energy_terms = stacked['energy_terms']
+    phase_counts = stacked['phase_counts']
+    statistics = stacked['statistics']
+    period_ids = np.repeat(stacked['system_ids'], phase_counts)
+    phase_order = np.arange(len(period_ids)) - np.repeat(np.cumsum(phase_counts) - phase_counts, phase_counts)
+    system_ids = np.repeat(period_ids, len(statistics))
+    keys = pd.DataFrame({
+        'system_id': system_ids,
+        'phase': np.repeat(stacked['phases'], len(statistics)),
+        'phase_order': np.repeat(phase_order, len(statistics)),
+        'statistic': np.tile(np.array(statistics, dtype=object), len(period_ids)),
+    })
+    if track_metadata is not None:
+        metadata = track_metadata.reindex(system_ids).reset_index(drop=True)
+    else:
+        metadata = pd.DataFrame(index=keys.index, columns=TRACK_METADATA_SCHEMA.names)
+    terms = pd.DataFrame(stacked['values'].reshape(len(keys), len(energy_terms)), columns=energy_terms)
+
+    schema = pa.schema(list(KEY_SCHEMA) + list(TRACK_METADATA_SCHEMA) + [(term, pa.float64()) for term in energy_terms],
+                       metadata={'energy_terms': json.dumps(energy_terms)})
+    return pa.Table.from_pandas(pd.concat([keys, metadata, terms], axis=1), schema=schema, preserve_index=False)
+
+def build_energetics_table(system_averages, track_metadata=None):
+    """
+    Build the consolidated energetics table from the DataFrames of average values of the systems.
+
+    Parameters:
+    - system_averages: A dictionary mapping system directory names to their DataFrame of average values.
+    - track_metadata: A DataFrame indexed by system ID with the track metadata, see load_track_metadata.
+
+    Returns:
+    - A pyarrow Table, see energetics_table.
+    """
+    return energetics_table(stack_averages(system_averages), track_metadata)
+
+def write_energetics_database(table, database_path=ENERGETICS_DATABASE):
+    """
+    Write the consolidated energetics table to a Parquet file.
+
+    Parameters:
+    - table: The pyarrow Table built by build_energetics_table.
+    - database_path: Path to the Parquet file.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
+    # Write to a temporary file first so an interrupted export never leaves a truncated database
+    tmp_path = database_path + '.tmp'
+    pq.write_table(table, tmp_path, compression='zstd')
+    os.replace(tmp_path, database_path)
+
+def read_energetics_database(database_path=ENERGETICS_DATABASE, statistics=None):
+    """
+    Read the consolidated energetics table.
+
+    Parameters:
+    - database_path: Path to the Parquet file.
+    - statistics: If given, only the rows of these statistics (e.g. ['mean']) are read.
+
+    Returns:
+    - A tuple (DataFrame sorted by system_id and phase_order, list of energy term names).
+    """
+    filters = [('statistic', 'in', list(statistics))] if statistics else None
+    table = pq.read_table(database_path, filters=filters)
+    energy_terms = json.loads(table.schema.metadata[b'energy_terms'])
+    return table.to_pandas(), energy_terms
+
+def export_period_csvs(system_averages, output_base_path=PERIODS_CSV_DIR):
+    """
+    Save the average values of every system to its own CSV file, '<system_id>_averages.csv'.
+
+    Parameters:
+    - system_averages: A dictionary mapping system directory names to their DataFrame of average values.
+    - output_base_path: Directory where the CSV files are saved.
+    """
     os.makedirs(output_base_path, exist_ok=True)
     for system_dir, averages_df in system_averages.items():
         system_id = system_dir.split('_')[0]
         output_file_path = os.path.join(output_base_path, f"{system_id}_averages.csv")
         averages_df.to_csv(output_file_path)
 
+def read_period_csvs(csv_dir=PERIODS_CSV_DIR):
+    """
+    Read the average values saved as one CSV file per system, to convert them into the
+    consolidated database without recomputing them.
+
+    Parameters:
+    - csv_dir: Directory containing the '<system_id>_averages.csv' files.
+
+    Returns:
+    - A dictionary mapping the file names to their DataFrame of average values.
+    """
+    return {filename: pd.read_csv(os.path.join(csv_dir, filename), index_col=0)
+            for filename in tqdm(sorted(os.listdir(csv_dir)), desc="Reading CSV files")
+            if filename.endswith('_averages.csv')}
+
+def file_hash(path):
+    """
+    Return the SHA-256 hex digest of a file's content.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def scan_sources(system_dirs, base_path):
+    """
+    Record the modification time and size of the results and periods files of every system.
+
+    Parameters:
+    - system_dirs: The directory names of the systems.
+    - base_path: The base directory path containing all system directories.
+
+    Returns:
+    - A DataFrame indexed by system directory with the path, mtime (ns) and size of each source
+      file ('results_path', 'results_mtime', 'results_size', ...). A missing file has no path
+      and an mtime and size of -1.
+    """
+    rows = []
+    for system_dir in system_dirs:
+        row = {'system_dir': system_dir}
+        for name, path in zip(SOURCE_FILES, source_files(system_dir, base_path)):
+            try:
+                stat = os.stat(path) if path else None
+            except FileNotFoundError:
+                stat = None
+            row[f'{name}_path'] = path if stat else None
+            row[f'{name}_mtime'] = stat.st_mtime_ns if stat else -1
+            row[f'{name}_size'] = stat.st_size if stat else -1
+        rows.append(row)
+    columns = ['system_dir'] + [f'{name}_{field}' for name in SOURCE_FILES for field in ('path', 'mtime', 'size')]
+    return pd.DataFrame(rows, columns=columns).set_index('system_dir')
+
+def read_manifest(manifest_path=ENERGETICS_MANIFEST):
+    """
+    Read the manifest of the source files the energetics database was built from.
+
+    Returns:
+    - A DataFrame indexed by system directory with the mtime, size and hash of each source file,
+      empty if the manifest does not exist.
+    """
+    if not os.path.exists(manifest_path):
+        return pd.DataFrame(columns=[f'{name}_{field}' for name in SOURCE_FILES for field in ('mtime', 'size', 'hash')],
+                            index=pd.Index([], name='system_dir'))
+    return pd.read_parquet(manifest_path)
+
+def write_manifest(manifest, manifest_path=ENERGETICS_MANIFEST):
+    """
+    Save the manifest of the source files the energetics database was built from.
+    """
+    tmp_path = manifest_path + '.tmp'
+    manifest.to_parquet(tmp_path)
+    os.replace(tmp_path, manifest_path)
+
+def compare_with_manifest(sources, manifest):
+    """
+    Find the systems whose source files are new or changed since the manifest was written, and the
+    systems whose directories have disappeared.
+
+    A system whose files kept their mtime and size is unchanged. Otherwise, its files are hashed and
+    it is changed only if a hash differs, so touched but identical files are not reprocessed.
+
+    Parameters:
+    - sources: The current state of the source files, see scan_sources.
+    - manifest: The manifest of the last export, see read_manifest.
+
+    Returns:
+    - A tuple (changed system directories, vanished system directories, updated manifest). The updated
+      manifest describes the current source files.
+    """
+    stat_columns = [f'{name}_{field}' for name in SOURCE_FILES for field in ('mtime', 'size')]
+    hash_columns = [f'{name}_hash' for name in SOURCE_FILES]
+    known = sources.index.intersection(manifest.index)
+    same_stat = pd.Series(False, index=sources.index)
+    same_stat[known] = (sources.loc[known, stat_columns].to_numpy()
+                        == manifest.loc[known, stat_columns].to_numpy()).all(axis=1)
+
+    updated = sources[stat_columns].copy()
+    for name, column in zip(SOURCE_FILES, hash_columns):
+        updated[column] = None
+        updated.loc[known, column] = manifest.loc[known, column]
+        to_hash = sources.index[~same_stat & sources[f'{name}_path'].notna()]
+        updated.loc[to_hash, column] = [file_hash(path) for path in sources.loc[to_hash, f'{name}_path']]
+        updated.loc[sources.index[sources[f'{name}_path'].isna()], column] = None
+
+    unchanged = same_stat.copy()
+    restat = known[~same_stat[known].to_numpy()]
+    unchanged[restat] = (updated.loc[restat, hash_columns].to_numpy()
+                         == manifest.loc[restat, hash_columns].to_numpy()).all(axis=1)
+    changed = list(sources.index[~unchanged])
+    vanished = list(manifest.index.difference(sources.index))
+    return changed, vanished, updated
+
+def upsert_energetics_table(table, new_table, replaced_ids):
+    """
+    Replace the rows of some systems in the consolidated energetics table.
+
+    Parameters:
+    - table: The current table.
+    - new_table: The rows of the new or changed systems, see build_energetics_table.
+    - replaced_ids: IDs of the systems whose current rows are removed (changed and vanished systems).
+
+    Returns:
+    - The updated table, sorted by system_id and phase_order.
+    """
+    kept = table.filter(pc.invert(pc.is_in(table['system_id'], pa.array(replaced_ids, pa.int64()))))
+    if new_table.num_rows:
+        kept = pa.concat_tables([kept, new_table.select(kept.column_names).cast(kept.schema)]) if kept.num_rows else new_table
+    return kept.sort_by([('system_id', 'ascending'), ('phase_order', 'ascending')])
+
+def append_rows(writer, tables, path):
+    """
+    Append tables of energetics rows to a Parquet file as one row group.
+
+    Parameters:
+    - writer: The ParquetWriter of the file, or None to create it with the schema of the tables.
+    - tables: The pyarrow Tables to append, all with the same schema.
+    - path: Path to the Parquet file.
+
+    Returns:
+    - The ParquetWriter.
+    """
+    table = pa.concat_tables(tables)
+    if writer is None:
+        writer = pq.ParquetWriter(path, table.schema, compression='zstd')
+    writer.write_table(table)
+    return writer
+
+def main(base_path, database_path=ENERGETICS_DATABASE, summary_file=TRACK_SUMMARY_FILE, csv_dir=None,
+         incremental=False, manifest_path=ENERGETICS_MANIFEST, chunk_size=CHUNK_SIZE, points_per_phase=POINTS_PER_PHASE,
+         life_cycle_array=LIFE_CYCLE_ARRAY, life_cycle_index=LIFE_CYCLE_INDEX):
+    """
+    Main function to process all system directories in parallel and save the average values
+    for specified periods to the consolidated energetics database, and the results resampled
+    onto the life cycle axis to the life cycle store (see life_cycle_store.py).
+
+    Parameters:
+    - base_path: The base directory path containing all system directories.
+    - database_path: Path to the consolidated energetics Parquet file.
+    - summary_file: Path to the track summary providing the region and track metadata.
+    - csv_dir: If given, the averages are also saved as one CSV file per system in this directory.
+    - incremental: If True, only the systems whose source files are new or changed since the last
+      export (see compare_with_manifest) are processed and upserted into the existing database, and
+      the systems whose directories have disappeared are removed from it.
+    - manifest_path: Path to the manifest of the source files, written by every export.
+    - chunk_size: Number of systems processed by each worker task.
+    - points_per_phase: Number of points of each phase of the life cycle axis.
+    - life_cycle_array, life_cycle_index: Paths to the array and index of the life cycle store.
+    """
+    # List all directories that match the expected pattern
+    with os.scandir(base_path) as entries:
+        system_dirs = sorted(entry.name for entry in entries if entry.name.endswith('_ERA5_track') and entry.is_dir())
+    # Databases written before the statistics were added, or without a life cycle store of the same
+    # axis, are rebuilt
+    previous_axes = store_axes(life_cycle_index)
+    incremental = (incremental and os.path.exists(database_path)
+                   and 'statistic' in pq.read_schema(database_path).names
+                   and os.path.exists(life_cycle_array) and previous_axes is not None
+                   and previous_axes['phases'] == list(PHASES) and previous_axes['points_per_phase'] == points_per_phase)
+    previous_manifest = read_manifest(manifest_path)
+    if not incremental:
+        previous_manifest = previous_manifest.iloc[:0]
+    changed, vanished, manifest = compare_with_manifest(scan_sources(system_dirs, base_path), previous_manifest)
+    if incremental:
+        print(f"{len(changed)} new or changed systems, {len(vanished)} removed, "
+              f"{len(system_dirs) - len(changed)} unchanged")
+    track_metadata = load_track_metadata(summary_file)
+    if csv_dir:
+        os.makedirs(csv_dir, exist_ok=True)
+
+    # Each worker task processes a batch of systems and returns their averages as compact arrays,
+    # which are appended to a temporary Parquet file as they arrive, WRITE_ROWS rows at a time. Their
+    # resampled results are filled into a temporary memory-mapped array in the same order
+    tmp_path = database_path + '.part'
+    writer, pending, system_count = None, [], 0
+    life_cycles_path, life_cycles, life_cycle_ids = life_cycle_array + '.part.npy', None, []
+    # Every batch is given the energy terms of the first one, or of the existing database
+    energy_terms = (previous_axes['energy_terms'] or None) if incremental else None
+
+    batches = [changed[i:i + chunk_size] for i in range(0, len(changed), chunk_size)]
+    with ProcessPoolExecutor() as executor, tqdm(total=len(changed)) as progress:
+        future_to_batch = {executor.submit(process_system_batch, batch, base_path, csv_dir, STATISTICS, points_per_phase): batch
+                           for batch in batches}
+        for future in as_completed(future_to_batch):
+            batch = future_to_batch.pop(future)
+            progress.update(len(batch))
+            try:
+                stacked, errors = future.result()
+            except Exception as e:
+                stacked, errors = None, [(system_dir, str(e)) for system_dir in batch]
+            if stacked is not None and len(stacked['system_ids']):
+                energy_terms = stacked['energy_terms'] if energy_terms is None else energy_terms
+                aligned = reorder_energy_terms(stacked, energy_terms)
+                if aligned is None:
+                    system_ids = set(stacked['system_ids'])
+                    errors += [(system_dir, f"Energy terms {stacked['energy_terms']} differ from {energy_terms} "
+                                            f"of the other systems") for system_dir in batch
+                               if int(system_dir.split('_')[0]) in system_ids]
+                stacked = aligned
+            for system_dir, message in errors:
+                print(f"Error processing {system_dir}: {message}")
+                # Leave it out of the manifest so the next incremental export retries it
+                manifest = manifest.drop(index=system_dir)
+            if stacked is None or not len(stacked['system_ids']):
+                continue
+            table = energetics_table(stacked, track_metadata)
+            pending.append(table.select(pending[0].column_names).cast(pending[0].schema) if pending else table)
+            if life_cycles is None:
+                life_cycles = np.lib.format.open_memmap(life_cycles_path, mode='w+', dtype=np.float32,
+                                                        shape=(len(changed), *stacked['life_cycles'].shape[1:]))
+            life_cycles[system_count:system_count + len(stacked['system_ids'])] = stacked['life_cycles']
+            life_cycle_ids.extend(stacked['system_ids'])
+            system_count += len(stacked['system_ids'])
+            if sum(pending_table.num_rows for pending_table in pending) >= WRITE_ROWS:
+                writer, pending = append_rows(writer, pending, tmp_path), []
+    if pending:
+        writer = append_rows(writer, pending, tmp_path)
+    axes = {'phases': list(PHASES), 'points_per_phase': points_per_phase, 'energy_terms': list(energy_terms or [])}
+
+    # Sort the new rows, merge them into the database and save it with the manifest
+    if writer is not None:
+        writer.close()
+        table = pq.read_table(tmp_path).sort_by([('system_id', 'ascending'), ('phase_order', 'ascending')])
+        os.remove(tmp_path)
+    else:
+        table = build_energetics_table({})
+    if incremental:
+        # Systems of the database without a directory are removed too, even if the manifest missed them
+        previous_table = pq.read_table(database_path)
+        current_ids = {int(system_dir.split('_')[0]) for system_dir in system_dirs}
+        replaced_ids = {int(system_dir.split('_')[0]) for system_dir in changed}
+        replaced_ids |= set(previous_table['system_id'].to_pylist()) - current_ids
+        table = upsert_energetics_table(previous_table, table, sorted(replaced_ids))
+    write_energetics_database(table, database_path)
+
+    # Merge the resampled results into the life cycle store
+    parts = []
+    if incremental:
+        previous_array = np.load(life_cycle_array, mmap_mode='r')
+        previous_ids = pq.read_table(life_cycle_index).column('system_id').to_numpy()
+        kept = np.flatnonzero(~np.isin(previous_ids, sorted(replaced_ids)))
+        parts.append((previous_array, previous_ids[kept], kept))
+    if life_cycles is not None:
+        parts.append((life_cycles, life_cycle_ids, np.arange(system_count)))
+    write_life_cycle_store(parts, axes, life_cycle_array, life_cycle_index)
+    if life_cycles is not None:
+        del life_cycles
+        os.remove(life_cycles_path)
+    write_manifest(manifest, manifest_path)
+    print(f"Averages of {system_count} {'new or changed ' if incremental else ''}systems saved to {database_path}, "
+          f"life cycles to {life_cycle_array}")
+    if csv_dir:
+        for system_dir in vanished:
+            csv_path = os.path.join(csv_dir, f"{system_dir.split('_')[0]}_averages.csv")
+            if os.path.exists(csv_path):
+                os.remove(csv_path)
+
 if __name__ == "__main__":
-    base_path = '/home/daniloceano/Documents/Programs_and_scripts/LEC_Results_energetic-patterns'
-    main(base_path)
+    parser = argparse.ArgumentParser(description="Compute the average energetics of every life cycle period.")
+    parser.add_argument('base_path', nargs='?', default=LEC_RESULTS_PATH,
+                        help="Directory containing the '<system_id>_ERA5_track' LEC result directories.")
+    parser.add_argument('--database', default=ENERGETICS_DATABASE, help="Consolidated energetics Parquet file to write.")
+    parser.add_argument('--track-summary', default=TRACK_SUMMARY_FILE, help="Track summary providing the region and track metadata.")
+    parser.add_argument('--csv', nargs='?', const=PERIODS_CSV_DIR, default=None, metavar='DIR',
+                        help=f"Also save one '<system_id>_averages.csv' file per system (default directory: {PERIODS_CSV_DIR}).")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only process the systems whose results or periods changed since the last export, and remove the vanished ones.")
+    parser.add_argument('--manifest', default=ENERGETICS_MANIFEST, help="Manifest of the source files of the last export.")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Number of systems processed by each worker task.")
+    parser.add_argument('--points-per-phase', type=int, default=POINTS_PER_PHASE,
+                        help="Number of points of each phase in the life cycle store.")
+    parser.add_argument('--life-cycle-array', default=LIFE_CYCLE_ARRAY, help="Array of the life cycle store to write.")
+    parser.add_argument('--life-cycle-index', default=LIFE_CYCLE_INDEX, help="Index of the life cycle store to write.")
+    parser.add_argument('--from-csv', nargs='?', const=PERIODS_CSV_DIR, default=None, metavar='DIR',
+                        help=f"Build the database from existing '<system_id>_averages.csv' files instead of the LEC results (default directory: {PERIODS_CSV_DIR}).")
+    args = parser.parse_args()
+
+    if args.from_csv:
+        system_averages = read_period_csvs(args.from_csv)
+        write_energetics_database(build_energetics_table(system_averages, load_track_metadata(args.track_summary)), args.database)
+        print(f"Averages of {len(system_averages)} systems saved to {args.database}")
+    else:
+        main(args.base_path, args.database, args.track_summary, args.csv, args.incremental, args.manifest,
+             args.chunk_size, args.points_per_phase, args.life_cycle_array, args.life_cycle_index)
@@ -29,6 +29,8 @@ Usage:
 
 The script defines the following functions:
 - read_life_cycles: Reads CSV files from the specified directory and counts the life cycle configurations.
+- load_life_cycles: Does the same from the consolidated energetics database written by export_results.py,
+  which is used instead of the CSV files when it exists.
 - convert_counter_to_df: Converts the counts of life cycle configurations into a DataFrame and filters out less common configurations.
 - plot_barplot: Generates and saves a bar plot for the life cycle configurations.
 
@@ -80,6 +82,22 @@ def read_life_cycles(base_path):
     
     return life_cycles
 
+def load_life_cycles(database_path):
+    """
+    Reads the life cycle of every system from the consolidated energetics database (see export_results.py)
+    in one call, from the rows of the period means, and counts the occurrences of each unique life cycle.
+
+    Parameters:
+    - database_path: Path to the consolidated energetics Parquet file.
+
+    Returns:
+    - A Counter object with counts of each unique life cycle configuration.
+    """
+    phases = pd.read_parquet(database_path, columns=['system_id', 'phase', 'phase_order'],
+                             filters=[('statistic', '==', 'mean')])
+    phases = phases.sort_values(['system_id', 'phase_order'], kind='stable')
+    return Counter(phases.groupby('system_id', sort=False)['phase'].agg(tuple))
+
 def convert_counter_to_df(life_cycles):
     """
     Converts life cycle counts to a DataFrame and filters out configurations under 1%.
@@ -140,13 +158,17 @@ def plot_barplot(df, title_suffix, output_directory, filename, total_systems, fi
 
 if __name__ == "__main__":
     base_path = '../database_energy_by_periods'  # Adjust to your directory
+    database_path = '../database_energy_by_periods.parquet'  # Consolidated database, used when it exists
     output_directory = '../figures/life_cycle_analysis/'
     csv_output_directory = '../csv_life_cycle_analysis/'  # Directory to save CSV files
     os.makedirs(output_directory, exist_ok=True)
     os.makedirs(csv_output_directory, exist_ok=True)  # Ensure CSV output directory exists
 
     # Read life cycles, convert to DataFrame, and filter
-    life_cycle_counts = read_life_cycles(base_path)
+    if os.path.exists(database_path):
+        life_cycle_counts = load_life_cycles(database_path)
+    else:
+        life_cycle_counts = read_life_cycles(base_path)
     life_cycles_df, filtered_life_cycles_df, total_systems = convert_counter_to_df(life_cycle_counts)
 
     # Export unfiltered life cycle configurations to CSV
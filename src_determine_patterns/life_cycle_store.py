@@ -0,0 +1,238 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    life_cycle_store.py                                :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2026/10/17 15:41:08 by daniloceano       #+#    #+#              #
+#    Updated: 2026/10/17 15:41:08 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Life Cycle Store of the Energetics of Cyclone Systems
+
+This module keeps the hourly energetics of every system normalized by life cycle fraction, so that composites
+across systems, such as "Ck during the first half of intensification", can be built without reading the LEC
+results of every system again.
+
+The results of each system ('track_results.csv') are resampled onto a fixed number of points per life cycle
+phase: point k of the P points of a phase lies at the fraction k / (P - 1) of the time between the start and
+the end of the phase, and the energy terms are linearly interpolated in time between the time steps. The
+phases follow the fixed order of PHASES, and the points of the phases a system does not go through are NaN.
+
+The resampled energetics of all systems are stored in a single float32 array of shape systems x points x
+energy terms, saved as a .npy file so it can be memory-mapped, with an index giving the system ID of each row.
+Composite means and quantiles across thousands of cyclones are then a single NumPy reduction:
+
+    array, index, axes = load_life_cycle_store()
+    ck = array[:, phase_points(axes, 'intensification', 0, 0.5), axes['energy_terms'].index('Ck')]
+    np.nanmean(ck, axis=0), np.nanquantile(ck, [0.1, 0.5, 0.9], axis=0)
+
+The store is written by export_results.py, together with the energetics database.
+
+Usage:
+- python life_cycle_store.py --term Ck --phase intensification --fractions 0 0.5
+- Prints the number of systems, mean and quantiles of the term at each point of the selected phase
+  (or of the whole life cycle without --phase).
+"""
+
+import os
+import json
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+LIFE_CYCLE_ARRAY = '../database_energy_life_cycle.npy'
+LIFE_CYCLE_INDEX = '../database_energy_life_cycle_index.parquet'
+PHASES = ('incipient', 'intensification', 'mature', 'decay',
+          'incipient 2', 'intensification 2', 'mature 2', 'decay 2', 'residual')
+POINTS_PER_PHASE = 20
+COPY_ROWS = 1024
+
+def point_axis(phases=PHASES, points_per_phase=POINTS_PER_PHASE):
+    """
+    Describe the points of the life cycle axis of the store.
+
+    Parameters:
+    - phases: The phases of the axis, in order.
+    - points_per_phase: The number of points per phase.
+
+    Returns:
+    - A DataFrame with the phase and the fraction of the phase of each point.
+    """
+    return pd.DataFrame({'phase': np.repeat(list(phases), points_per_phase),
+                         'fraction': np.tile(np.linspace(0, 1, points_per_phase), len(phases))})
+
+def phase_points(axes, phase, start=0, end=1):
+    """
+    Select the points of a phase lying between two fractions of it.
+
+    Parameters:
+    - axes: The axes of the store, see load_life_cycle_store.
+    - phase: The name of the phase.
+    - start, end: The first and last fractions of the phase, both included.
+
+    Returns:
+    - An array with the positions of the points along the life cycle axis.
+    """
+    points = point_axis(axes['phases'], axes['points_per_phase'])
+    selected = (points['phase'] == phase) & points['fraction'].between(start - 1e-9, end + 1e-9)
+    return np.flatnonzero(selected.to_numpy())
+
+def interpolate_rows(times, values, query_times):
+    """
+    Linearly interpolate the rows of an array in time, without extrapolating. This is np.interp
+    applied to every column at once.
+
+    Parameters:
+    - times: The sorted times of the rows.
+    - values: An array with one row per time.
+    - query_times: The times to interpolate at.
+
+    Returns:
+    - An array with one row per query time, NaN outside the times of the rows.
+    """
+    if not len(times):
+        return np.full((len(query_times), values.shape[1]), np.nan)
+    inside = (query_times >= times[0]) & (query_times <= times[-1])
+    if len(times) == 1:
+        return np.where(inside[:, None], values[:1], np.nan)
+    rows = np.clip(np.searchsorted(times, query_times, side='right') - 1, 0, len(times) - 2)
+    weights = ((query_times - times[rows]) / (times[rows + 1] - times[rows]))[:, None]
+    interpolated = values[rows] * (1 - weights) + values[rows + 1] * weights
+    # Points falling on a time step take its value, even next to a NaN
+    interpolated = np.where(weights == 0, values[rows], np.where(weights == 1, values[rows + 1], interpolated))
+    interpolated[~inside] = np.nan
+    return interpolated
+
+def resample_life_cycles(prepared, phases=PHASES, points_per_phase=POINTS_PER_PHASE):
+    """
+    Resample the energetics of several systems onto the life cycle axis of the store.
+
+    Parameters:
+    - prepared: The systems converted by export_results.prepare_systems.
+    - phases: The phases of the axis, in order. Periods with other names are left out, and only
+      the first period of each name is used.
+    - points_per_phase: The number of points per phase.
+
+    Returns:
+    - A float32 array of shape systems x (phases x points_per_phase) x energy terms.
+    """
+    values = prepared['values']
+    energy_terms = values[0].shape[1] if values else 0
+    life_cycles = np.full((len(values), len(phases) * points_per_phase, energy_terms), np.nan, dtype=np.float32)
+    phase_slots = {phase: slot for slot, phase in enumerate(phases)}
+    fractions = np.linspace(0, 1, points_per_phase)
+    open_bounds = (np.iinfo(np.int64).min, np.iinfo(np.int64).max)
+
+    period_bounds = np.cumsum([0] + list(prepared['system_periods']))
+    for system, (times, system_values) in enumerate(zip(prepared['times'], values)):
+        periods = slice(period_bounds[system], period_bounds[system + 1])
+        slots, query_times = [], []
+        for name, start, end in zip(prepared['period_names'][periods], prepared['starts'][periods], prepared['ends'][periods]):
+            slot = phase_slots.get(name)
+            # Periods without a start or an end cannot be normalized
+            if slot is None or slot in slots or start in open_bounds or end in open_bounds or end < start:
+                continue
+            slots.append(slot)
+            query_times.append(start + fractions * (end - start))
+        if slots:
+            points = (np.array(slots)[:, None] * points_per_phase + np.arange(points_per_phase)).ravel()
+            life_cycles[system, points] = interpolate_rows(times, system_values, np.concatenate(query_times))
+    return life_cycles
+
+def store_axes(index_path=LIFE_CYCLE_INDEX):
+    """
+    Read the axes of the life cycle store from its index.
+
+    Parameters:
+    - index_path: Path to the index of the store.
+
+    Returns:
+    - A dictionary with the 'phases', 'points_per_phase' and 'energy_terms' of the store, or None if
+      the store does not exist.
+    """
+    if not os.path.exists(index_path):
+        return None
+    return json.loads(pq.read_schema(index_path).metadata[b'axes'])
+
+def write_life_cycle_store(parts, axes, array_path=LIFE_CYCLE_ARRAY, index_path=LIFE_CYCLE_INDEX):
+    """
+    Write the life cycle store from the rows of several arrays, sorted by system ID. The rows are
+    copied in blocks, so memory-mapped parts are never loaded whole. A system found in several
+    parts takes its row from the last one.
+
+    Parameters:
+    - parts: A list of (array, system_ids, rows) tuples: the rows of the array to write and the
+      system ID of each of them.
+    - axes: A dictionary with the 'phases', 'points_per_phase' and 'energy_terms' of the arrays.
+    - array_path: Path to the .npy array of the store.
+    - index_path: Path to the index of the store.
+    """
+    empty = [np.empty(0, dtype=np.int64)]
+    sources = pd.DataFrame({
+        'system_id': np.concatenate(empty + [np.asarray(system_ids, dtype=np.int64) for _, system_ids, _ in parts]),
+        'part': np.concatenate(empty + [np.full(len(rows), part) for part, (_, _, rows) in enumerate(parts)]),
+        'row': np.concatenate(empty + [np.asarray(rows, dtype=np.int64) for _, _, rows in parts]),
+    }).drop_duplicates('system_id', keep='last').sort_values('system_id')
+
+    shape = (len(sources), len(axes['phases']) * axes['points_per_phase'], len(axes['energy_terms']))
+    tmp_path = array_path + '.tmp.npy'
+    array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=shape)
+    for block_start in range(0, len(sources), COPY_ROWS):
+        block = sources.iloc[block_start:block_start + COPY_ROWS]
+        for part, (part_array, _, _) in enumerate(parts):
+            selected = np.flatnonzero((block['part'] == part).to_numpy())
+            if len(selected):
+                array[block_start + selected] = part_array[block['row'].to_numpy()[selected]]
+    array.flush()
+    del array
+    os.replace(tmp_path, array_path)
+
+    index = pa.table({'system_id': pa.array(sources['system_id'].to_numpy(), pa.int64()),
+                      'row': pa.array(np.arange(len(sources)), pa.int64())})
+    pq.write_table(index.replace_schema_metadata({'axes': json.dumps(axes)}), index_path + '.tmp')
+    os.replace(index_path + '.tmp', index_path)
+
+def load_life_cycle_store(array_path=LIFE_CYCLE_ARRAY, index_path=LIFE_CYCLE_INDEX):
+    """
+    Open the life cycle store.
+
+    Parameters:
+    - array_path: Path to the .npy array of the store.
+    - index_path: Path to the index of the store.
+
+    Returns:
+    - A tuple (array, index, axes): the read-only memory-mapped array of shape systems x points x
+      energy terms, a Series giving the row of each system ID, and the axes of the store (see store_axes).
+    """
+    index = pq.read_table(index_path).to_pandas().set_index('system_id')['row']
+    return np.load(array_path, mmap_mode='r'), index, store_axes(index_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Composite of an energy term of all systems along the life cycle.")
+    parser.add_argument('--term', default='Ck', help="Energy term.")
+    parser.add_argument('--phase', default=None, help="Phase to select (default: the whole life cycle).")
+    parser.add_argument('--fractions', nargs=2, type=float, default=(0, 1), metavar=('START', 'END'),
+                        help="First and last fractions of the phase.")
+    parser.add_argument('--array', default=LIFE_CYCLE_ARRAY, help="Array of the life cycle store.")
+    parser.add_argument('--index', default=LIFE_CYCLE_INDEX, help="Index of the life cycle store.")
+    args = parser.parse_args()
+
+    array, index, axes = load_life_cycle_store(args.array, args.index)
+    points = phase_points(axes, args.phase, *args.fractions) if args.phase else np.arange(array.shape[1])
+    values = array[:, points, axes['energy_terms'].index(args.term)]
+    with warnings.catch_warnings():
+        # Points no system goes through are all NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        quantiles = np.nanquantile(values, [0.1, 0.5, 0.9], axis=0)
+        composite = point_axis(axes['phases'], axes['points_per_phase']).iloc[points].assign(
+            systems=np.count_nonzero(~np.isnan(values), axis=0), mean=np.nanmean(values, axis=0),
+            q10=quantiles[0], median=quantiles[1], q90=quantiles[2])
+    print(f"{args.term} of {len(index)} systems along the life cycle")
+    print(composite.to_string(index=False))
@@ -12,7 +12,10 @@
 
 
 import os
+import json
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 import matplotlib.pyplot as plt
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
@@ -36,6 +39,27 @@ def read_life_cycles(base_path):
     
     return systems_energetics
 
+def load_life_cycles(database_path):
+    """
+    Reads the period means of the consolidated energetics database (see export_results.py) in one call
+    and splits them into a DataFrame for each system, shaped like the ones read by read_life_cycles.
+    """
+    table = pq.read_table(database_path, filters=[('statistic', '==', 'mean')])
+    energy_terms = json.loads(table.schema.metadata[b'energy_terms'])
+    energetics = table.to_pandas().sort_values(['system_id', 'phase_order'], kind='stable')
+    energetics = energetics[['system_id', 'phase'] + energy_terms].rename(columns={'phase': 'Unnamed: 0'})
+
+    # Rows are sorted by system, so each system is a contiguous slice
+    system_ids, first_rows = np.unique(energetics.pop('system_id').to_numpy(), return_index=True)
+    last_rows = np.r_[first_rows[1:], len(energetics)]
+    energetics = energetics.reset_index(drop=True)
+
+    systems_energetics = {}
+    for system_id, first_row, last_row in zip(system_ids, first_rows, last_rows):
+        systems_energetics[str(system_id)] = energetics.iloc[first_row:last_row].reset_index(drop=True)
+
+    return systems_energetics
+
 def plot_system(lps, df):
     """
     Plots the Lorenz Phase Space diagram for a single system
@@ -68,6 +92,7 @@ def determine_global_limits(systems_energetics):
 
 if __name__ == "__main__":
     base_path = '../database_energy_by_periods'
+    database_path = '../database_energy_by_periods.parquet'
     output_directory = '../figures/lps/'
     os.makedirs(output_directory, exist_ok=True)
 
@@ -75,7 +100,10 @@ if __name__ == "__main__":
     lps = Visualizer(LPS_type='mixed', zoom=False)
 
     # Read the energetics data for all systems
-    systems_energetics = read_life_cycles(base_path)
+    if os.path.exists(database_path):
+        systems_energetics = load_life_cycles(database_path)
+    else:
+        systems_energetics = read_life_cycles(base_path)
 
     # Plot each system onto the Lorenz Phase Space diagram
     for system_id, df in tqdm(systems_energetics.items(), desc="Plotting systems"):
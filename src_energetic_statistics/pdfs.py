@@ -11,7 +11,9 @@
 # **************************************************************************** #
 
 import os
+import json
 import pandas as pd
+import pyarrow.parquet as pq
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -48,6 +50,27 @@ def read_life_cycles(base_path):
     
     return systems_energetics
 
+def load_life_cycles(database_path):
+    """
+    Reads the period means of the consolidated energetics database (see export_results.py) in one call
+    and splits them into a DataFrame for each system, shaped like the ones read by read_life_cycles.
+    """
+    table = pq.read_table(database_path, filters=[('statistic', '==', 'mean')])
+    energy_terms = json.loads(table.schema.metadata[b'energy_terms'])
+    energetics = table.to_pandas().sort_values(['system_id', 'phase_order'], kind='stable')
+    energetics = energetics[['system_id', 'phase'] + energy_terms].rename(columns={'phase': 'Unnamed: 0'})
+
+    # Rows are sorted by system, so each system is a contiguous slice
+    system_ids, first_rows = np.unique(energetics.pop('system_id').to_numpy(), return_index=True)
+    last_rows = np.r_[first_rows[1:], len(energetics)]
+    energetics = energetics.reset_index(drop=True)
+
+    systems_energetics = {}
+    for system_id, first_row, last_row in zip(system_ids, first_rows, last_rows):
+        systems_energetics[str(system_id)] = energetics.iloc[first_row:last_row].reset_index(drop=True)
+
+    return systems_energetics
+
 def compute_group_caps(systems_energetics, terms_prefix, special_case=None):
     """
     Computes caps for a group of terms based on the 0.2 and 0.8 quantiles across all systems.
@@ -231,10 +254,14 @@ def plot_rigde_overlapping(systems_energetics, group_name, terms_prefix, output_
     
 if __name__ == "__main__":
     base_path = '../database_energy_by_periods'
+    database_path = '../database_energy_by_periods.parquet'
     output_directory = '../figures/statistics_energetics/'
     os.makedirs(output_directory, exist_ok=True)
 
-    systems_energetics = read_life_cycles(base_path)
+    if os.path.exists(database_path):
+        systems_energetics = load_life_cycles(database_path)
+    else:
+        systems_energetics = read_life_cycles(base_path)
 
     # Define term prefixes for each group
     groups = {